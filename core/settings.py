@@ -28,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'triangle.instrumentation.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,6 +66,45 @@ DATABASES = {
     }
 }
 
+# In-process by default. Response caches and their invalidation counters
+# are only consistent across workers when the cache is shared, so
+# multi-worker deployments should set CACHE_BACKEND, e.g.
+# django.core.cache.backends.filebased.FileBasedCache with CACHE_LOCATION set
+# to a directory outside the source tree, or a Redis backend. Tests always
+# run against LocMem (core/test_runner.py) so no state leaks between runs.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'TIMEOUT': 300,
+    }
+}
+TEST_RUNNER = 'core.test_runner.LocMemCacheRunner'
+
+# 'thread': in-process pool, 'worker': manage.py process_upload_jobs, 'eager': inline after commit
+UPLOAD_QUEUE_MODE = os.getenv('UPLOAD_QUEUE_MODE', 'thread')
+
+# Serve the hot public read endpoints from the async views in
+# triangle/async_views.py. Off by default, ASGI included: on SQLite they
+# measured slower than the WSGI views (manage.py loadtest)
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Seconds before admin/stats/ recomputes its snapshot on read; run
+# manage.py refresh_stats from cron to keep reads from ever doing it
+STATS_SNAPSHOT_MAX_AGE = int(os.getenv('STATS_SNAPSHOT_MAX_AGE', '900'))
+
+# Per-request profiling (triangle/instrumentation.py): Server-Timing headers
+# on the sampled share of requests and Prometheus metrics at /metrics, which
+# stays a 404 until METRICS_TOKEN is set and then requires it as a Bearer token
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'False') == 'True'
+INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', '0.1'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Seconds a worker keeps the User/Profile behind a JWT's claims
+# (triangle/authentication.py); saves drop the entry in the saving worker,
+# others see deactivations and is_staff changes once it expires
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', '30'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -87,19 +127,34 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'triangle.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'triangle.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'triangle.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'triangle.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
 
+# FastJSONRenderer/FastJSONParser use orjson when it is installed; 'stdlib' forces the json module
+FAST_JSON_BACKEND = os.getenv('FAST_JSON_BACKEND', 'orjson')
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'TOKEN_OBTAIN_SERIALIZER': 'triangle.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'triangle.authentication.ClaimsTokenRefreshSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'triangle.authentication.RevocationTokenVerifySerializer',
 }
 
 SPECTACULAR_SETTINGS = {
@@ -0,0 +1,23 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class LocMemCacheRunner(DiscoverRunner):
+    """
+    Run the suite against a private LocMem cache whatever CACHE_BACKEND
+    says, so no cached responses or generation counters leak between runs.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'TIMEOUT': 300,
+            }
+        })
+        self._cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -4,12 +4,15 @@ from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from triangle.instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('triangle.urls')),
     path('swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('swagger/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
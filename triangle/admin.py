@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Category, Amenity, Property, PropertyImage, Activity, Banner, Profile
+from .models import (
+    Category, Amenity, Property, PropertyImage, Activity, Banner, Profile, UploadJob, StatsSnapshot,
+    PropertyCounter, RevokedToken
+)
+from .revocation import revocations
 
 
 class ProfileInline(admin.StackedInline):
@@ -11,6 +15,14 @@ class ProfileInline(admin.StackedInline):
 
 class UserAdmin(BaseUserAdmin):
     inlines = [ProfileInline]
+    actions = ['revoke_tokens']
+
+    @admin.action(description="Отозвать все токены")
+    def revoke_tokens(self, request, queryset):
+        user_ids = list(queryset.values_list('pk', flat=True))
+        for user_id in user_ids:
+            revocations.revoke_user(user_id)
+        self.message_user(request, f"Токены отозваны у пользователей: {len(user_ids)}")
 
 
 admin.site.unregister(User)
@@ -32,7 +44,7 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Amenity)
 class AmenityAdmin(admin.ModelAdmin):
-    list_display = ['name', 'icon']
+    list_display = ['name', 'icon', 'bit']
     search_fields = ['name']
 
 
@@ -70,6 +82,13 @@ class PropertyImageAdmin(admin.ModelAdmin):
     search_fields = ['property__title']
 
 
+@admin.register(UploadJob)
+class UploadJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'property', 'status', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['files', 'images', 'error', 'created_at', 'started_at', 'finished_at']
+
+
 @admin.register(Activity)
 class ActivityAdmin(admin.ModelAdmin):
     list_display = ['title', 'created_at']
@@ -81,4 +100,23 @@ class ActivityAdmin(admin.ModelAdmin):
 class BannerAdmin(admin.ModelAdmin):
     list_display = ['title', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
-    search_fields = ['title', 'description']
\ No newline at end of file
+    search_fields = ['title', 'description']
+
+
+@admin.register(StatsSnapshot)
+class StatsSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created_at']
+    readonly_fields = ['data', 'created_at']
+
+
+@admin.register(PropertyCounter)
+class PropertyCounterAdmin(admin.ModelAdmin):
+    list_display = ['property_type', 'is_active', 'is_featured', 'count', 'total_price']
+    readonly_fields = ['property_type', 'is_active', 'is_featured', 'count', 'total_price']
+
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    list_display = ['jti', 'user', 'created_at', 'expires_at']
+    search_fields = ['jti', 'user__username']
+    readonly_fields = ['jti', 'user', 'created_at', 'expires_at']
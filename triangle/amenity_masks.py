@@ -0,0 +1,107 @@
+from django.core.cache import cache
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.lookups import Exact
+
+from .cache import get_generations
+
+MASK_BITS = 64
+
+AMENITY_MATCH_MODES = ('all', 'any')
+
+AMENITY_BITS_CACHE_TIMEOUT = 3600
+
+
+def to_signed(mask):
+    """Fit an unsigned 64-bit mask into the signed BigIntegerField range."""
+    return mask - (1 << MASK_BITS) if mask >= 1 << (MASK_BITS - 1) else mask
+
+
+def bit_mask(bit):
+    return to_signed(1 << bit)
+
+
+def mask_for(bits):
+    mask = 0
+    for bit in bits:
+        if bit is not None:
+            mask |= 1 << bit
+    return to_signed(mask)
+
+
+def free_bit(used):
+    """Lowest bit not in `used`, or None once all 64 are taken."""
+    return next((bit for bit in range(MASK_BITS) if bit not in used), None)
+
+
+def refresh_masks(property_ids):
+    """
+    Recompute Property.amenity_mask from the M2M table: one SELECT and one
+    UPDATE per distinct mask. Returns the masks by property id.
+    """
+    from .models import Property
+
+    bits = {pk: [] for pk in property_ids}
+    if not bits:
+        return {}
+    rows = Property.amenities.through.objects.filter(property_id__in=bits).values_list('property_id', 'amenity__bit')
+    for property_id, bit in rows:
+        bits[property_id].append(bit)
+
+    masks = {property_id: mask_for(property_bits) for property_id, property_bits in bits.items()}
+    by_mask = {}
+    for property_id, mask in masks.items():
+        by_mask.setdefault(mask, []).append(property_id)
+    for mask, ids in by_mask.items():
+        Property.objects.filter(pk__in=ids).update(amenity_mask=mask)
+    return masks
+
+
+def set_bit(queryset, bit):
+    return queryset.update(amenity_mask=F('amenity_mask').bitor(bit_mask(bit)))
+
+
+def clear_bit(queryset, bit):
+    return queryset.update(amenity_mask=F('amenity_mask').bitand(~bit_mask(bit)))
+
+
+def has_bits(mask):
+    """Condition for rows whose amenity_mask contains every bit of `mask`."""
+    return Exact(F('amenity_mask').bitand(mask), mask)
+
+
+def amenity_bits():
+    """{amenity id: bit} of all amenities, cached until an amenity changes."""
+    from .models import Amenity
+
+    key = 'amenity-bits:%s' % get_generations(('amenity',))[0]
+    bits = cache.get(key)
+    if bits is None:
+        bits = dict(Amenity.objects.values_list('pk', 'bit'))
+        cache.set(key, bits, AMENITY_BITS_CACHE_TIMEOUT)
+    return bits
+
+
+def amenity_filter(amenity_ids, match='all'):
+    """
+    Q for properties with all (or any) of the amenities. Amenities holding
+    a bit are matched on Property.amenity_mask, a predicate on the row
+    itself: no join, so no duplicate rows to DISTINCT away. Amenities past
+    the 64th have no bit and fall back to an EXISTS on the M2M table.
+    """
+    from .models import Property
+
+    amenity_ids = sorted({int(pk) for pk in amenity_ids})
+    bits = amenity_bits()
+    through = Property.amenities.through
+    conditions = [
+        Q(Exists(through.objects.filter(property_id=OuterRef('pk'), amenity_id=pk)))
+        for pk in amenity_ids if bits.get(pk) is None
+    ]
+    mask = mask_for(bits.get(pk) for pk in amenity_ids)
+    if mask:
+        conditions.insert(0, Q(has_bits(mask)) if match == 'all' else ~Q(Exact(F('amenity_mask').bitand(mask), 0)))
+
+    condition = conditions[0]
+    for other in conditions[1:]:
+        condition = condition & other if match == 'all' else condition | other
+    return condition
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class TriangleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'triangle'
-    verbose_name = 'KVADRAT.KG'
\ No newline at end of file
+    verbose_name = 'KVADRAT.KG'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,171 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .cache import aget_generations, normalized_query, set_validators
+from .views import BannerViewSet, PropertySearchView, PropertyViewSet
+
+
+def json_response(data, status=200):
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    return HttpResponse(renderer.render(data), status=status, content_type='application/json')
+
+
+class AsyncReadView(View):
+    """
+    Async twin of a public DRF endpoint. GET/HEAD run `read()` on the event
+    loop using the DRF view's own queryset, filters, serializers and cache
+    validators, with every query going through the async ORM. Any other
+    method is handed to the regular DRF view in a thread, so the same URL
+    keeps working for writes.
+
+    Only for AllowAny endpoints: authentication and permission checks are
+    not run on the async path.
+    """
+    drf_view_class = None
+    # Method -> action mapping for viewsets, as the router would pass it
+    drf_actions = None
+    drf_initkwargs = {}
+    action = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # CSRF is left to the DRF view, as for the routes this one shadows
+        view.csrf_exempt = True
+        return view
+
+    @classmethod
+    def get_fallback_view(cls):
+        if cls.__dict__.get('_fallback_view') is None:
+            if cls.drf_actions:
+                cls._fallback_view = cls.drf_view_class.as_view(cls.drf_actions, **cls.drf_initkwargs)
+            else:
+                cls._fallback_view = cls.drf_view_class.as_view(**cls.drf_initkwargs)
+        return cls._fallback_view
+
+    def get_drf_view(self, request, kwargs):
+        view = self.drf_view_class(**self.drf_initkwargs)
+        view.request = Request(request, authenticators=())
+        view.args = ()
+        view.kwargs = kwargs
+        view.format_kwarg = None
+        view.action = self.action
+        return view
+
+    async def get(self, request, *args, **kwargs):
+        view = self.get_drf_view(request, kwargs)
+        try:
+            return await self.read(view, *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return json_response(data, status=exc.status_code)
+
+    async def fallback(self, request, *args, **kwargs):
+        return await sync_to_async(self.get_fallback_view())(request, *args, **kwargs)
+
+    post = put = patch = delete = options = fallback
+
+    async def read(self, view, *args, **kwargs):
+        raise NotImplementedError
+
+    async def paginate(self, view, queryset):
+        page = None
+        if view.paginator is not None:
+            page = await view.paginator.apaginate_queryset(queryset, view.request, view=view)
+        if page is None:
+            return view.get_serializer([obj async for obj in queryset], many=True).data
+        return view.get_paginated_response(view.get_serializer(page, many=True).data).data
+
+
+class PropertyListView(AsyncReadView):
+    drf_view_class = PropertyViewSet
+    drf_actions = {'get': 'list', 'post': 'create'}
+    drf_initkwargs = {'basename': 'property', 'detail': False}
+    action = 'list'
+
+    async def read(self, view):
+        request = view.request
+        queryset = view.filter_queryset(view.get_queryset())
+        state = await queryset.order_by().aaggregate(last_updated=Max('updated_at'), count=Count('id'))
+        etag, last_modified = view.build_validators(
+            state['last_updated'],
+            (state['count'], request.build_absolute_uri(request.path), normalized_query(request)),
+            await aget_generations(('property', 'category', 'amenity')),
+        )
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(json_response(await self.paginate(view, queryset)), etag, last_modified)
+
+
+class PropertyDetailView(AsyncReadView):
+    drf_view_class = PropertyViewSet
+    drf_actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+    drf_initkwargs = {'basename': 'property', 'detail': True}
+    action = 'retrieve'
+
+    def not_found(self, queryset):
+        # Same message as get_object_or_404() on the DRF side
+        return NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+
+    async def read(self, view, pk):
+        request = view.request
+        queryset = view.get_queryset()
+        updated_at = await queryset.filter(pk=pk).values_list('updated_at', flat=True).afirst()
+        if updated_at is None:
+            raise self.not_found(queryset)
+        etag, last_modified = view.build_validators(
+            updated_at,
+            (request.build_absolute_uri(request.path), normalized_query(request)),
+            await aget_generations(('category', 'amenity')),
+        )
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        obj = await queryset.filter(pk=pk).afirst()
+        if obj is None:
+            raise self.not_found(queryset)
+        return set_validators(json_response(view.get_serializer(obj).data), etag, last_modified)
+
+
+class PropertyFeaturedView(AsyncReadView):
+    drf_view_class = PropertyViewSet
+    drf_actions = {'get': 'featured'}
+    drf_initkwargs = {'basename': 'property', 'detail': False}
+    action = 'featured'
+
+    async def read(self, view):
+        async def build():
+            queryset = view.get_queryset().filter(is_featured=True)
+            return view.get_serializer([obj async for obj in queryset], many=True).data
+
+        return await view.acached_response(view.request, build, json_response)
+
+
+class PropertySearchAsyncView(AsyncReadView):
+    drf_view_class = PropertySearchView
+
+    async def read(self, view):
+        if view.wants_stream():
+            # StreamingHttpResponse over a sync iterator; keep it on the DRF view
+            return await self.fallback(self.request)
+        return json_response(await self.paginate(view, view.search_queryset(view.request)))
+
+
+class BannerListView(AsyncReadView):
+    drf_view_class = BannerViewSet
+    drf_actions = {'get': 'list', 'post': 'create'}
+    drf_initkwargs = {'basename': 'banner', 'detail': False}
+    action = 'list'
+
+    async def read(self, view):
+        async def build():
+            return await self.paginate(view, view.filter_queryset(view.get_queryset()))
+
+        return await view.acached_response(view.request, build, json_response)
@@ -0,0 +1,202 @@
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer, TokenRefreshSerializer, TokenVerifySerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+
+from .revocation import REFRESH_JTI_CLAIM, is_token_revoked
+
+# Copied into tokens by ClaimsRefreshToken and re-read from the User on
+# refresh. Nothing that grants access goes here: is_active and is_staff come
+# from the cached User, so a demotion takes effect within AUTH_USER_CACHE_TTL
+# rather than when the token expires.
+USER_CLAIMS = ('username',)
+
+USER_CACHE_MAX_SIZE = 10_000
+
+# pk -> (expires at, User with its profile); per worker process
+_users = {}
+
+
+def cached_user(pk):
+    """
+    The user with its profile select_related, from a short-lived per-process
+    cache (AUTH_USER_CACHE_TTL seconds, 0 to disable). Saving a User or
+    Profile drops the entry in this process; other workers see the change
+    once theirs expires. Each call returns a copy, so callers can't change
+    the cached instance.
+    """
+    now = time.monotonic()
+    entry = _users.get(pk)
+    if entry is not None and entry[0] > now:
+        return copy.deepcopy(entry[1])
+
+    user = User.objects.select_related('profile').filter(pk=pk).first()
+    if user is None:
+        raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+    ttl = getattr(settings, 'AUTH_USER_CACHE_TTL', 30)
+    if ttl > 0:
+        if len(_users) >= USER_CACHE_MAX_SIZE:
+            _users.clear()
+        _users[pk] = (now + ttl, copy.deepcopy(user))
+    return user
+
+
+def forget_user(pk):
+    _users.pop(pk, None)
+
+
+def clear_user_cache():
+    _users.clear()
+
+
+class ClaimsUser(TokenUser):
+    """
+    request.user for tokens carrying USER_CLAIMS: id and username come from
+    the token. Everything else (is_active, is_staff, email, profile,
+    check_password, ...) comes from the real User, loaded through
+    cached_user(), so most requests still run no query.
+    """
+
+    @cached_property
+    def db_user(self):
+        return cached_user(self.id)
+
+    @cached_property
+    def is_active(self):
+        return self.db_user.is_active
+
+    @cached_property
+    def is_staff(self):
+        return self.db_user.is_staff
+
+    @cached_property
+    def is_superuser(self):
+        return self.db_user.is_superuser
+
+    def __getattr__(self, attr):
+        if attr.startswith('__') or attr in ('token', 'db_user'):
+            raise AttributeError(attr)
+        return getattr(self.db_user, attr)
+
+    def save(self, *args, **kwargs):
+        self.db_user.save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self.db_user.delete(*args, **kwargs)
+
+    def set_password(self, raw_password):
+        self.db_user.set_password(raw_password)
+
+    def check_password(self, raw_password):
+        return self.db_user.check_password(raw_password)
+
+    @property
+    def groups(self):
+        return self.db_user.groups
+
+    @property
+    def user_permissions(self):
+        return self.db_user.user_permissions
+
+    def get_group_permissions(self, obj=None):
+        return self.db_user.get_group_permissions(obj)
+
+    def get_all_permissions(self, obj=None):
+        return self.db_user.get_all_permissions(obj)
+
+    def has_perm(self, perm, obj=None):
+        return self.db_user.has_perm(perm, obj)
+
+    def has_perms(self, perm_list, obj=None):
+        return self.db_user.has_perms(perm_list, obj)
+
+    def has_module_perms(self, module):
+        return self.db_user.has_module_perms(module)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request User query: tokens with the
+    user claims authenticate as a ClaimsUser backed by cached_user(). Tokens
+    issued before the claims were added still load the User as before.
+    Revoked tokens and inactive users are rejected.
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_token_revoked(token):
+            raise InvalidToken('Токен отозван')
+        return token
+
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Токен не содержит идентификатора пользователя')
+        user = ClaimsUser(validated_token)
+        if not user.is_active:
+            raise AuthenticationFailed('Пользователь неактивен', code='user_inactive')
+        return user
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token with USER_CLAIMS. Its access tokens copy them and carry
+    its jti, so they are revoked along with it.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.set_user_claims(user)
+        return token
+
+    def set_user_claims(self, user):
+        for claim in USER_CLAIMS:
+            self[claim] = getattr(user, claim)
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        access[REFRESH_JTI_CLAIM] = self[api_settings.JTI_CLAIM]
+        return access
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes only for users that still exist and are active, with the
+    claims re-read from the database instead of copied from the old token.
+    """
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_token_revoked(refresh):
+            raise TokenError('Токен отозван')
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)}).first()
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed('Пользователь не найден или неактивен', code='no_active_account')
+        refresh.set_user_claims(user)
+        return super().validate({**attrs, 'refresh': str(refresh)})
+
+
+class RevocationTokenVerifySerializer(TokenVerifySerializer):
+    def validate(self, attrs):
+        if is_token_revoked(UntypedToken(attrs['token'])):
+            raise TokenError('Токен отозван')
+        return super().validate(attrs)
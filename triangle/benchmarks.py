@@ -0,0 +1,87 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.utils import timezone
+
+from .geo import geohash_for
+from .models import Category, Property, price_per_m2
+
+# Most seeded listings are in Bishkek, the rest spread over Kyrgyzstan
+BISHKEK_BOX = (42.78, 74.45, 42.92, 74.72)
+COUNTRY_BOX = (39.2, 69.3, 43.2, 80.2)
+
+
+@contextmanager
+def throwaway_database(verbosity=0):
+    """
+    Run a benchmark against a freshly migrated test database so seeding
+    never touches the real catalog.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+@contextmanager
+def explicit_timestamps():
+    field = Property._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def seed_properties(count, batch_size=5000, seed=42, stdout=None):
+    rng = random.Random(seed)
+    categories = [Category.objects.create(name=f'Категория {i}') for i in range(10)]
+    types = [code for code, _ in Property.PROPERTY_TYPES]
+    now = timezone.now()
+    created = 0
+    with explicit_timestamps():
+        while created < count:
+            batch = []
+            for i in range(min(batch_size, count - created)):
+                area = Decimal(rng.randint(20, 400))
+                south, west, north, east = BISHKEK_BOX if rng.random() < 0.7 else COUNTRY_BOX
+                property_obj = Property(
+                    title=f'Объект {created + i}',
+                    description='',
+                    price=area * rng.randint(500, 3000),
+                    area=area,
+                    address=f'Бишкек, ул. {rng.randint(1, 500)}',
+                    property_type=rng.choice(types),
+                    rooms=rng.randint(1, 6),
+                    bedrooms=rng.randint(1, 4),
+                    category=rng.choice(categories),
+                    is_active=rng.random() < 0.9,
+                    is_featured=rng.random() < 0.02,
+                    created_at=now - timedelta(minutes=rng.randint(0, 60 * 24 * 365 * 3)),
+                    latitude=round(rng.uniform(south, north), 6),
+                    longitude=round(rng.uniform(west, east), 6),
+                )
+                property_obj.geohash = geohash_for(property_obj)
+                property_obj.price_per_m2 = price_per_m2(property_obj.price, property_obj.area)
+                batch.append(property_obj)
+            Property.objects.bulk_create(batch)
+            created += len(batch)
+            if stdout is not None:
+                stdout.write(f'  seeded {created}/{count}')
+    return created
+
+
+def best_of(func, repeat=5):
+    """Return the fastest of `repeat` runs of `func` in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import time
+from functools import partial
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _generation_key(name):
+    return f'generation:{name}'
+
+
+def bump_generation(*names):
+    """
+    Invalidate every cached response built from `names`. The generation is
+    the bump time in nanoseconds, so it also serves as Last-Modified.
+    """
+    now = time.time_ns()
+    cache.set_many({_generation_key(name): now for name in names}, timeout=None)
+
+
+def get_generations(names):
+    keys = [_generation_key(name) for name in names]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        found.update(cache.get_many(missing))
+    return [found.get(key, 0) for key in keys]
+
+
+async def aget_generations(names):
+    keys = [_generation_key(name) for name in names]
+    found = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            await cache.aadd(key, now, timeout=None)
+        found.update(await cache.aget_many(missing))
+    return [found.get(key, 0) for key in keys]
+
+
+def normalized_query(request):
+    params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    return urlencode([(key, value) for key, values in params for value in values])
+
+
+def make_etag(data):
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True, ensure_ascii=False)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def validators_for(parts, last_modified):
+    """
+    Build a weak ETag from cheap row metadata (never from the serialized
+    body) together with an HTTP Last-Modified timestamp.
+    """
+    etag = 'W/' + quote_etag(hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest())
+    return etag, int(last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code == 200:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class CachedResponseMixin:
+    """
+    Versioned response cache for public read endpoints. The key combines the
+    generations of `cache_generations` with the normalized query string, so
+    a post_save/post_delete on any of those models makes old entries
+    unreachable instead of having to find and delete them.
+    """
+    cache_generations = ()
+    cache_actions = ('list', 'retrieve')
+    response_cache_timeout = 300
+
+    def get_response_cache_key(self, request, generations):
+        raw = '|'.join([
+            request.build_absolute_uri(request.path),
+            normalized_query(request),
+            ','.join(str(generation) for generation in generations),
+        ])
+        return f'response:{self.basename}:{self.action}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def make_cache_entry(self, data, generations):
+        return {
+            'data': data,
+            'etag': quote_etag(make_etag(data)),
+            'last_modified': max(generations, default=time.time_ns()) // 1_000_000_000,
+        }
+
+    def cached_entry_response(self, request, entry, response_class=Response):
+        not_modified = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+        if not_modified is not None:
+            return not_modified
+
+        response = response_class(entry['data'])
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        return response
+
+    def cached_response(self, request, build):
+        key = self.get_response_cache_key(request, get_generations(self.cache_generations))
+        entry = cache.get(key)
+        if entry is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            entry = self.make_cache_entry(response.data, get_generations(self.cache_generations))
+            cache.set(key, entry, self.response_cache_timeout)
+        return self.cached_entry_response(request, entry)
+
+    async def acached_response(self, request, abuild, response_class):
+        """
+        cached_response() for the async views: `abuild` is a coroutine
+        function returning the response data, `response_class` renders it.
+        """
+        key = self.get_response_cache_key(request, await aget_generations(self.cache_generations))
+        entry = await cache.aget(key)
+        if entry is None:
+            data = await abuild()
+            entry = self.make_cache_entry(data, await aget_generations(self.cache_generations))
+            await cache.aset(key, entry, self.response_cache_timeout)
+        return self.cached_entry_response(request, entry, response_class)
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.cache_actions:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(request, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.cache_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(request, partial(super().retrieve, request, *args, **kwargs))
@@ -0,0 +1,55 @@
+from django.db.models import Prefetch
+
+# Columns a card is built from; saving any of them rebuilds Property.card_data
+CARD_SOURCE_FIELDS = (
+    'title', 'price', 'area', 'address', 'property_type', 'rooms', 'category', 'latitude', 'longitude',
+)
+
+
+def build_card(property_obj, category_name, main_image):
+    """
+    Card payload stored in Property.card_data. Takes the category name and
+    the main image's storage name explicitly so migrations can reuse it with
+    historical models.
+    """
+    return {
+        'id': property_obj.pk,
+        'title': property_obj.title,
+        'price': str(property_obj.price),
+        'area': str(property_obj.area),
+        'price_per_m2': str(property_obj.price_per_m2) if property_obj.price_per_m2 is not None else None,
+        'address': property_obj.address,
+        'property_type': property_obj.property_type,
+        'rooms': property_obj.rooms,
+        'latitude': property_obj.latitude,
+        'longitude': property_obj.longitude,
+        'category': category_name,
+        'main_image': main_image or None,
+    }
+
+
+def card_for(property_obj):
+    category = property_obj.category if property_obj.category_id else None
+    main_image = None
+    if property_obj.pk:
+        main_image = property_obj.images.filter(is_main=True).values_list('image', flat=True).first()
+    return build_card(property_obj, category.name if category else None, main_image)
+
+
+def refresh_cards(property_ids, batch_size=500):
+    """Rebuild card_data for the given properties with one UPDATE per batch."""
+    from .models import Property, PropertyImage
+
+    property_ids = list(property_ids)
+    for start in range(0, len(property_ids), batch_size):
+        properties = list(
+            Property.objects.filter(pk__in=property_ids[start:start + batch_size])
+            .select_related('category')
+            .prefetch_related(Prefetch('images', queryset=PropertyImage.objects.filter(is_main=True),
+                                       to_attr='main_images'))
+        )
+        for property_obj in properties:
+            main_image = property_obj.main_images[0].image.name if property_obj.main_images else None
+            category_name = property_obj.category.name if property_obj.category else None
+            property_obj.card_data = build_card(property_obj, category_name, main_image)
+        Property.objects.bulk_update(properties, ['card_data'])
@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Substr
+
+from . import geo
+from .cache import get_generations
+from .facets import filter_fingerprint
+from .models import Property
+
+MAX_ZOOM = 20
+# Clusters are computed and cached per tile, a geohash cell this many
+# characters shorter than the cluster cells (up to 32x32 cells per tile)
+TILE_DEPTH = 2
+MAX_TILES = 64
+# Cluster cells are at most ~1/8 of a map tile wide
+CELLS_PER_MAP_TILE = 8
+
+CLUSTERS_CACHE_TIMEOUT = 300
+
+
+def precision_for_zoom(zoom):
+    """Longest geohash whose cells are still at least 1/8 of a 256px map tile wide at `zoom`."""
+    target = 360.0 / 2 ** zoom / CELLS_PER_MAP_TILE
+    precision = 1
+    while precision < geo.GEOHASH_PRECISION and geo.cell_size(precision + 1)[1] >= target:
+        precision += 1
+    return precision
+
+
+def tiles_for(south, west, north, east, precision):
+    tile_precision = max(precision - TILE_DEPTH, 0)
+    boxes = [(south, west, north, 180.0), (south, -180.0, north, east)] if west > east \
+        else [(south, west, north, east)]
+    if sum(geo.count_cells(*box, tile_precision) for box in boxes) > MAX_TILES:
+        raise ValueError('Слишком большая область для этого масштаба')
+    return sorted({tile for box in boxes for tile in geo.cells(*box, tile_precision)})
+
+
+def compute_tiles(filters, tiles, precision):
+    """
+    Clusters for several tiles in one GROUP BY over the geohash prefix,
+    reading only the index ranges of those tiles.
+    """
+    base = Property.objects.filter(filters).exclude(geohash='')
+    rows = base.filter(geo.prefix_filter(tiles)).order_by() \
+        .annotate(cell=Substr('geohash', 1, precision)).values('cell') \
+        .annotate(count=Count('id'), latitude=Avg('latitude'), longitude=Avg('longitude'),
+                  min_price=Min('price'), max_price=Max('price'), first_id=Min('id')) \
+        .order_by('cell')
+
+    result = {tile: [] for tile in tiles}
+    tile_length = len(tiles[0])
+    for row in rows:
+        result[row['cell'][:tile_length]].append({
+            'geohash': row['cell'],
+            'count': row['count'],
+            'latitude': round(row['latitude'], 6),
+            'longitude': round(row['longitude'], 6),
+            'min_price': row['min_price'],
+            'max_price': row['max_price'],
+            'bounds': geo.bounds(row['cell']),
+            # A single listing can be drawn as a marker straight away
+            'id': row['first_id'] if row['count'] == 1 else None,
+        })
+    return result
+
+
+def cached_clusters(filters, zoom, south, west, north, east):
+    """
+    Clusters of active listings inside the box at `zoom`. Tiles are cached
+    per cell precision, filter fingerprint and property generation, so
+    panning only computes the tiles that scrolled into view, and zoom
+    levels sharing a precision share tiles.
+    """
+    precision = precision_for_zoom(zoom)
+    tiles = tiles_for(south, west, north, east, precision)
+
+    generation = get_generations(('property',))[0]
+    fingerprint = filter_fingerprint(filters)
+    keys = {tile: f'clusters:{precision}:{tile}:{fingerprint}:{generation}' for tile in tiles}
+    found = cache.get_many(keys.values())
+    clusters = {tile: found[key] for tile, key in keys.items() if key in found}
+
+    missing = [tile for tile in tiles if tile not in clusters]
+    if missing:
+        computed = compute_tiles(filters, missing, precision)
+        cache.set_many({keys[tile]: computed[tile] for tile in missing}, CLUSTERS_CACHE_TIMEOUT)
+        clusters.update(computed)
+
+    def visible(cell):
+        cell_south, cell_west, cell_north, cell_east = cell['bounds']
+        if cell_south > north or cell_north < south:
+            return False
+        if west <= east:
+            return cell_west <= east and cell_east >= west
+        return cell_east >= west or cell_west <= east
+
+    cells = [cell for tile in tiles for cell in clusters[tile] if visible(cell)]
+    return {
+        'zoom': zoom,
+        'precision': precision,
+        'total': sum(cell['count'] for cell in cells),
+        'clusters': cells,
+    }
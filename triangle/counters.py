@@ -0,0 +1,96 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Property, PropertyCounter
+
+SEGMENT_FIELDS = ('property_type', 'is_active', 'is_featured')
+
+
+def segment_of(obj):
+    return tuple(obj[field] if isinstance(obj, dict) else getattr(obj, field) for field in SEGMENT_FIELDS)
+
+
+def apply_delta(segment, count, total_price):
+    """Add to a segment's counter with a single UPDATE ... SET count = count + n."""
+    if not count and not total_price:
+        return
+    lookup = dict(zip(SEGMENT_FIELDS, segment))
+    updated = PropertyCounter.objects.filter(**lookup).update(
+        count=F('count') + count, total_price=F('total_price') + total_price,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            PropertyCounter.objects.create(**lookup, count=count, total_price=total_price)
+    except IntegrityError:
+        # Another writer created the row first
+        apply_delta(segment, count, total_price)
+
+
+def record_change(old, new):
+    """
+    Move a property between segments. `old`/`new` are (segment, price)
+    pairs; None stands for "did not exist" on create and delete.
+    """
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    if old is not None:
+        deltas[old[0]][0] -= 1
+        deltas[old[0]][1] -= Decimal(old[1])
+    if new is not None:
+        deltas[new[0]][0] += 1
+        deltas[new[0]][1] += Decimal(new[1])
+    for segment, (count, total_price) in deltas.items():
+        apply_delta(segment, count, total_price)
+
+
+def record_created(instances):
+    """Count properties written with bulk_create: one UPDATE per segment."""
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for instance in instances:
+        deltas[segment_of(instance)][0] += 1
+        deltas[segment_of(instance)][1] += Decimal(instance.price)
+    for segment, (count, total_price) in deltas.items():
+        apply_delta(segment, count, total_price)
+
+
+def counter_totals():
+    """Dashboard totals from the counters alone, whatever the catalog size."""
+    totals = {'total': 0, 'active': 0, 'featured': 0, 'value': Decimal(0), 'types': defaultdict(int)}
+    for counter in PropertyCounter.objects.all():
+        totals['total'] += counter.count
+        totals['active'] += counter.count if counter.is_active else 0
+        totals['featured'] += counter.count if counter.is_featured else 0
+        totals['value'] += counter.total_price
+        totals['types'][counter.property_type] += counter.count
+    return totals
+
+
+def reconcile():
+    """
+    Recount every segment from Property and fix the counters that drifted.
+    Returns [(segment, (stored count, stored total), (actual count, actual total))].
+    """
+    with transaction.atomic():
+        actual = {
+            segment_of(row): (row['count'], row['total_price'])
+            for row in Property.objects.order_by().values(*SEGMENT_FIELDS)
+            .annotate(count=Count('id'), total_price=Sum('price'))
+        }
+        stored = {segment_of(counter): counter for counter in PropertyCounter.objects.select_for_update()}
+
+        drift = []
+        for segment in stored.keys() | actual.keys():
+            count, total_price = actual.get(segment, (0, Decimal(0)))
+            counter = stored.get(segment)
+            if counter is None:
+                counter = PropertyCounter(**dict(zip(SEGMENT_FIELDS, segment)))
+            elif counter.count == count and counter.total_price == total_price:
+                continue
+            drift.append((segment, (counter.count, counter.total_price), (count, total_price)))
+            counter.count, counter.total_price = count, total_price
+            counter.save()
+        return sorted(drift)
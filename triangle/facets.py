@@ -0,0 +1,93 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Q
+
+from .cache import get_generations
+from .models import Property
+
+PRICE_BUCKETS = [
+    (None, 50_000),
+    (50_000, 100_000),
+    (100_000, 200_000),
+    (200_000, 500_000),
+    (500_000, None),
+]
+
+FACETS_CACHE_TIMEOUT = 300
+
+
+def price_bucket_filter(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def compute_facets(filters):
+    """
+    Facet counts for the filter sidebar in a fixed five queries, however
+    many facet values exist: one conditional-count aggregate for the types
+    and price buckets, then one GROUP BY each for rooms, bedrooms, category
+    and amenities.
+    """
+    base = Property.objects.filter(filters)
+    base = base.order_by()
+
+    aggregates = {'total': Count('id'), 'min_price': Min('price'), 'max_price': Max('price')}
+    for code, _ in Property.PROPERTY_TYPES:
+        aggregates[f'type_{code}'] = Count('id', filter=Q(property_type=code))
+    for i, (low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{i}'] = Count('id', filter=price_bucket_filter(low, high))
+    summary = base.aggregate(**aggregates)
+
+    def grouped(field):
+        rows = base.values(field).annotate(count=Count('id')).order_by(field)
+        return [{'value': row[field], 'count': row['count']} for row in rows]
+
+    categories = base.filter(category__isnull=False).values('category', 'category__name') \
+        .annotate(count=Count('id')).order_by('category__name')
+    amenities = Property.amenities.through.objects.filter(property__in=base) \
+        .values('amenity', 'amenity__name').annotate(count=Count('property')).order_by('amenity__name')
+
+    return {
+        'total': summary['total'],
+        'price_range': {'min': summary['min_price'], 'max': summary['max_price']},
+        'property_type': [
+            {'value': code, 'label': label, 'count': summary[f'type_{code}']}
+            for code, label in Property.PROPERTY_TYPES
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': summary[f'price_{i}']}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        'rooms': grouped('rooms'),
+        'bedrooms': grouped('bedrooms'),
+        'category': [
+            {'value': row['category'], 'label': row['category__name'], 'count': row['count']}
+            for row in categories
+        ],
+        'amenities': [
+            {'value': row['amenity'], 'label': row['amenity__name'], 'count': row['count']}
+            for row in amenities
+        ],
+    }
+
+
+def filter_fingerprint(filters):
+    # The compiled SQL and params: stable for subqueries and expressions,
+    # whose str() can embed object addresses
+    sql, params = Property.objects.filter(filters).order_by().query.sql_with_params()
+    return hashlib.sha1(f'{sql}{params!r}'.encode()).hexdigest()
+
+
+def cached_facets(filters):
+    generations = get_generations(('property', 'category', 'amenity'))
+    key = 'facets:%s:%s' % (filter_fingerprint(filters), ','.join(str(g) for g in generations))
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,25 @@
+import django_filters
+
+from .models import Category, Property
+
+
+class PropertyFilterSet(django_filters.FilterSet):
+    # Filter on the raw id: the default ModelChoiceFilter looks the category
+    # up while validating, which costs a query and can't run in async views
+    category = django_filters.NumberFilter(method='filter_category')
+    include_descendants = django_filters.BooleanFilter(method='filter_include_descendants',
+                                                       help_text='With category: also match its subcategories')
+
+    class Meta:
+        model = Property
+        fields = ['property_type', 'rooms', 'bedrooms', 'garage', 'category', 'is_featured']
+
+    def filter_category(self, queryset, name, value):
+        # Read raw: the boolean widget does not take '1'
+        if self.data.get('include_descendants') in ('1', 'true', 'True'):
+            return queryset.filter(category__in=Category.objects.subtree(value).values('pk'))
+        return queryset.filter(category_id=value)
+
+    def filter_include_descendants(self, queryset, name, value):
+        # Read by filter_category
+        return queryset
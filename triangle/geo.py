@@ -0,0 +1,177 @@
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Round, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+# Sorts after every geohash character, closing the range of a prefix
+PREFIX_END = '~'
+
+KM_PER_DEGREE = 111.32
+
+# Past these the prefix ranges are slower than a latitude range on the
+# (latitude, longitude) index: a large or coarsely covered box needs more
+# ranges than it saves (see manage.py bench_geo)
+GEOHASH_MAX_BOX_KM = 4.0
+GEOHASH_MIN_COVER_PRECISION = 6
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        interval, value = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def geohash_for(property_obj):
+    if property_obj.latitude is None or property_obj.longitude is None:
+        return ''
+    return encode(property_obj.latitude, property_obj.longitude)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell of `precision` characters."""
+    bits = precision * 5
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def cover(south, west, north, east, max_cells=24):
+    """
+    Geohash prefixes whose cells together cover the box, at the finest
+    precision that needs at most `max_cells` of them.
+    """
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        if count_cells(south, west, north, east, candidate) <= max_cells:
+            precision = candidate
+            break
+    return cells(south, west, north, east, precision)
+
+
+def count_cells(south, west, north, east, precision):
+    """How many cells cells() returns for the box, without enumerating them."""
+    height, width = cell_size(precision)
+    return (math.floor(north / height) - math.floor(south / height) + 1) * \
+        (math.floor(east / width) - math.floor(west / width) + 1)
+
+
+def cells(south, west, north, east, precision):
+    """Sorted geohashes of `precision` characters covering the box."""
+    height, width = cell_size(precision)
+    found = set()
+    lat = south
+    while True:
+        lng = west
+        while True:
+            found.add(encode(lat, lng, precision))
+            if lng >= east:
+                break
+            lng = min(lng + width, east)
+        if lat >= north:
+            break
+        lat = min(lat + height, north)
+    return sorted(found)
+
+
+def bounds(geohash):
+    """(south, west, north, east) of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if bits >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def prefix_filter(prefixes):
+    """Index-friendly OR of prefix ranges on Property.geohash."""
+    condition = Q()
+    for prefix in prefixes:
+        condition |= Q(geohash__gte=prefix, geohash__lt=prefix + PREFIX_END)
+    return condition
+
+
+def box_size_km(south, west, north, east):
+    """(height, width) of the box in km, the width taken at its middle latitude."""
+    middle = math.radians((south + north) / 2)
+    return (north - south) * KM_PER_DEGREE, (east - west) * KM_PER_DEGREE * math.cos(middle)
+
+
+def geohash_filter(south, west, north, east, max_cells=24):
+    """
+    The exact box check, led by index-friendly prefix ranges on
+    Property.geohash when the box is small enough for them to pay off.
+    """
+    if west > east:
+        # Box crosses the antimeridian: split it in two
+        return (geohash_filter(south, west, north, 180.0, max_cells) |
+                geohash_filter(south, -180.0, north, east, max_cells))
+    box = Q(latitude__range=(south, north), longitude__range=(west, east))
+    if max(box_size_km(south, west, north, east)) > GEOHASH_MAX_BOX_KM:
+        return box
+    prefixes = cover(south, west, north, east, max_cells)
+    if len(prefixes[0]) < GEOHASH_MIN_COVER_PRECISION:
+        return box
+    return prefix_filter(prefixes) & box
+
+
+def box_around(latitude, longitude, radius_km):
+    """(south, west, north, east) of the box enclosing a circle."""
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return (max(latitude - dlat, -90.0), max(longitude - dlng, -180.0),
+            min(latitude + dlat, 90.0), min(longitude + dlng, 180.0))
+
+
+def distance_sq_expression(latitude, longitude):
+    # Equirectangular approximation: longitude degrees are scaled by cos(lat)
+    # of the origin, so the per-row work is plain arithmetic. Error stays well
+    # under 1% for the city-scale radii the endpoints allow.
+    scale = math.cos(math.radians(latitude))
+    dlat = F('latitude') - latitude
+    dlng = (F('longitude') - longitude) * scale
+    return dlat * dlat + dlng * dlng
+
+
+def distance_km_expression(latitude, longitude):
+    return Round(Sqrt(distance_sq_expression(latitude, longitude), output_field=FloatField()) * KM_PER_DEGREE,
+                 4, output_field=FloatField())
+
+
+def nearby(queryset, latitude, longitude, radius_km):
+    """Properties within `radius_km`, annotated with `distance` in km."""
+    limit = (radius_km / KM_PER_DEGREE) ** 2
+    return queryset.filter(geohash_filter(*box_around(latitude, longitude, radius_km))).alias(
+        distance_sq=distance_sq_expression(latitude, longitude),
+    ).filter(distance_sq__lte=limit).annotate(distance=distance_km_expression(latitude, longitude))
+
+
+def in_bounds(queryset, south, west, north, east):
+    """Properties inside the box, annotated with `distance` in km from its center."""
+    center_lat = (south + north) / 2
+    center_lng = (west + east) / 2 if west <= east else ((west + east + 360) / 2 + 180) % 360 - 180
+    return queryset.filter(geohash_filter(south, west, north, east)).annotate(
+        distance=distance_km_expression(center_lat, center_lng),
+    )
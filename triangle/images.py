@@ -0,0 +1,134 @@
+import logging
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Target widths per kind of image; variants are never upscaled
+VARIANT_SIZES = {
+    'property': {'thumb': 320, 'medium': 768, 'large': 1600},
+    'banner': {'medium': 768, 'large': 1920},
+    'activity': {'thumb': 320, 'medium': 768},
+    'avatar': {'small': 96, 'medium': 256},
+}
+
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', 'avif', {'quality': 60}),
+}
+
+
+def available_formats():
+    # AVIF needs a Pillow build (or the pillow-avif-plugin) that registers a
+    # saver for it; JPEG and WebP are always there
+    Image.init()
+    return [name for name, (pil_format, _, _) in FORMATS.items() if pil_format in Image.SAVE]
+
+
+def variant_path(name, size, extension):
+    path = PurePosixPath(name)
+    return str(path.parent / 'variants' / f'{path.stem}_{size}.{extension}')
+
+
+def generate_variants(field_file, sizes):
+    """
+    Render resized copies of `field_file` in every available format and
+    return their storage paths keyed by size name, e.g.
+    {'source': name, 'sizes': {'thumb': {'width': 320, 'height': 213,
+    'jpeg': '.../variants/a_thumb.jpg', 'webp': ...}}}.
+    """
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    formats = available_formats()
+    variants = {'source': field_file.name, 'sizes': {}}
+    for size, width in sorted(sizes.items(), key=lambda item: item[1]):
+        resized = image.copy()
+        if resized.width > width:
+            resized.thumbnail((width, resized.height), Image.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        for fmt in formats:
+            pil_format, extension, options = FORMATS[fmt]
+            output = resized.convert('RGB') if pil_format == 'JPEG' and has_alpha else resized
+            buffer = BytesIO()
+            output.save(buffer, pil_format, **options)
+            path = variant_path(field_file.name, size, extension)
+            entry[fmt] = default_storage.save(path, ContentFile(buffer.getvalue()))
+        variants['sizes'][size] = entry
+        if resized.width < width:
+            # Source is narrower than this size; larger sizes would be identical
+            break
+    return variants
+
+
+def delete_variants(variants):
+    for entry in (variants or {}).get('sizes', {}).values():
+        for fmt in FORMATS:
+            if entry.get(fmt):
+                default_storage.delete(entry[fmt])
+
+
+def build_variants(field_file, kind):
+    """
+    generate_variants() for a kind of image. A file that is missing or can't
+    be decoded gets a variants dict marked as failed, so saving the row again
+    doesn't retry it.
+    """
+    try:
+        return generate_variants(field_file, VARIANT_SIZES[kind])
+    except (OSError, Image.DecompressionBombError) as exc:
+        logger.warning('Could not build variants for %s: %s', field_file.name, exc)
+        return {'source': field_file.name, 'failed': True, 'sizes': {}}
+
+
+def refresh_variants(instance, field_name, kind, retry_failed=False):
+    """
+    Bring instance.variants in line with its image field. Sources that
+    already failed are only tried again with `retry_failed`. Returns True
+    when the stored variants changed.
+    """
+    field_file = getattr(instance, field_name)
+    old = instance.variants or {}
+    if not field_file:
+        variants = {}
+    elif old.get('source') == field_file.name and not (retry_failed and old.get('failed')):
+        return False
+    else:
+        variants = build_variants(field_file, kind)
+    if variants == old:
+        return False
+    type(instance).objects.filter(pk=instance.pk).update(variants=variants)
+    instance.variants = variants
+    delete_variants(old)
+    return True
+
+
+def variant_url(variants, size, fmt='jpeg'):
+    entry = (variants or {}).get('sizes', {}).get(size)
+    if not entry or not entry.get(fmt):
+        return None
+    return default_storage.url(entry[fmt])
+
+
+def build_srcset(variants):
+    """Map every format to an HTML srcset string, e.g. {'webp': 'a_thumb.webp 320w, a_medium.webp 768w'}."""
+    sizes = (variants or {}).get('sizes', {})
+    srcset = {}
+    for fmt in FORMATS:
+        candidates = [
+            f'{default_storage.url(entry[fmt])} {entry["width"]}w'
+            for entry in sorted(sizes.values(), key=lambda entry: entry['width'])
+            if entry.get(fmt)
+        ]
+        if candidates:
+            srcset[fmt] = ', '.join(candidates)
+    return srcset
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+import re
+import time
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .amenity_masks import mask_for
+from .geo import geohash_for
+from .models import Amenity, Category, Property, price_per_m2
+from .signals import properties_bulk_changed
+
+IMPORT_FORMATS = ('csv', 'json')
+
+AMENITY_SEPARATOR_RE = re.compile(r'[,;]')
+
+
+class PropertyImportSerializer(serializers.ModelSerializer):
+    """
+    Validates one imported row. Category and amenity ids are checked against
+    sets loaded once per import (context 'category_ids'/'amenity_ids') rather
+    than with a query per row.
+    """
+    category = serializers.IntegerField(required=False, allow_null=True)
+    amenities = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Property
+        exclude = ['created_at', 'updated_at']
+
+    def validate_category(self, value):
+        if value is not None and value not in self.context['category_ids']:
+            raise serializers.ValidationError(f'Категория {value} не найдена')
+        return value
+
+    def validate_amenities(self, value):
+        missing = sorted(set(value) - self.context['amenity_ids'])
+        if missing:
+            raise serializers.ValidationError(f'Удобства не найдены: {", ".join(map(str, missing))}')
+        return sorted(set(value))
+
+
+def detect_format(name):
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def read_rows(fileobj, fmt):
+    """
+    Parse an uploaded file into row dicts. JSON is a list of objects; CSV has
+    a header row, empty cells are treated as missing and `amenities` holds ids
+    separated by ',' or ';'.
+    """
+    data = fileobj.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if fmt == 'json':
+        rows = json.loads(data)
+        if not isinstance(rows, list):
+            raise ValueError('Ожидался список объектов')
+        return rows
+    if fmt == 'csv':
+        rows = []
+        for row in csv.DictReader(io.StringIO(data)):
+            row = {key: value for key, value in row.items() if key and value not in ('', None)}
+            if 'amenities' in row:
+                row['amenities'] = [part.strip() for part in AMENITY_SEPARATOR_RE.split(row['amenities']) if part.strip()]
+            rows.append(row)
+        return rows
+    raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+def import_properties(rows, batch_size=1000, on_batch=None):
+    """
+    Validate and insert rows in batches. Each batch is one transaction with a
+    single multi-row INSERT for the properties and one for their amenities;
+    invalid rows are skipped and reported. `on_batch(stats)` is called after
+    every batch with its number, size and timing.
+    """
+    amenity_bits = dict(Amenity.objects.values_list('id', 'bit'))
+    context = {
+        'category_ids': set(Category.objects.values_list('id', flat=True)),
+        'amenity_ids': set(amenity_bits),
+    }
+    result = {'created': 0, 'errors': [], 'batches': []}
+
+    for start in range(0, len(rows), batch_size):
+        started = time.perf_counter()
+        properties, amenities = [], []
+        for number, row in enumerate(rows[start:start + batch_size], start=start + 1):
+            serializer = PropertyImportSerializer(data=row, context=context)
+            if not serializer.is_valid():
+                result['errors'].append({'row': number, 'errors': serializer.errors})
+                continue
+            data = dict(serializer.validated_data)
+            amenity_ids = data.pop('amenities', [])
+            amenities.append(amenity_ids)
+            data['category_id'] = data.pop('category', None)
+            property_obj = Property(**data)
+            property_obj.geohash = geohash_for(property_obj)
+            property_obj.price_per_m2 = price_per_m2(property_obj.price, property_obj.area)
+            property_obj.amenity_mask = mask_for(amenity_bits[amenity_id] for amenity_id in amenity_ids)
+            properties.append(property_obj)
+        validated = time.perf_counter()
+
+        if properties:
+            with transaction.atomic():
+                Property.objects.bulk_create(properties)
+                through = Property.amenities.through
+                through.objects.bulk_create([
+                    through(property_id=property_obj.pk, amenity_id=amenity_id)
+                    for property_obj, amenity_ids in zip(properties, amenities)
+                    for amenity_id in amenity_ids
+                ])
+                properties_bulk_changed.send(sender=Property, instances=properties, created=True)
+
+        finished = time.perf_counter()
+        batch = {
+            'batch': len(result['batches']) + 1,
+            'rows': min(batch_size, len(rows) - start),
+            'created': len(properties),
+            'validate_ms': round((validated - started) * 1000, 2),
+            'write_ms': round((finished - validated) * 1000, 2),
+        }
+        result['batches'].append(batch)
+        result['created'] += len(properties)
+        if on_batch:
+            on_batch(batch)
+    return result
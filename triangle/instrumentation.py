@@ -0,0 +1,241 @@
+import random
+import secrets
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryProbe:
+    """
+    Times the queries of one request through a connection execute wrapper.
+    Attach and detach it in the thread that runs the ORM: under ASGI that is
+    the request's sync_to_async thread, not the event loop.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.statements.add(sql)
+
+    @property
+    def duplicates(self):
+        # Same SQL text run again with any params: the N+1 signature
+        return self.count - len(self.statements)
+
+    def attach(self):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+
+    def detach(self):
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+class Metrics:
+    """In-process per-route aggregates; each worker process exports its own."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = defaultdict(int)
+        self.sampled = defaultdict(lambda: {
+            'count': 0, 'seconds': 0.0, 'db_seconds': 0.0, 'render_seconds': 0.0,
+            'queries': 0, 'duplicates': 0, 'bytes': 0, 'buckets': [0] * len(DURATION_BUCKETS),
+        })
+
+    def count(self, labels):
+        with self.lock:
+            self.requests[labels] += 1
+
+    def observe(self, labels, seconds, probe, render_seconds, size):
+        with self.lock:
+            entry = self.sampled[labels]
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['db_seconds'] += probe.seconds
+            entry['render_seconds'] += render_seconds
+            entry['queries'] += probe.count
+            entry['duplicates'] += probe.duplicates
+            entry['bytes'] += size
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self.lock:
+            requests = dict(self.requests)
+            sampled = {labels: {**entry, 'buckets': list(entry['buckets'])} for labels, entry in self.sampled.items()}
+
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{{{format_labels(labels)}}} {value}')
+
+        family('http_requests_total', 'counter', 'Requests by route, method and status.',
+               sorted(requests.items()))
+        family('http_requests_sampled_total', 'counter', 'Requests that were sampled for the metrics below.',
+               [(labels, entry['count']) for labels, entry in sorted(sampled.items())])
+
+        lines.append('# HELP http_request_duration_seconds Wall time of sampled requests.')
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        for labels, entry in sorted(sampled.items()):
+            for bound, count in zip(DURATION_BUCKETS, entry['buckets']):
+                lines.append(f'http_request_duration_seconds_bucket{{{format_labels(labels, le=bound)}}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{format_labels(labels, le="+Inf")}}} '
+                         f'{entry["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{{format_labels(labels)}}} {entry["seconds"]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{format_labels(labels)}}} {entry["count"]}')
+
+        for name, key, help_text in (
+            ('http_request_db_seconds_total', 'db_seconds', 'Time spent in SQL by sampled requests.'),
+            ('http_request_render_seconds_total', 'render_seconds', 'Time spent rendering sampled responses.'),
+            ('http_request_queries_total', 'queries', 'SQL queries run by sampled requests.'),
+            ('http_request_duplicate_queries_total', 'duplicates',
+             'Queries repeating an SQL statement already run in the same request.'),
+            ('http_response_bytes_total', 'bytes', 'Body size of sampled responses.'),
+        ):
+            family(name, 'counter', help_text,
+                   [(labels, round(entry[key], 6)) for labels, entry in sorted(sampled.items())])
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels, **extra):
+    route, method, status = labels
+    pairs = [('route', route), ('method', method), ('status', status), *extra.items()]
+    return ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in pairs)
+
+
+metrics = Metrics()
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    # Router patterns are regexes: 'api/properties/$'
+    return match.route.rstrip('$')
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+def server_timing(seconds, probe, render_seconds):
+    return (f'app;dur={seconds * 1000:.1f}, '
+            f'db;dur={probe.seconds * 1000:.1f};desc="{probe.count} queries, {probe.duplicates} duplicate", '
+            f'render;dur={render_seconds * 1000:.1f}')
+
+
+class InstrumentationMiddleware:
+    """
+    Opt-in (INSTRUMENTATION_ENABLED) per-request profiling. Every request is
+    counted; a random INSTRUMENTATION_SAMPLE_RATE share of them is also timed
+    end to end, in SQL and in response rendering, with its query count,
+    duplicated statements and body size. Sampled responses carry a
+    Server-Timing header; the aggregates are served by metrics_view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.1)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            response = self.get_response(request)
+            metrics.count((route_of(request), request.method, response.status_code))
+            return response
+
+        request._instrumentation_sampled = True
+        probe = QueryProbe()
+        start = time.perf_counter()
+        probe.attach()
+        try:
+            response = self.get_response(request)
+        finally:
+            probe.detach()
+        return self.finish(request, response, probe, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            response = await self.get_response(request)
+            metrics.count((route_of(request), request.method, response.status_code))
+            return response
+
+        request._instrumentation_sampled = True
+        probe = QueryProbe()
+        start = time.perf_counter()
+        await sync_to_async(probe.attach)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(probe.detach)()
+        return self.finish(request, response, probe, time.perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that step
+        if not getattr(request, '_instrumentation_sampled', False):
+            return response
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._instrumentation_render_seconds = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, probe, seconds):
+        labels = (route_of(request), request.method, response.status_code)
+        render_seconds = getattr(request, '_instrumentation_render_seconds', 0.0)
+        metrics.count(labels)
+        metrics.observe(labels, seconds, probe, render_seconds, response_size(response))
+        response['Server-Timing'] = server_timing(seconds, probe, render_seconds)
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape target, requiring `Authorization: Bearer <METRICS_TOKEN>`.
+    404 unless instrumentation is on and a token is configured, so the
+    metrics are never public.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not getattr(settings, 'INSTRUMENTATION_ENABLED', False) or not token:
+        raise Http404
+    if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
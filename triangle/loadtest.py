@@ -0,0 +1,109 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+class HTTPConnection:
+    """
+    Minimal keep-alive HTTP/1.1 client on asyncio streams, so the load
+    generator itself adds next to nothing to the measured latency.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nAccept: application/json\r\n\r\n'.encode()
+        )
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            await self.reader.read()
+            await self.close()
+        if headers.get('connection') == 'close':
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def _load(base_url, path, concurrency, duration):
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    target = url.path.rstrip('/') + path
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        nonlocal errors
+        connection = HTTPConnection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status = await connection.request(target)
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                    errors += 1
+                    await connection.close()
+                    continue
+                if status >= 400:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+def run_load(base_url, path, concurrency=50, duration=10.0):
+    """
+    Hammer `base_url + path` with `concurrency` keep-alive connections for
+    `duration` seconds; returns request count, errors, rps and p50/p99 in ms.
+    """
+    return asyncio.run(_load(base_url, path, concurrency, duration))
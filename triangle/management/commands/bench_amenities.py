@@ -0,0 +1,96 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from triangle.amenity_masks import MASK_BITS, amenity_filter, to_signed
+from triangle.benchmarks import best_of, seed_properties, throwaway_database
+from triangle.models import Amenity, Property
+
+CASES = {
+    '1 amenity': [0],
+    '3 amenities': [0, 2, 5],
+    '6 amenities': [0, 1, 3, 6, 10, 20],
+}
+
+
+def join_any(queryset, ids):
+    """The old filter: an IN over the M2M join, de-duplicated."""
+    return queryset.filter(amenities__id__in=ids).distinct()
+
+
+def join_all(queryset, ids):
+    """All-of through the M2M table: one join per amenity."""
+    for amenity_id in ids:
+        queryset = queryset.filter(amenities__id=amenity_id)
+    return queryset
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and compare amenity bitmask matching with M2M joins'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = {}
+        with throwaway_database():
+            self.stdout.write(f'Seeding {options["count"]} properties...')
+            seed_properties(options['count'], stdout=self.stdout)
+            amenities = self.seed_amenities()
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            active = Property.objects.filter(is_active=True)
+            for name, positions in CASES.items():
+                ids = [amenities[position].pk for position in positions]
+                variants = {
+                    'join any': join_any(active, ids),
+                    'mask any': active.filter(amenity_filter(ids, 'any')),
+                    'join all': join_all(active, ids),
+                    'mask all': active.filter(amenity_filter(ids, 'all')),
+                }
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {name} =='))
+                for variant, queryset in variants.items():
+                    page = queryset.order_by('-created_at', '-id')[:20]
+                    self.stdout.write(f'  {variant}: {page.explain()}')
+                    results[(name, variant)] = (
+                        queryset.count(),
+                        best_of(lambda: list(page.all()), options['repeat']),
+                        best_of(lambda: queryset.count(), options['repeat']),
+                    )
+
+        self.stdout.write('\nSummary (best of %d, ms)' % options['repeat'])
+        self.stdout.write(f'{"query":<26}{"matches":>9}{"page":>12}{"count":>12}')
+        for (name, variant), (rows, page_ms, count_ms) in results.items():
+            self.stdout.write(f'{name + ", " + variant:<26}{rows:>9}{page_ms:>12.2f}{count_ms:>12.2f}')
+
+    def seed_amenities(self, batch_size=50_000):
+        """
+        64 amenities with decaying popularity (the first on about half of the
+        listings, the last on well under 1%), written straight to the M2M
+        table and the masks, as the migration backfill would.
+        """
+        rng = random.Random(7)
+        amenities = Amenity.objects.bulk_create([Amenity(name=f'Удобство {bit}', bit=bit) for bit in range(MASK_BITS)])
+        odds = [0.5 * 0.93 ** bit for bit in range(MASK_BITS)]
+        through = Property.amenities.through._meta.db_table
+        property_table = Property._meta.db_table
+        ids = list(Property.objects.order_by('pk').values_list('pk', flat=True))
+        links = 0
+        for start in range(0, len(ids), batch_size):
+            rows, masks = [], []
+            for property_id in ids[start:start + batch_size]:
+                mask = 0
+                for bit, chance in enumerate(odds):
+                    if rng.random() < chance:
+                        rows.append((property_id, amenities[bit].pk))
+                        mask |= 1 << bit
+                masks.append((to_signed(mask), property_id))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {through} (property_id, amenity_id) VALUES (%s, %s)', rows)
+                cursor.executemany(f'UPDATE {property_table} SET amenity_mask = %s WHERE id = %s', masks)
+            links += len(rows)
+            self.stdout.write(f'  linked {min(start + batch_size, len(ids))}/{len(ids)} ({links} amenity rows)')
+        return amenities
@@ -0,0 +1,69 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from triangle.benchmarks import best_of, seed_properties, throwaway_database
+from triangle.facets import PRICE_BUCKETS, compute_facets, price_bucket_filter
+from triangle.models import Amenity, Category, Property
+
+
+def naive_facets(filters):
+    """One COUNT per facet value, the way the UI does it by calling PropertyFilterView repeatedly."""
+    base = Property.objects.filter(filters)
+    counts = {'total': base.count()}
+    for code, _ in Property.PROPERTY_TYPES:
+        counts[f'type_{code}'] = base.filter(property_type=code).count()
+    for i, (low, high) in enumerate(PRICE_BUCKETS):
+        counts[f'price_{i}'] = base.filter(price_bucket_filter(low, high)).count()
+    for field in ('rooms', 'bedrooms'):
+        for value in base.order_by().values_list(field, flat=True).distinct():
+            counts[f'{field}_{value}'] = base.filter(**{field: value}).count()
+    for category in Category.objects.all():
+        counts[f'category_{category.pk}'] = base.filter(category=category).count()
+    for amenity in Amenity.objects.all():
+        counts[f'amenity_{amenity.pk}'] = base.filter(amenities=amenity).count()
+    return counts
+
+
+class Command(BaseCommand):
+    help = 'Compare the aggregate facet queries with the naive per-facet-value COUNT approach'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100_000)
+        parser.add_argument('--amenities', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.stdout.write(f'Seeding {options["count"]} properties...')
+            seed_properties(options['count'], stdout=self.stdout)
+            self.seed_amenities(options['amenities'])
+
+            scenarios = {
+                'no filter': Q(is_active=True),
+                'apartments 50k-200k': Q(is_active=True, property_type='apartment',
+                                         price__gte=50_000, price__lte=200_000),
+            }
+            self.stdout.write(f'\n{"scenario":<22}{"approach":<12}{"queries":>9}{"ms":>12}')
+            for name, filters in scenarios.items():
+                for label, func in (('aggregate', compute_facets), ('naive', naive_facets)):
+                    with CaptureQueriesContext(connection) as ctx:
+                        func(filters)
+                    elapsed = best_of(lambda: func(filters), options['repeat'])
+                    self.stdout.write(f'{name:<22}{label:<12}{len(ctx.captured_queries):>9}{elapsed:>12.1f}')
+
+    def seed_amenities(self, count):
+        rng = random.Random(7)
+        amenities = Amenity.objects.bulk_create([Amenity(name=f'Удобство {i}') for i in range(count)])
+        through = Property.amenities.through
+        rows = []
+        for pk in Property.objects.values_list('pk', flat=True).iterator():
+            for amenity in rng.sample(amenities, rng.randint(0, min(5, count))):
+                rows.append(through(property_id=pk, amenity_id=amenity.pk))
+            if len(rows) >= 20_000:
+                through.objects.bulk_create(rows)
+                rows = []
+        through.objects.bulk_create(rows)
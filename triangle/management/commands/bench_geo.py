@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from triangle import geo
+from triangle.benchmarks import best_of, seed_properties, throwaway_database
+from triangle.models import Property
+
+CENTER = (42.8746, 74.5698)
+
+
+def plain_nearby(queryset, latitude, longitude, radius_km):
+    """nearby() without the geohash prefix ranges: lat/lng box and distance only."""
+    south, west, north, east = geo.box_around(latitude, longitude, radius_km)
+    limit = (radius_km / geo.KM_PER_DEGREE) ** 2
+    return queryset.filter(Q(latitude__range=(south, north), longitude__range=(west, east))).alias(
+        distance_sq=geo.distance_sq_expression(latitude, longitude),
+    ).filter(distance_sq__lte=limit).annotate(distance=geo.distance_km_expression(latitude, longitude))
+
+
+def plain_in_bounds(queryset, south, west, north, east):
+    return queryset.filter(latitude__range=(south, north), longitude__range=(west, east)).annotate(
+        distance=geo.distance_km_expression((south + north) / 2, (west + east) / 2),
+    )
+
+
+def benchmark_queries():
+    active = Property.objects.filter(is_active=True)
+    viewport = (42.86, 74.55, 42.89, 74.60)
+    # Outside Bishkek, where only the sparse country-wide listings are
+    rural = (41.40, 75.90, 41.50, 76.05)
+    nearest, newest = ('distance', 'id'), ('-created_at', '-id')
+    cases = {
+        'nearby 1 km': (geo.nearby, plain_nearby, (*CENTER, 1), nearest),
+        'nearby 2 km': (geo.nearby, plain_nearby, (*CENTER, 2), nearest),
+        'nearby 3 km': (geo.nearby, plain_nearby, (*CENTER, 3), nearest),
+        'nearby 5 km': (geo.nearby, plain_nearby, (*CENTER, 5), nearest),
+        'nearby 50 km': (geo.nearby, plain_nearby, (*CENTER, 50), nearest),
+        'in-bounds viewport': (geo.in_bounds, plain_in_bounds, viewport, newest),
+        'in-bounds rural': (geo.in_bounds, plain_in_bounds, rural, newest),
+    }
+    return {
+        name: (indexed(active, *args), plain(active, *args), ordering)
+        for name, (indexed, plain, args, ordering) in cases.items()
+    }
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and compare geohash-indexed geo queries with plain lat/lng ranges'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = {}
+        with throwaway_database():
+            self.stdout.write(f'Seeding {options["count"]} properties...')
+            seed_properties(options['count'], stdout=self.stdout)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            for name, (indexed_all, plain_all, ordering) in benchmark_queries().items():
+                indexed = indexed_all.order_by(*ordering)[:20]
+                plain = plain_all.order_by(*ordering)[:20]
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {name} =='))
+                self.stdout.write(f'  geohash: {indexed.explain()}')
+                self.stdout.write(f'  plain:   {plain.explain()}')
+                results[name] = (
+                    indexed_all.count(),
+                    best_of(lambda: list(indexed.all()), options['repeat']),
+                    best_of(lambda: list(plain.all()), options['repeat']),
+                )
+
+        self.stdout.write('\nSummary (first page of 20, best of %d, ms)' % options['repeat'])
+        self.stdout.write(f'{"query":<22}{"matches":>9}{"geohash":>12}{"plain":>12}')
+        for name, (rows, indexed_ms, plain_ms) in results.items():
+            self.stdout.write(f'{name:<22}{rows:>9}{indexed_ms:>12.2f}{plain_ms:>12.2f}')
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from triangle.benchmarks import best_of, seed_properties, throwaway_database
+from triangle.models import Property
+
+
+def benchmark_queries():
+    active = Property.objects.filter(is_active=True)
+    return {
+        'list first page': active.order_by('-created_at', '-id')[:20],
+        'list count': active,
+        'type + price range': active.filter(
+            property_type='apartment', price__gte=50000, price__lte=150000,
+        ).order_by('-created_at', '-id')[:20],
+        'area range': active.filter(area__gte=60, area__lte=80).order_by('-created_at', '-id')[:20],
+        'rooms + bedrooms': active.filter(rooms=3, bedrooms=2).order_by('-created_at', '-id')[:20],
+        'featured': Property.objects.filter(is_featured=True, is_active=True).order_by('-created_at')[:20],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and compare Property query plans and timings with and without indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.stdout.write(f'Seeding {options["count"]} properties...')
+            seed_properties(options['count'], stdout=self.stdout)
+            self.analyze()
+
+            with_indexes = self.run('with indexes', options['repeat'])
+            with connection.schema_editor() as editor:
+                for index in Property._meta.indexes:
+                    editor.remove_index(Property, index)
+            self.analyze()
+            without_indexes = self.run('without indexes', options['repeat'])
+
+        self.stdout.write('\nSummary (best of %d, ms)' % options['repeat'])
+        self.stdout.write(f'{"query":<22}{"indexed":>12}{"no index":>12}')
+        for name in with_indexes:
+            self.stdout.write(f'{name:<22}{with_indexes[name]:>12.2f}{without_indexes[name]:>12.2f}')
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def run(self, label, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n== {label} =='))
+        timings = {}
+        for name, queryset in benchmark_queries().items():
+            if name == 'list count':
+                plan = queryset.order_by().explain()
+                timings[name] = best_of(lambda: queryset.count(), repeat)
+            else:
+                plan = queryset.explain()
+                timings[name] = best_of(lambda: list(queryset.all()), repeat)
+            self.stdout.write(f'{name}: {timings[name]:.2f} ms')
+            self.stdout.write(f'  {plan}')
+        return timings
@@ -0,0 +1,44 @@
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from triangle import renderers
+from triangle.benchmarks import best_of, seed_properties, throwaway_database
+from triangle.models import Property
+from triangle.renderers import FastJSONParser, FastJSONRenderer
+from triangle.serializers import PropertySerializer
+
+
+class Command(BaseCommand):
+    help = 'Time rendering and parsing serialized properties with DRF JSON, stdlib fallback and orjson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.stdout.write(f'Seeding {options["count"]} properties...')
+            seed_properties(options['count'])
+            data = PropertySerializer(Property.objects.for_listing(), many=True).data
+
+        backends = [
+            ('drf', JSONRenderer, JSONParser, 'stdlib'),
+            ('fast/stdlib', FastJSONRenderer, FastJSONParser, 'stdlib'),
+        ]
+        if renderers.orjson is not None:
+            backends.append(('fast/orjson', FastJSONRenderer, FastJSONParser, 'orjson'))
+        else:
+            self.stdout.write(self.style.WARNING('orjson is not installed; only the stdlib paths are measured'))
+
+        self.stdout.write(f'\n{"renderer":<14}{"render ms":>12}{"parse ms":>12}{"MB":>8}')
+        for label, renderer_class, parser_class, backend in backends:
+            with override_settings(FAST_JSON_BACKEND=backend):
+                renderer, parser = renderer_class(), parser_class()
+                body = renderer.render(data)
+                render_ms = best_of(lambda: renderer.render(data), options['repeat'])
+                parse_ms = best_of(lambda: parser.parse(BytesIO(body)), options['repeat'])
+            self.stdout.write(f'{label:<14}{render_ms:>12.1f}{parse_ms:>12.1f}{len(body) / 1_000_000:>8.2f}')
@@ -0,0 +1,56 @@
+import random
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+
+from triangle.suggest import PrefixIndex
+
+STREETS = ['Киевская', 'Московская', 'Чуй', 'Токтогула', 'Ахунбаева', 'Манаса', 'Исанова', 'Боконбаева',
+           'Советская', 'Абдрахманова', 'Жибек Жолу', 'Фрунзе', 'Горького', 'Льва Толстого', 'Ибраимова']
+CITIES = ['Бишкек', 'Ош', 'Каракол', 'Джалал-Абад', 'Токмок', 'Нарын', 'Чолпон-Ата']
+KINDS = ['квартира', 'дом', 'коттедж', 'офис', 'участок', 'студия', 'пентхаус', 'таунхаус']
+ADJECTIVES = ['Уютная', 'Просторная', 'Новая', 'Светлая', 'Элитная', 'Срочно', 'Видовая', 'Тихая']
+
+
+class Command(BaseCommand):
+    help = 'Measure build time and lookup latency of the typeahead prefix index on synthetic listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1_000_000)
+        parser.add_argument('--lookups', type=int, default=20_000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        rows = [
+            (pk,
+             f'{rng.choice(ADJECTIVES)} {rng.choice(KINDS)} {rng.randint(1, 5)}-комн. {rng.randint(20, 300)} м² #{pk}',
+             f'{rng.choice(CITIES)}, ул. {rng.choice(STREETS)} {rng.randint(1, 300)}')
+            for pk in range(1, options['count'] + 1)
+        ]
+
+        index = PrefixIndex()
+        start = time.perf_counter()
+        index.build(rows)
+        self.stdout.write(f'Built index over {options["count"]} listings in {time.perf_counter() - start:.1f} s')
+
+        words = [word for _, title, address in rows[:1000] for word in (title + ' ' + address).split()]
+        timings = []
+        for _ in range(options['lookups']):
+            word = rng.choice(words)
+            prefix = word[:rng.randint(1, len(word))]
+            start = time.perf_counter()
+            index.suggest(prefix)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for pk, title, address in rows[:1000]:
+            index.update(pk, title + ' обновлено', address)
+        update_ms = (time.perf_counter() - start)
+
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[int(len(timings) * 0.99)]
+        self.stdout.write(f'suggest: p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {timings[-1]:.3f} ms')
+        self.stdout.write(f'update: {update_ms:.3f} ms per row')
+        self.stdout.write(f'peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from triangle.images import refresh_variants
+from triangle.signals import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Generate missing or outdated thumbnails and WebP/AVIF variants for stored images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Try again for images whose source could not be read before')
+
+    def handle(self, *args, **options):
+        for model, (field_name, kind) in IMAGE_FIELDS.items():
+            updated = 0
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for instance in queryset.iterator(chunk_size=200):
+                if refresh_variants(instance, field_name, kind, options['retry_failed']):
+                    updated += 1
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {updated} updated')
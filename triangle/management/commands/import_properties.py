@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from triangle.importers import IMPORT_FORMATS, detect_format, import_properties, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import properties from a CSV or JSON file in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        if not fmt:
+            raise CommandError('Cannot tell the file format, pass --format')
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                rows = read_rows(fileobj, fmt)
+        except (OSError, ValueError, UnicodeDecodeError) as exc:
+            raise CommandError(f'Cannot read {options["path"]}: {exc}')
+
+        def report(batch):
+            self.stdout.write(
+                f'batch {batch["batch"]:>4}: {batch["created"]}/{batch["rows"]} rows, '
+                f'validate {batch["validate_ms"]:.1f} ms, write {batch["write_ms"]:.1f} ms'
+            )
+
+        result = import_properties(rows, batch_size=max(1, options['batch_size']), on_batch=report)
+        for error in result['errors'][:20]:
+            self.stderr.write(f'row {error["row"]}: {error["errors"]}')
+        if len(result['errors']) > 20:
+            self.stderr.write(f'... and {len(result["errors"]) - 20} more invalid rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result["created"]} of {len(rows)} properties, {len(result["errors"])} skipped'
+        ))
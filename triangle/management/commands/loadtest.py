@@ -0,0 +1,104 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from triangle.loadtest import run_load
+
+DEFAULT_PATHS = [
+    '/api/properties/',
+    '/api/properties/1/',
+    '/api/properties/featured/',
+    '/api/properties/search/?q=%D0%BA%D0%B2%D0%B0%D1%80%D1%82%D0%B8%D1%80%D0%B0',
+    '/api/banners/',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/s and p99 latency of the WSGI (gunicorn) and ASGI (uvicorn) deployments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', default=[], metavar='NAME=URL',
+                            help='Already running server to test, e.g. wsgi=http://127.0.0.1:8000')
+        parser.add_argument('--serve', action='store_true',
+                            help='Start gunicorn and uvicorn against the current database and test both')
+        parser.add_argument('--wsgi-port', type=int, default=8101)
+        parser.add_argument('--asgi-port', type=int, default=8102)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+        parser.add_argument('--path', action='append', default=[], help=f'Defaults to {DEFAULT_PATHS}')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per path and target')
+        parser.add_argument('--warmup', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError(f'Expected NAME=URL, got {target!r}')
+            targets.append((name, url))
+
+        servers = []
+        if options['serve']:
+            servers = self.start_servers(options)
+            targets += [('wsgi', f'http://127.0.0.1:{options["wsgi_port"]}'),
+                        ('asgi', f'http://127.0.0.1:{options["asgi_port"]}')]
+        if not targets:
+            raise CommandError('Pass --serve or at least one --target')
+
+        try:
+            self.stdout.write(f'{"target":<6} {"path":<40} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+            for path in options['path'] or DEFAULT_PATHS:
+                for name, url in targets:
+                    if options['warmup']:
+                        run_load(url, path, options['concurrency'], options['warmup'])
+                    result = run_load(url, path, options['concurrency'], options['duration'])
+                    self.stdout.write(
+                        f'{name:<6} {path[:40]:<40} {result["rps"]:>9.1f} {result["p50_ms"]:>8.1f} '
+                        f'{result["p99_ms"]:>8.1f} {result["errors"]:>7}'
+                    )
+        finally:
+            for server in servers:
+                server.terminate()
+                server.wait(timeout=10)
+
+    def start_servers(self, options):
+        env = {**os.environ, 'DEBUG': 'False'}
+        commands = [
+            (options['wsgi_port'], {}, [
+                sys.executable, '-m', 'gunicorn', 'core.wsgi:application',
+                '--bind', f'127.0.0.1:{options["wsgi_port"]}', '--workers', str(options['workers']),
+                '--threads', str(options['threads']), '--log-level', 'warning',
+            ]),
+            # The async views are opt-in; the ASGI server is what they are measured on
+            (options['asgi_port'], {'ASYNC_READ_VIEWS': 'True'}, [
+                sys.executable, '-m', 'uvicorn', 'core.asgi:application',
+                '--host', '127.0.0.1', '--port', str(options['asgi_port']), '--workers', str(options['workers']),
+                '--log-level', 'warning', '--no-access-log',
+            ]),
+        ]
+        servers = []
+        try:
+            for port, extra_env, command in commands:
+                servers.append(subprocess.Popen(command, cwd=settings.BASE_DIR, env={**env, **extra_env}))
+                self.wait_for_port(port)
+        except Exception:
+            for server in servers:
+                server.terminate()
+            raise
+        return servers
+
+    def wait_for_port(self, port, timeout=20.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'Server on port {port} did not start within {timeout:.0f}s')
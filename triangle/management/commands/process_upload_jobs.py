@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from triangle.tasks import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Process queued image uploads (use with UPLOAD_QUEUE_MODE=worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--stale-after', type=int, default=10,
+                            help='Requeue jobs stuck in "running" for this many minutes')
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+            stale_after=timedelta(minutes=options['stale_after']),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} upload jobs'))
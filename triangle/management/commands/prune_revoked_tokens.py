@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from triangle.revocation import revocations
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked-token entries whose tokens have expired; revoking also does this hourly'
+
+    def handle(self, *args, **options):
+        pruned = revocations.prune()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} expired revoked tokens'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from triangle.cards import refresh_cards
+from triangle.models import Property
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized card_data of every property'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        ids = list(Property.objects.values_list('pk', flat=True))
+        refresh_cards(ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(ids)} property cards'))
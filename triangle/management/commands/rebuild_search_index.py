@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from triangle.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the property full-text search index from scratch'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt ({type(backend).__name__})'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from triangle.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recount PropertyCounter from the property table and fix any drift'
+
+    def handle(self, *args, **options):
+        drift = reconcile()
+        for segment, (stored_count, stored_total), (count, total) in drift:
+            self.stdout.write(f'{"/".join(map(str, segment))}: count {stored_count} -> {count}, '
+                              f'total {stored_total} -> {total}')
+        self.stdout.write(self.style.SUCCESS(f'Fixed {len(drift)} counters' if drift else 'Counters are in sync'))
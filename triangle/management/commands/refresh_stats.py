@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from triangle.stats import prune_snapshots, take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Store a fresh admin dashboard stats snapshot; run it from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=90,
+                            help='Delete snapshots older than this many days')
+
+    def handle(self, *args, **options):
+        snapshot = take_snapshot()
+        pruned = prune_snapshots(options['keep_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored stats snapshot #{snapshot.pk} ({snapshot.data["total_properties"]} properties), '
+            f'pruned {pruned} old snapshots'
+        ))
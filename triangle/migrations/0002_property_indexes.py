@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='prop_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['property_type', 'price'], name='prop_active_type_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price'], name='prop_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['area'], name='prop_active_area_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rooms', 'bedrooms'], name='prop_active_rooms_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_featured', True)), fields=['-created_at'], name='prop_featured_created_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        from triangle.search import stem_text
+
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS triangle_property_fts "
+            "USING fts5(title, description, address, tokenize='unicode61 remove_diacritics 2')"
+        )
+        Property = apps.get_model('triangle', 'Property')
+        for pk, title, description, address in Property.objects.values_list(
+                'id', 'title', 'description', 'address').iterator():
+            schema_editor.execute(
+                'INSERT INTO triangle_property_fts (rowid, title, description, address) VALUES (%s, %s, %s, %s)',
+                [pk, stem_text(title), stem_text(description), stem_text(address)],
+            )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS prop_search_gin_idx ON triangle_property USING GIN ("
+            "(to_tsvector('russian', coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || "
+            "coalesce(address, ''))))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS triangle_property_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS prop_search_gin_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0002_property_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertySearchDocument',
+            fields=[
+                ('property', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='triangle.property')),
+                ('title', models.TextField()),
+                ('description', models.TextField()),
+                ('address', models.TextField()),
+            ],
+            options={
+                'db_table': 'triangle_property_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0003_property_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+        migrations.AddField(
+            model_name='banner',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+        migrations.AddField(
+            model_name='propertyimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Варианты изображения'),
+        ),
+    ]
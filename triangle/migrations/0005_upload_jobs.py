@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Обрабатывается'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('files', models.JSONField(default=list, verbose_name='Загруженные файлы')),
+                ('set_main', models.BooleanField(default=False, verbose_name='Первое фото главное')),
+                ('images', models.JSONField(default=list, verbose_name='Созданные фотографии')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало обработки')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание обработки')),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_jobs', to='triangle.property', verbose_name='Объект')),
+            ],
+            options={
+                'verbose_name': 'Задача загрузки',
+                'verbose_name_plural': 'Задачи загрузки',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='uploadjob_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:20
+
+from django.db import migrations, models
+
+
+def build_cards(apps, schema_editor):
+    from triangle.cards import build_card
+
+    Property = apps.get_model('triangle', 'Property')
+    PropertyImage = apps.get_model('triangle', 'PropertyImage')
+    main_images = {}
+    for property_id, image in PropertyImage.objects.filter(is_main=True).order_by('-uploaded_at').values_list(
+            'property_id', 'image'):
+        main_images[property_id] = image
+
+    batch = []
+    for property_obj in Property.objects.select_related('category').iterator(chunk_size=500):
+        category_name = property_obj.category.name if property_obj.category else None
+        property_obj.card_data = build_card(property_obj, category_name, main_images.get(property_obj.pk))
+        batch.append(property_obj)
+        if len(batch) >= 500:
+            Property.objects.bulk_update(batch, ['card_data'])
+            batch = []
+    if batch:
+        Property.objects.bulk_update(batch, ['card_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0005_upload_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='card_data',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Данные карточки'),
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
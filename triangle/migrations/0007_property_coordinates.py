@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:26
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0006_property_cards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='geohash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=12, verbose_name='Геохеш'),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)], verbose_name='Широта'),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)], verbose_name='Долгота'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['geohash'], name='prop_geohash_idx'),
+        ),
+    ]
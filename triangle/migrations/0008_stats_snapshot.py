@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0007_property_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(verbose_name='Данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Снимок статистики',
+                'verbose_name_plural': 'Снимки статистики',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
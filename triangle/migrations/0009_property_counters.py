@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:45
+
+from django.db import migrations, models
+
+
+def count_properties(apps, schema_editor):
+    Property = apps.get_model('triangle', 'Property')
+    PropertyCounter = apps.get_model('triangle', 'PropertyCounter')
+    rows = Property.objects.order_by().values('property_type', 'is_active', 'is_featured') \
+        .annotate(count=models.Count('id'), total_price=models.Sum('price'))
+    PropertyCounter.objects.bulk_create([PropertyCounter(**row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0008_stats_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('property_type', models.CharField(choices=[('apartment', 'Квартира'), ('house', 'Дом'), ('villa', 'Вилла'), ('commercial', 'Коммерческое'), ('land', 'Участок'), ('office', 'Офис')], max_length=20, verbose_name='Тип недвижимости')),
+                ('is_active', models.BooleanField(verbose_name='Активно')),
+                ('is_featured', models.BooleanField(verbose_name='Рекомендуемое')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Количество')),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Сумма цен')),
+            ],
+            options={
+                'verbose_name': 'Счётчик объектов',
+                'verbose_name_plural': 'Счётчики объектов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='propertycounter',
+            constraint=models.UniqueConstraint(fields=('property_type', 'is_active', 'is_featured'), name='property_counter_segment_uniq'),
+        ),
+        migrations.RunPython(count_properties, migrations.RunPython.noop),
+    ]
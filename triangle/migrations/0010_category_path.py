@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:49
+
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    Category = apps.get_model('triangle', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def path_of(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = (path_of(parent_id) if parent_id else '') + f'{pk}/'
+        return paths[pk]
+
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.path = path_of(category.pk)
+    Category.objects.bulk_update(categories, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0009_property_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255, verbose_name='Путь'),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:51
+
+from django.db import migrations, models
+
+MASK_BITS = 64
+
+
+def build_masks(apps, schema_editor):
+    Amenity = apps.get_model('triangle', 'Amenity')
+    Property = apps.get_model('triangle', 'Property')
+
+    amenities = list(Amenity.objects.order_by('id')[:MASK_BITS])
+    for bit, amenity in enumerate(amenities):
+        amenity.bit = bit
+    Amenity.objects.bulk_update(amenities, ['bit'], batch_size=500)
+
+    masks = {}
+    rows = Property.amenities.through.objects.filter(amenity__bit__isnull=False) \
+        .values_list('property_id', 'amenity__bit')
+    for property_id, bit in rows.iterator():
+        masks[property_id] = masks.get(property_id, 0) | 1 << bit
+    by_mask = {}
+    for property_id, mask in masks.items():
+        # Stored as a signed 64-bit integer
+        if mask >= 1 << (MASK_BITS - 1):
+            mask -= 1 << MASK_BITS
+        by_mask.setdefault(mask, []).append(property_id)
+    for mask, ids in by_mask.items():
+        for start in range(0, len(ids), 500):
+            Property.objects.filter(pk__in=ids[start:start + 500]).update(amenity_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0010_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='amenity',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, unique=True, verbose_name='Бит в маске'),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='amenity_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска удобств'),
+        ),
+        migrations.RunPython(build_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:05
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+def fill_price_per_m2(apps, schema_editor):
+    Property = apps.get_model('triangle', 'Property')
+    batch = []
+    for property_obj in Property.objects.only('id', 'price', 'area', 'card_data').iterator(chunk_size=500):
+        value = None
+        if property_obj.area and property_obj.area > 0:
+            value = (property_obj.price / property_obj.area).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        property_obj.price_per_m2 = value
+        property_obj.card_data['price_per_m2'] = str(value) if value is not None else None
+        batch.append(property_obj)
+        if len(batch) >= 500:
+            Property.objects.bulk_update(batch, ['price_per_m2', 'card_data'])
+            batch = []
+    if batch:
+        Property.objects.bulk_update(batch, ['price_per_m2', 'card_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0011_amenity_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='price_per_m2',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=15, null=True, verbose_name='Цена за м² ($)'),
+        ),
+        # Before the index, so the backfill doesn't maintain it row by row
+        migrations.RunPython(fill_price_per_m2, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price_per_m2'], name='prop_active_ppm2_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('triangle', '0012_property_price_per_m2'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=255, unique=True, verbose_name='Идентификатор токена')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Истекает')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата отзыва')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Отозванный токен',
+                'verbose_name_plural': 'Отозванные токены',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0013_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['latitude', 'longitude'], name='prop_active_lat_lng_idx'),
+        ),
+    ]
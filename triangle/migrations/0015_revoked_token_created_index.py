@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('triangle', '0014_property_lat_lng_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='revokedtoken',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата отзыва'),
+        ),
+    ]
@@ -1,12 +1,32 @@
-from django.db import models
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.core.validators import MinValueValidator
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db.models import Subquery, Value
+from django.db.models.functions import Concat
+
+
+# Sorts after the digits and '/' of every path, closing the range of a subtree
+PATH_END = '~'
+
+
+class CategoryQuerySet(models.QuerySet):
+    def subtree(self, pk):
+        """The category and all its descendants: one range scan on the path index."""
+        root_path = Category.objects.filter(pk=pk).values('path')[:1]
+        return self.filter(path__gte=Subquery(root_path), path__lt=Concat(Subquery(root_path), Value(PATH_END)))
 
 
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название категории")
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True,
                                verbose_name="Родительская категория")
+    # Materialized path of ids from the root, e.g. '1/5/'; maintained by triangle.signals
+    path = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True,
+                            verbose_name="Путь")
+
+    objects = CategoryQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -19,6 +39,10 @@ class Category(models.Model):
 class Amenity(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название")
     icon = models.CharField(max_length=50, blank=True, verbose_name="Иконка")
+    # Position in Property.amenity_mask, assigned by triangle.signals; the
+    # 65th and later amenities get none and are matched through the M2M table
+    bit = models.PositiveSmallIntegerField(null=True, blank=True, unique=True, editable=False,
+                                           verbose_name="Бит в маске")
 
     def __str__(self):
         return self.name
@@ -28,6 +52,65 @@ class Amenity(models.Model):
         verbose_name_plural = "Удобства"
 
 
+def price_per_m2(price, area):
+    """Price per square meter rounded to cents; None without a positive area."""
+    try:
+        if price is None or not area or Decimal(area) <= 0:
+            return None
+        return (Decimal(price) / Decimal(area)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+class PropertyQuerySet(models.QuerySet):
+    def for_listing(self, fields=None, expand=None):
+        """
+        Queryset for PropertySerializer. With the parsed ?fields=/?expand=
+        sets, relations that aren't rendered are neither joined nor
+        prefetched, ones rendered as ids only read ids, and just the
+        requested columns are selected.
+        """
+        if fields is None and expand is None:
+            return self.select_related('category').prefetch_related(
+                models.Prefetch('images', queryset=PropertyImage.objects.all()),
+                models.Prefetch('amenities', queryset=Amenity.objects.all()),
+            )
+
+        expand = expand or set()
+        shown = fields if fields is not None else {'images', 'amenities', 'category', 'main_image'}
+        queryset = self
+        if fields is not None:
+            columns = {'id', 'created_at'}
+            for field in self.model._meta.concrete_fields:
+                if field.name in fields:
+                    columns.add(field.attname)
+            queryset = queryset.only(*columns)
+
+        if 'category' in shown and 'category' in expand:
+            queryset = queryset.select_related('category')
+
+        wants_main = bool(shown & {'main_image', 'main_image_srcset'})
+        if 'images' in shown:
+            images = PropertyImage.objects.all()
+            if 'images' not in expand and not wants_main:
+                images = images.only('id', 'property_id')
+            queryset = queryset.prefetch_related(models.Prefetch('images', queryset=images))
+        elif wants_main:
+            queryset = queryset.prefetch_related(
+                models.Prefetch('images', queryset=PropertyImage.objects.filter(is_main=True))
+            )
+
+        if 'amenities' in shown:
+            amenities = Amenity.objects.all() if 'amenities' in expand else Amenity.objects.only('id')
+            queryset = queryset.prefetch_related(models.Prefetch('amenities', queryset=amenities))
+        return queryset
+
+    def for_cards(self):
+        # Everything a card needs lives in card_data; created_at and id are
+        # kept for the keyset cursor
+        return self.only('id', 'created_at', 'card_data')
+
+
 class Property(models.Model):
     PROPERTY_TYPES = [
         ('apartment', 'Квартира'),
@@ -55,20 +138,106 @@ class Property(models.Model):
     garage_spaces = models.IntegerField(verbose_name="Мест в гараже", default=0)
 
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Категория")
+    latitude = models.FloatField(null=True, blank=True, verbose_name="Широта",
+                                 validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, verbose_name="Долгота",
+                                  validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # price / area, kept in sync by triangle.signals so listings can be sorted
+    # and filtered by it on an index
+    price_per_m2 = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, editable=False,
+                                       verbose_name="Цена за м² ($)")
+    # Kept in sync with latitude/longitude by triangle.signals; empty without coordinates
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False, verbose_name="Геохеш")
     amenities = models.ManyToManyField(Amenity, blank=True, verbose_name="Удобства")
+    # One bit per Amenity.bit, kept in sync with `amenities` by triangle.signals
+    amenity_mask = models.BigIntegerField(default=0, editable=False, verbose_name="Маска удобств")
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
     is_active = models.BooleanField(default=True, verbose_name="Активно")
     is_featured = models.BooleanField(default=False, verbose_name="Рекомендуемое")
+    card_data = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Данные карточки")
+
+    objects = PropertyQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.title} - ${self.price}"
 
+    # One transaction with the post_save/post_delete receivers, so the
+    # PropertyCounter deltas commit or roll back together with the row
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     class Meta:
         verbose_name = "Объект недвижимости"
         verbose_name_plural = "Объекты недвижимости"
         ordering = ['-created_at']
+        # Public endpoints only ever read active listings, so the indexes are
+        # partial on is_active: smaller, and usable for ORDER BY ... LIMIT
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='prop_active_created_idx',
+                         condition=models.Q(is_active=True)),
+            models.Index(fields=['property_type', 'price'], name='prop_active_type_price_idx',
+                         condition=models.Q(is_active=True)),
+            models.Index(fields=['price'], name='prop_active_price_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['area'], name='prop_active_area_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['price_per_m2'], name='prop_active_ppm2_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['rooms', 'bedrooms'], name='prop_active_rooms_idx',
+                         condition=models.Q(is_active=True)),
+            models.Index(fields=['-created_at'], name='prop_featured_created_idx',
+                         condition=models.Q(is_featured=True, is_active=True)),
+            # Map queries turn a box into a handful of geohash prefix ranges.
+            # Not partial: SQLite only runs an OR of ranges as a MULTI-INDEX OR
+            # when every branch implies the index condition on its own.
+            models.Index(fields=['geohash'], name='prop_geohash_idx'),
+            # Boxes too large for the geohash prefix ranges; partial, as the
+            # map endpoints only read active listings
+            models.Index(fields=['latitude', 'longitude'], name='prop_active_lat_lng_idx',
+                         condition=models.Q(is_active=True)),
+        ]
+
+
+class PropertyCounter(models.Model):
+    """
+    Running count and price total of the properties in one (type, active,
+    featured) segment, maintained on write by triangle.counters. Dashboard
+    totals are sums over these few rows.
+    """
+    property_type = models.CharField(max_length=20, choices=Property.PROPERTY_TYPES,
+                                     verbose_name="Тип недвижимости")
+    is_active = models.BooleanField(verbose_name="Активно")
+    is_featured = models.BooleanField(verbose_name="Рекомендуемое")
+    count = models.BigIntegerField(default=0, verbose_name="Количество")
+    total_price = models.DecimalField(max_digits=20, decimal_places=2, default=0, verbose_name="Сумма цен")
+
+    def __str__(self):
+        return f"{self.property_type} / {self.is_active} / {self.is_featured}: {self.count}"
+
+    class Meta:
+        verbose_name = "Счётчик объектов"
+        verbose_name_plural = "Счётчики объектов"
+        constraints = [
+            models.UniqueConstraint(fields=['property_type', 'is_active', 'is_featured'],
+                                    name='property_counter_segment_uniq'),
+        ]
+
+
+class PropertySearchDocument(models.Model):
+    """Row of the SQLite FTS5 index maintained by triangle.search (rowid = property id)."""
+    property = models.OneToOneField(Property, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                    related_name='search_document')
+    title = models.TextField()
+    description = models.TextField()
+    address = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'triangle_property_fts'
 
 
 class PropertyImage(models.Model):
@@ -76,6 +245,7 @@ class PropertyImage(models.Model):
     image = models.ImageField(upload_to='properties/%Y/%m/%d/', verbose_name="Фотография")
     is_main = models.BooleanField(default=False, verbose_name="Главное фото")
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
+    variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
 
     def __str__(self):
         return f"Фото для {self.property.title}"
@@ -86,10 +256,42 @@ class PropertyImage(models.Model):
         ordering = ['-is_main', 'uploaded_at']
 
 
+class UploadJob(models.Model):
+    STATUSES = [
+        ('pending', 'В очереди'),
+        ('running', 'Обрабатывается'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='upload_jobs',
+                                 verbose_name="Объект")
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending', verbose_name="Статус")
+    files = models.JSONField(default=list, verbose_name="Загруженные файлы")
+    set_main = models.BooleanField(default=False, verbose_name="Первое фото главное")
+    images = models.JSONField(default=list, verbose_name="Созданные фотографии")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало обработки")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Окончание обработки")
+
+    def __str__(self):
+        return f"Загрузка #{self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Задача загрузки"
+        verbose_name_plural = "Задачи загрузки"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='uploadjob_pending_idx', condition=models.Q(status='pending')),
+        ]
+
+
 class Activity(models.Model):
     title = models.CharField(max_length=255, verbose_name="Заголовок")
     content = models.TextField(verbose_name="Содержание")
     image = models.ImageField(upload_to='activities/%Y/%m/%d/', null=True, blank=True, verbose_name="Изображение")
+    variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -106,6 +308,7 @@ class Banner(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
     description = models.TextField(verbose_name="Описание", blank=True)
     image = models.ImageField(upload_to='banners/', verbose_name="Изображение")
+    variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
     link = models.CharField(max_length=500, blank=True, verbose_name="Ссылка")
     is_active = models.BooleanField(default=True, verbose_name="Активно")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
@@ -119,10 +322,40 @@ class Banner(models.Model):
         ordering = ['-created_at']
 
 
+class StatsSnapshot(models.Model):
+    data = models.JSONField(verbose_name="Данные")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Дата создания")
+
+    def __str__(self):
+        return f"Статистика на {self.created_at:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        verbose_name = "Снимок статистики"
+        verbose_name_plural = "Снимки статистики"
+        ordering = ['-created_at']
+
+
+class RevokedToken(models.Model):
+    """A revoked JWT, kept until it would have expired anyway; see triangle.revocation."""
+    jti = models.CharField(max_length=255, unique=True, verbose_name="Идентификатор токена")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Пользователь")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Истекает")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Дата отзыва")
+
+    def __str__(self):
+        return self.jti
+
+    class Meta:
+        verbose_name = "Отозванный токен"
+        verbose_name_plural = "Отозванные токены"
+        ordering = ['-created_at']
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name="Пользователь")
     phone = models.CharField(max_length=20, blank=True, verbose_name="Телефон")
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True, verbose_name="Аватар")
+    variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
     position = models.CharField(max_length=100, default="Админ", verbose_name="Должность")
 
     def __str__(self):
@@ -0,0 +1,180 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .renderers import dumps
+
+
+def encode_cursor(values):
+    def prepare(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    payload = json.dumps([prepare(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise NotFound('Неверный курсор')
+    if not isinstance(values, list) or len(values) != length:
+        raise NotFound('Неверный курсор')
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the "strictly after" condition for a composite key, e.g. for
+    ('-created_at', '-id'): created_at < t OR (created_at = t AND id < pk).
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        clause = Q(**{f'{name}__{lookup}': values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            clause &= Q(**{previous.lstrip('-'): value})
+        condition |= clause
+    return condition
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a composite ordering. Unlike OFFSET, the
+    cost of a page does not depend on how deep it is: every next page is an
+    index range starting right after the last row of the previous one.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', None) or self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.current_ordering = self.get_ordering(view)
+        self.current_page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.current_ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = decode_cursor(cursor, len(self.current_ordering))
+            try:
+                queryset = queryset.filter(keyset_filter(self.current_ordering, values))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound('Неверный курсор')
+        return queryset[:self.current_page_size + 1]
+
+    def finish_page(self, page):
+        self.has_next = len(page) > self.current_page_size
+        page = page[:self.current_page_size]
+        self.next_values = None
+        if self.has_next:
+            last = page[-1]
+            self.next_values = [getattr(last, field.lstrip('-')) for field in self.current_ordering]
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.finish_page([obj async for obj in self.get_page_queryset(queryset, request, view)])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(self.next_values))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PageNumberPagination(pagination.PageNumberPagination):
+    """DRF page-number pagination with an async entry point for the ASGI read views."""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [obj async for obj in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
+
+def stream_json(queryset, serializer_class, context=None, chunk_size=500):
+    """
+    Stream a queryset as a JSON array. Rows are read with
+    .iterator(chunk_size=...) and prefetch_related runs per chunk, so memory
+    use stays flat regardless of how many rows match.
+    """
+    def serialize(batch):
+        return b','.join(dumps(item) for item in serializer_class(batch, many=True, context=context).data)
+
+    def generate():
+        yield b'['
+        batch = []
+        first = True
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            batch.append(obj)
+            if len(batch) >= chunk_size:
+                yield (b'' if first else b',') + serialize(batch)
+                first = False
+                batch = []
+        if batch:
+            yield (b'' if first else b',') + serialize(batch)
+        yield b']'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
@@ -0,0 +1,78 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib json module is used instead
+    orjson = None
+
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # orjson handles UUID and dict/list/str subclasses itself; Decimal,
+    # datetime/date/time (passed through so they come out exactly as DRF
+    # formats them), lazy strings and the rest go through DRF's encoder
+    return _encoder.default(obj)
+
+
+def use_orjson():
+    return orjson is not None and getattr(settings, 'FAST_JSON_BACKEND', 'orjson') == 'orjson'
+
+
+def dumps(data, indent=None):
+    """Encode `data` to UTF-8 JSON bytes the way FastJSONRenderer does."""
+    if use_orjson() and api_settings.UNICODE_JSON and indent in (None, 2):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=option)
+    separators = (',', ':') if api_settings.COMPACT_JSON and not indent else (', ', ': ')
+    return JSONEncoder(
+        ensure_ascii=not api_settings.UNICODE_JSON, allow_nan=not api_settings.STRICT_JSON,
+        indent=indent, separators=separators,
+    ).encode(data).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson when it is installed (set FAST_JSON_BACKEND
+    = 'stdlib' to opt out), falling back to the stdlib encoder. Output
+    matches JSONRenderer: dicts, lists, strings, numbers and UUIDs are
+    encoded natively, while Decimal and datetime values still go through
+    DRF's JSONEncoder.default() one by one. Serializer output is mostly
+    strings already, so that is rarely hit.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        ret = dumps(data, self.get_indent(accepted_media_type, renderer_context))
+        # Same as JSONRenderer: keep the output safe to embed in <script>
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser counterpart of FastJSONRenderer."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if not use_orjson():
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        data = stream.read() if stream is not None else b''
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (orjson.JSONDecodeError, UnicodeDecodeError) as exc:
+            raise ParseError(f'JSON parse error - {exc}')
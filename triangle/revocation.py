@@ -0,0 +1,199 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+# Set by ClaimsRefreshToken on the access tokens it mints, so revoking a
+# refresh token also revokes every access token issued from it
+REFRESH_JTI_CLAIM = 'refresh_jti'
+
+# RevokedToken.jti prefix of the entries revoking all of a user's tokens;
+# simplejwt jtis are hex, so they never start with it
+USER_KEY_PREFIX = 'user:'
+
+BLOOM_ERROR_RATE = 0.01
+BLOOM_MIN_CAPACITY = 1024
+# How often a worker looks for revocations made by other workers
+SYNC_INTERVAL = 1.0
+# Ids are handed out at INSERT but rows become visible at COMMIT, so a row
+# can show up after rows with higher ids. Every sync re-reads the rows
+# created this recently to catch those
+LATE_COMMIT_WINDOW = timedelta(seconds=60)
+# Full rebuilds drop expired entries from the filter
+REBUILD_INTERVAL = 3600
+PRUNE_INTERVAL = 3600
+
+
+class BloomFilter:
+    """Set membership with no false negatives and ~`error_rate` false positives up to `capacity` keys."""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & 1 << (position & 7) for position in self.positions(key))
+
+
+def add_entry(bloom, user_cutoffs, jti, created_at, expires_at):
+    if jti.startswith(USER_KEY_PREFIX):
+        user_cutoffs[jti[len(USER_KEY_PREFIX):]] = (created_at, expires_at)
+    else:
+        bloom.add(jti)
+
+
+class RevocationStore:
+    """
+    Revoked JWT ids: RevokedToken rows, with a per-worker Bloom filter in
+    front so the usual answer, "not revoked", needs no query. Only filter
+    hits are confirmed in the database. At most every SYNC_INTERVAL seconds
+    a worker loads the rows past the highest id it has seen, plus any row
+    created within LATE_COMMIT_WINDOW it hasn't loaded yet: one indexed
+    query, and no shared cache needed to see other workers' revocations.
+
+    Revoking all of a user's tokens stores one row with jti user_key(pk);
+    workers keep those as per-user cutoffs in memory. A cutoff covers every
+    token of the user issued up to the second it was made.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bloom = None
+        self.user_cutoffs = {}
+        self.last_id = 0
+        # Ids loaded from inside LATE_COMMIT_WINDOW, mapped to their created_at
+        self.recent_ids = {}
+        self.synced_at = 0.0
+        self.built_at = 0.0
+        self.pruned_at = time.monotonic()
+
+    def rebuild(self):
+        from .models import RevokedToken
+
+        now = timezone.now()
+        last_id = RevokedToken.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        rows = list(RevokedToken.objects.filter(expires_at__gt=now, id__lte=last_id)
+                    .values_list('id', 'jti', 'created_at', 'expires_at'))
+        bloom, user_cutoffs = BloomFilter(max(BLOOM_MIN_CAPACITY, 2 * len(rows))), {}
+        for pk, *row in rows:
+            add_entry(bloom, user_cutoffs, *row)
+        since = now - LATE_COMMIT_WINDOW
+        self.recent_ids = {pk: created_at for pk, _, created_at, _ in rows if created_at >= since}
+        self.bloom, self.user_cutoffs, self.last_id, self.built_at = bloom, user_cutoffs, last_id, time.monotonic()
+
+    def load_new(self):
+        from .models import RevokedToken
+
+        since = timezone.now() - LATE_COMMIT_WINDOW
+        rows = RevokedToken.objects.filter(Q(id__gt=self.last_id) | Q(created_at__gte=since)).order_by('id')
+        for pk, *row in rows.values_list('id', 'jti', 'created_at', 'expires_at'):
+            if pk in self.recent_ids:
+                continue
+            add_entry(self.bloom, self.user_cutoffs, *row)
+            self.recent_ids[pk] = row[1]
+            self.last_id = max(self.last_id, pk)
+        self.recent_ids = {pk: created_at for pk, created_at in self.recent_ids.items() if created_at >= since}
+
+    def sync(self):
+        now = time.monotonic()
+        if self.bloom is not None and now - self.synced_at < SYNC_INTERVAL:
+            return
+        with self.lock:
+            self.synced_at = now
+            if self.bloom is None or now - self.built_at > REBUILD_INTERVAL \
+                    or self.bloom.count > self.bloom.capacity:
+                self.rebuild()
+            else:
+                self.load_new()
+
+    def is_revoked(self, token):
+        """True when the token, the refresh token it was issued from, or all of its user's tokens are revoked."""
+        from .models import RevokedToken
+
+        self.sync()
+        cutoff = self.user_cutoffs.get(str(token.get(api_settings.USER_ID_CLAIM)))
+        # Tokens without iat predate the claim and count as issued before it
+        if cutoff and cutoff[1] > timezone.now() and datetime_from_epoch(token.get('iat', 0)) <= cutoff[0]:
+            return True
+        candidates = [jti for jti in (token.get(api_settings.JTI_CLAIM), token.get(REFRESH_JTI_CLAIM))
+                      if jti and jti in self.bloom]
+        if not candidates:
+            return False
+        return RevokedToken.objects.filter(jti__in=candidates, expires_at__gt=timezone.now()).exists()
+
+    def revoke(self, *tokens, user_id=None):
+        """Revoke validated tokens, each until its own expiry."""
+        from .models import RevokedToken
+
+        RevokedToken.objects.bulk_create([
+            RevokedToken(jti=token[api_settings.JTI_CLAIM], user_id=user_id,
+                         expires_at=datetime_from_epoch(token['exp']))
+            for token in tokens
+        ], ignore_conflicts=True)
+        self.sync()
+        with self.lock:
+            for token in tokens:
+                self.bloom.add(token[api_settings.JTI_CLAIM])
+        self.prune_if_due()
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued to the user so far; lasts until the newest of them expires."""
+        from .models import RevokedToken
+
+        with transaction.atomic():
+            # Replaced rather than updated: other workers only load new ids
+            RevokedToken.objects.filter(jti=user_key(user_id)).delete()
+            entry = RevokedToken.objects.create(jti=user_key(user_id), user_id=user_id,
+                                                expires_at=timezone.now() + api_settings.REFRESH_TOKEN_LIFETIME)
+        self.sync()
+        with self.lock:
+            add_entry(self.bloom, self.user_cutoffs, entry.jti, entry.created_at, entry.expires_at)
+        self.prune_if_due()
+
+    def prune_if_due(self):
+        if time.monotonic() - self.pruned_at > PRUNE_INTERVAL:
+            self.prune()
+
+    def prune(self):
+        """Delete entries whose tokens have expired; returns how many."""
+        from .models import RevokedToken
+
+        self.pruned_at = time.monotonic()
+        deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+revocations = RevocationStore()
+
+
+def user_key(user_id):
+    """RevokedToken.jti of the entry revoking all of a user's tokens."""
+    return f'{USER_KEY_PREFIX}{user_id}'
+
+
+def is_token_revoked(token):
+    return revocations.is_revoked(token)
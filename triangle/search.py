@@ -0,0 +1,199 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+FTS_TABLE = 'triangle_property_fts'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Russian inflections plus the Kyrgyz plural, case and possessive suffixes.
+# Kyrgyz stacks suffixes (үйлөрдүн = үй + лөр + дүн), so stripping runs twice.
+SUFFIXES = sorted({
+    'иями', 'ями', 'ами', 'иях', 'ах', 'ях', 'ией', 'ей', 'ой', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые',
+    'ие', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ом', 'ем', 'ам', 'ям', 'ов', 'ев', 'ью', 'ия', 'ья',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+    'лар', 'лер', 'лор', 'лөр', 'дар', 'дер', 'дор', 'дөр', 'тар', 'тер', 'тор', 'төр',
+    'нын', 'нин', 'нун', 'нүн', 'дын', 'дин', 'дун', 'дүн', 'тын', 'тин', 'тун', 'түн',
+    'га', 'ге', 'го', 'гө', 'ка', 'ке', 'ко', 'кө',
+    'да', 'де', 'до', 'дө', 'та', 'те', 'то', 'тө',
+    'дан', 'ден', 'дон', 'дөн', 'тан', 'тен', 'тон', 'төн',
+    'ны', 'ни', 'ну', 'нү', 'ды', 'ди', 'ду', 'дү', 'ты', 'ти', 'ту', 'тү',
+    'сы', 'си', 'су', 'сү', 'ү',
+}, key=len, reverse=True)
+
+MIN_STEM_LENGTH = 3
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    for _ in range(2):
+        for suffix in SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+                word = word[:-len(suffix)]
+                break
+        else:
+            break
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall(text or '')]
+
+
+def stem_text(text):
+    return ' '.join(tokenize(text))
+
+
+class SearchBackend:
+    """
+    Full-text search over Property. `search` filters the queryset and
+    annotates it with `search_rank`, where a higher value is a better match.
+    """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def no_matches(self, queryset):
+        # Still annotated, so callers can order by search_rank
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def index(self, instance):
+        pass
+
+    def index_many(self, instances):
+        for instance in instances:
+            self.index(instance)
+
+    def remove(self, pk):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SimpleSearchBackend(SearchBackend):
+    def search(self, queryset, query):
+        filters = Q(title__icontains=query) | Q(description__icontains=query) | Q(address__icontains=query)
+        return queryset.filter(filters).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5 index holding stemmed title/description/address, keyed by the
+    property id as rowid and joined through PropertySearchDocument.
+    """
+    # bm25 column weights: title, description, address
+    weights = (10.0, 1.0, 4.0)
+
+    def build_query(self, query):
+        terms = tokenize(query)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, query):
+        match = self.build_query(query)
+        if not match:
+            return self.no_matches(queryset)
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return queryset.filter(search_document__isnull=False).filter(
+            RawSQL(f'"{FTS_TABLE}" MATCH %s', [match], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'-bm25("{FTS_TABLE}", {weights})', [], output_field=FloatField())
+        )
+
+    def index(self, instance):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, address) VALUES (%s, %s, %s, %s)',
+                [instance.pk, stem_text(instance.title), stem_text(instance.description), stem_text(instance.address)],
+            )
+
+    def index_many(self, instances):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[obj.pk] for obj in instances])
+            self._insert(cursor, [
+                [obj.pk, stem_text(obj.title), stem_text(obj.description), stem_text(obj.address)]
+                for obj in instances
+            ])
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+    def rebuild(self):
+        from .models import Property
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            rows = Property.objects.values_list('id', 'title', 'description', 'address').iterator(chunk_size=2000)
+            batch = []
+            for pk, title, description, address in rows:
+                batch.append([pk, stem_text(title), stem_text(description), stem_text(address)])
+                if len(batch) >= 2000:
+                    self._insert(cursor, batch)
+                    batch = []
+            if batch:
+                self._insert(cursor, batch)
+
+    def _insert(self, cursor, rows):
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, address) VALUES (%s, %s, %s, %s)', rows
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Uses the 'russian' text search configuration. The match predicate is the
+    same expression as the GIN index created in migrations, so it is served
+    from the index; PostgreSQL keeps the index current on its own.
+    """
+    config = 'russian'
+    document_sql = (
+        "to_tsvector('russian', coalesce({table}title, '') || ' ' || "
+        "coalesce({table}description, '') || ' ' || coalesce({table}address, ''))"
+    )
+    rank_sql = (
+        "ts_rank(setweight(to_tsvector('russian', coalesce({table}title, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce({table}address, '')), 'B') || "
+        "setweight(to_tsvector('russian', coalesce({table}description, '')), 'C'), "
+        "to_tsquery('russian', %s))"
+    )
+
+    def build_query(self, query):
+        terms = WORD_RE.findall(query.lower())
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search(self, queryset, query):
+        tsquery = self.build_query(query)
+        if not tsquery:
+            return self.no_matches(queryset)
+        table = f'"{queryset.model._meta.db_table}".'
+        document = self.document_sql.format(table=table)
+        return queryset.filter(
+            RawSQL(f"{document} @@ to_tsquery('russian', %s)", [tsquery], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(self.rank_sql.format(table=table), [tsquery], output_field=FloatField())
+        )
+
+
+def get_search_backend():
+    path = getattr(settings, 'PROPERTY_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    backends = {'sqlite': SQLiteSearchBackend, 'postgresql': PostgresSearchBackend}
+    return backends.get(connection.vendor, SimpleSearchBackend)()
+
+
+class PropertySearchFilter(filters.SearchFilter):
+    """SearchFilter that goes through the full-text backend instead of icontains."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_search_backend().search(queryset, query)
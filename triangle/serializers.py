@@ -1,6 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Category, Amenity, Property, PropertyImage, Activity, Banner, Profile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from .amenity_masks import mask_for
+from .images import build_srcset
+from .models import Category, Amenity, Property, PropertyImage, Activity, Banner, Profile, UploadJob
+from .signals import properties_bulk_changed
+from .tasks import enqueue_upload
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -12,18 +18,27 @@ class UserSerializer(serializers.ModelSerializer):
 
 class ProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    avatar_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
-        fields = ['id', 'user', 'phone', 'avatar', 'position']
+        fields = ['id', 'user', 'phone', 'avatar', 'avatar_srcset', 'position']
         read_only_fields = ['user']
 
+    def get_avatar_srcset(self, obj):
+        return build_srcset(obj.variants)
+
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'parent']
 
+    def validate_parent(self, value):
+        if value is not None and self.instance is not None and value.path.startswith(self.instance.path):
+            raise serializers.ValidationError('Категорию нельзя вложить в неё саму или её подкатегорию')
+        return value
+
 
 class AmenitySerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,33 +48,105 @@ class AmenitySerializer(serializers.ModelSerializer):
 
 class PropertyImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = PropertyImage
-        fields = ['id', 'image', 'image_url', 'is_main', 'uploaded_at']
+        fields = ['id', 'image', 'image_url', 'srcset', 'is_main', 'uploaded_at']
 
     def get_image_url(self, obj):
         if obj.image:
             return obj.image.url
         return None
 
+    def get_srcset(self, obj):
+        return build_srcset(obj.variants)
+
 
 class PropertySerializer(serializers.ModelSerializer):
     images = PropertyImageSerializer(many=True, read_only=True)
     amenities = AmenitySerializer(many=True, read_only=True)
     category = CategorySerializer(read_only=True)
     main_image = serializers.SerializerMethodField()
+    main_image_srcset = serializers.SerializerMethodField()
+    # km from the query point; only present on geo queries, which annotate it
+    distance = serializers.FloatField(read_only=True)
+
+    # Relations rendered nested only when named in `expand`, as ids otherwise
+    EXPANDABLE = ('images', 'amenities', 'category')
 
     class Meta:
         model = Property
-        fields = '__all__'
+        exclude = ['card_data', 'geohash', 'amenity_mask']
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        """
+        `fields` limits the output to those names; `expand` (a set, used
+        together with `fields` or alone) picks which relations stay nested.
+        Both None keeps the full representation.
+        """
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if fields is not None or expand is not None:
+            for name in set(self.EXPANDABLE) - set(expand or ()):
+                if name in self.fields:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(
+                        many=name != 'category', read_only=True
+                    )
+
+    @classmethod
+    def available_fields(cls):
+        if '_available_fields' not in cls.__dict__:
+            cls._available_fields = frozenset(cls().fields)
+        return cls._available_fields
+
+    def get_main_image_obj(self, obj):
+        # Picked from the prefetched images so list pages don't issue a query per row
+        return next((img for img in obj.images.all() if img.is_main), None)
 
     def get_main_image(self, obj):
-        main_img = obj.images.filter(is_main=True).first()
+        main_img = self.get_main_image_obj(obj)
         if main_img:
             return main_img.image.url
         return None
 
+    def get_main_image_srcset(self, obj):
+        main_img = self.get_main_image_obj(obj)
+        if main_img:
+            return build_srcset(main_img.variants)
+        return {}
+
+
+class PropertyCardSerializer(serializers.Serializer):
+    """Slim list representation read straight from the denormalized Property.card_data."""
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    price = serializers.DecimalField(max_digits=15, decimal_places=2)
+    area = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price_per_m2 = serializers.DecimalField(max_digits=15, decimal_places=2, allow_null=True)
+    address = serializers.CharField()
+    property_type = serializers.CharField()
+    rooms = serializers.IntegerField()
+    category = serializers.CharField(allow_null=True)
+    latitude = serializers.FloatField(allow_null=True)
+    longitude = serializers.FloatField(allow_null=True)
+    main_image = serializers.SerializerMethodField()
+    # Only present on geo queries, which annotate it
+    distance = serializers.FloatField(required=False)
+
+    def to_representation(self, instance):
+        card = instance.card_data
+        if hasattr(instance, 'distance'):
+            card = {**card, 'distance': instance.distance}
+        return super().to_representation(card)
+
+    def get_main_image(self, card):
+        if card.get('main_image'):
+            return default_storage.url(card['main_image'])
+        return None
+
 
 class PropertyCreateSerializer(serializers.ModelSerializer):
     images = serializers.ListField(
@@ -67,35 +154,82 @@ class PropertyCreateSerializer(serializers.ModelSerializer):
         write_only=True,
         required=False
     )
+    upload_job = serializers.SerializerMethodField()
 
     class Meta:
         model = Property
-        exclude = ['created_at', 'updated_at']
+        exclude = ['created_at', 'updated_at', 'card_data', 'amenity_mask']
 
     def create(self, validated_data):
         images = validated_data.pop('images', [])
-        property_obj = Property.objects.create(**validated_data)
+        amenities = validated_data.pop('amenities', [])
 
-        for i, image in enumerate(images):
-            PropertyImage.objects.create(
-                property=property_obj,
-                image=image,
-                is_main=(i == 0)
-            )
+        with transaction.atomic():
+            property_obj = Property.objects.create(**validated_data)
+            self.replace_amenities(property_obj, amenities, clear=False)
+            if images:
+                property_obj.upload_job = enqueue_upload(property_obj, images, set_main=True)
 
         return property_obj
 
+    def update(self, instance, validated_data):
+        images = validated_data.pop('images', [])
+        amenities = validated_data.pop('amenities', None)
+
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if amenities is not None:
+                self.replace_amenities(instance, amenities)
+            if images:
+                instance.upload_job = enqueue_upload(instance, images)
+
+        return instance
+
+    def replace_amenities(self, property_obj, amenities, clear=True):
+        # One DELETE and one multi-row INSERT instead of the per-call
+        # bookkeeping queries and m2m_changed round trips of .set()
+        through = Property.amenities.through
+        if clear:
+            through.objects.filter(property=property_obj).delete()
+        if amenities:
+            through.objects.bulk_create([through(property=property_obj, amenity=amenity) for amenity in amenities])
+        if clear or amenities:
+            property_obj.amenity_mask = mask_for(amenity.bit for amenity in amenities)
+            Property.objects.filter(pk=property_obj.pk).update(amenity_mask=property_obj.amenity_mask)
+            properties_bulk_changed.send(sender=Property, instances=[property_obj])
+
+    def get_upload_job(self, obj):
+        job = getattr(obj, 'upload_job', None)
+        return job.pk if job else None
+
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadJob
+        fields = ['id', 'property', 'status', 'images', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
 
 class ActivitySerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Activity
-        fields = '__all__'
+        exclude = ['variants']
+
+    def get_srcset(self, obj):
+        return build_srcset(obj.variants)
 
 
 class BannerSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Banner
-        fields = '__all__'
+        exclude = ['variants']
+
+    def get_srcset(self, obj):
+        return build_srcset(obj.variants)
 
 
 class RegisterSerializer(serializers.Serializer):
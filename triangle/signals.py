@@ -0,0 +1,250 @@
+from django.contrib.auth.models import User
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .amenity_masks import bit_mask, clear_bit, free_bit, has_bits, refresh_masks, set_bit
+from .authentication import forget_user
+from .cache import bump_generation
+from .cards import CARD_SOURCE_FIELDS, card_for, refresh_cards
+from .counters import SEGMENT_FIELDS, record_change, record_created, segment_of
+from .geo import geohash_for
+from .images import delete_variants, refresh_variants
+from .models import PATH_END, Category, Amenity, Property, PropertyImage, Activity, Banner, Profile, price_per_m2
+from .search import get_search_backend
+from .suggest import forget_property, refresh_property
+
+# Sent with `instances` after properties (or their images/amenities) were
+# written through bulk_create/bulk_update, which skip the model signals;
+# `created=True` when the properties themselves were just inserted
+properties_bulk_changed = Signal()
+
+
+@receiver(pre_save, sender=Property)
+def build_property_card(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        instance.geohash = geohash_for(instance)
+        instance.price_per_m2 = price_per_m2(instance.price, instance.area)
+        instance.card_data = card_for(instance)
+
+
+@receiver(post_save, sender=Property)
+def save_partial_property_card(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        # The card was built before the INSERT assigned the pk
+        instance.card_data['id'] = instance.pk
+        Property.objects.filter(pk=instance.pk).update(card_data=instance.card_data)
+    # save(update_fields=...) only writes the derived columns when asked to
+    elif update_fields and not {'card_data', 'geohash', 'price_per_m2'} <= set(update_fields) \
+            and set(update_fields) & set(CARD_SOURCE_FIELDS + ('category_id',)):
+        Property.objects.filter(pk=instance.pk).update(card_data=instance.card_data, geohash=instance.geohash,
+                                                       price_per_m2=instance.price_per_m2)
+
+
+@receiver(pre_save, sender=Property)
+def remember_counter_segment(sender, instance, update_fields=None, **kwargs):
+    instance._counter_state = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(SEGMENT_FIELDS + ('price',)):
+        instance._counter_state = False
+        return
+    # Property.save() runs in a transaction: lock the row so a concurrent
+    # save can't move it between this read and the counter update
+    row = Property.objects.select_for_update().filter(pk=instance.pk).values(*SEGMENT_FIELDS, 'price').first()
+    if row is not None:
+        instance._counter_state = (segment_of(row), row['price'])
+
+
+@receiver(post_save, sender=Property)
+def update_property_counters(sender, instance, **kwargs):
+    old = getattr(instance, '_counter_state', None)
+    if old is False:
+        return
+    new = (segment_of(instance), instance.price)
+    if old != new:
+        record_change(old, new)
+
+
+@receiver(post_save, sender=Property)
+def index_property(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_search_backend().index(instance)
+    refresh_property(instance)
+
+
+@receiver(post_delete, sender=Property)
+def unindex_property(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+    forget_property(instance.pk)
+
+
+@receiver(post_delete, sender=Property)
+def uncount_property(sender, instance, **kwargs):
+    record_change((segment_of(instance), instance.price), None)
+
+
+@receiver(properties_bulk_changed)
+def sync_bulk_changed_properties(sender, instances, created=False, **kwargs):
+    if created:
+        record_created(instances)
+    get_search_backend().index_many(instances)
+    refresh_cards(instance.pk for instance in instances)
+    for instance in instances:
+        refresh_property(instance)
+    Property.objects.filter(pk__in=[instance.pk for instance in instances]).update(updated_at=timezone.now())
+    bump_generation('property')
+
+
+CACHE_GENERATIONS = {
+    Category: ('category',),
+    Amenity: ('amenity',),
+    Property: ('property',),
+    PropertyImage: ('property',),
+    Activity: ('activity',),
+    Banner: ('banner',),
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_responses(sender, **kwargs):
+    names = CACHE_GENERATIONS.get(sender)
+    if names:
+        bump_generation(*names)
+
+
+@receiver(m2m_changed, sender=Property.amenities.through)
+def invalidate_on_amenities_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation('property')
+
+
+def touch_property(pk):
+    # Images and amenities are part of the property representation, so
+    # changing them must move updated_at for conditional GETs to notice
+    Property.objects.filter(pk=pk).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=PropertyImage)
+@receiver(post_delete, sender=PropertyImage)
+def touch_property_on_image_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_property(instance.property_id)
+        refresh_cards([instance.property_id])
+
+
+@receiver(post_save, sender=Category)
+def update_category_paths(sender, instance, **kwargs):
+    parent_path = ''
+    if instance.parent_id:
+        parent_path = Category.objects.filter(pk=instance.parent_id).values_list('path', flat=True).first() or ''
+    old_path, new_path = instance.path, f'{parent_path}{instance.pk}/'
+    if old_path == new_path:
+        return
+    Category.objects.filter(pk=instance.pk).update(path=new_path)
+    if old_path:
+        # Re-root the whole subtree in one UPDATE
+        Category.objects.filter(path__gt=old_path, path__lt=old_path + PATH_END).update(
+            path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+        )
+    instance.path = new_path
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_cards(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_cards(instance.property_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_properties(sender, instance, **kwargs):
+    # The FK is nulled by the collector without signals, so note who to refresh
+    instance._card_property_ids = list(instance.property_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def refresh_cards_after_category_delete(sender, instance, **kwargs):
+    refresh_cards(getattr(instance, '_card_property_ids', []))
+
+
+@receiver(pre_save, sender=Amenity)
+def assign_amenity_bit(sender, instance, raw=False, **kwargs):
+    if not raw and instance.bit is None:
+        instance.bit = free_bit(set(Amenity.objects.filter(bit__isnull=False).values_list('bit', flat=True)))
+
+
+@receiver(post_delete, sender=Amenity)
+def release_amenity_bit(sender, instance, **kwargs):
+    # The M2M rows go with a plain DELETE, without m2m_changed; the bit is
+    # free for the next amenity once no mask carries it
+    if instance.bit is not None:
+        clear_bit(Property.objects.filter(has_bits(bit_mask(instance.bit))), instance.bit)
+
+
+@receiver(m2m_changed, sender=Property.amenities.through)
+def sync_amenity_masks(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            # Keep the instance current, or its next save() writes the old mask back
+            instance.amenity_mask = refresh_masks([instance.pk])[instance.pk]
+    elif instance.bit is not None:
+        if action == 'pre_clear':
+            clear_bit(instance.property_set.all(), instance.bit)
+        elif action == 'post_add':
+            set_bit(Property.objects.filter(pk__in=pk_set), instance.bit)
+        elif action == 'post_remove':
+            clear_bit(Property.objects.filter(pk__in=pk_set), instance.bit)
+
+
+@receiver(m2m_changed, sender=Property.amenities.through)
+def touch_property_on_amenities_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_property(instance.pk)
+    elif action == 'pre_clear':
+        instance.property_set.update(updated_at=timezone.now())
+    elif action in ('post_add', 'post_remove'):
+        Property.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+
+
+IMAGE_FIELDS = {
+    PropertyImage: ('image', 'property'),
+    Banner: ('image', 'banner'),
+    Activity: ('image', 'activity'),
+    Profile: ('avatar', 'avatar'),
+}
+
+
+@receiver(post_save)
+def build_image_variants(sender, instance, raw=False, **kwargs):
+    if raw or sender not in IMAGE_FIELDS:
+        return
+    field_name, kind = IMAGE_FIELDS[sender]
+    if refresh_variants(instance, field_name, kind):
+        names = CACHE_GENERATIONS.get(sender)
+        if names:
+            bump_generation(*names)
+
+
+@receiver(post_delete)
+def remove_image_variants(sender, instance, **kwargs):
+    if sender in IMAGE_FIELDS:
+        delete_variants(instance.variants)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_cached_profile(sender, instance, **kwargs):
+    forget_user(instance.user_id)
@@ -0,0 +1,100 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, Func, IntegerField, Q, Subquery, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .counters import counter_totals
+from .facets import PRICE_BUCKETS, price_bucket_filter
+from .models import Activity, Banner, Property, StatsSnapshot
+
+SERIES_DAYS = 90
+
+
+def _table_count(model):
+    # aggregate() only takes expressions that contain an aggregate. COUNT(NULL)
+    # is always 0, so adding the count subquery to it lets another table's
+    # count ride along in the pass over Property, even an empty one
+    return Count(Value(None)) + Subquery(
+        model.objects.order_by().values(count=Func('pk', function='COUNT')), output_field=IntegerField(),
+    )
+
+
+def counter_stats():
+    """The totals, read from PropertyCounter in one query over a few dozen rows."""
+    totals = counter_totals()
+    return {
+        'total_properties': totals['total'],
+        'active_properties': totals['active'],
+        'featured_properties': totals['featured'],
+        'properties_by_type': [
+            {'property_type': code, 'count': totals['types'][code]}
+            for code, _ in Property.PROPERTY_TYPES if totals['types'][code]
+        ],
+        'total_value': float(totals['value'].quantize(Decimal('0.01'))),
+    }
+
+
+def compute_stats():
+    """
+    Dashboard numbers for a snapshot in three queries: the counters, one
+    conditional-count pass over Property for the price histogram that also
+    carries the other table counts, and one GROUP BY day for the
+    new-listings series. Values are JSON-ready for StatsSnapshot.
+    """
+    counts = Property.objects.order_by().aggregate(
+        **{
+            f'price_{i}': Count('id', filter=price_bucket_filter(low, high))
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        },
+        activities=_table_count(Activity),
+        banners=_table_count(Banner),
+        users=_table_count(User),
+    )
+
+    today = timezone.localdate()
+    since = today - timedelta(days=SERIES_DAYS - 1)
+    rows = Property.objects.order_by().filter(created_at__date__gte=since) \
+        .annotate(day=TruncDate('created_at')).values('day') \
+        .annotate(count=Count('id'), active=Count('id', filter=Q(is_active=True)))
+    per_day = {row['day']: row for row in rows}
+
+    return {
+        **counter_stats(),
+        'total_activities': counts['activities'],
+        'total_banners': counts['banners'],
+        'total_users': counts['users'],
+        'price_histogram': [
+            {'min': low, 'max': high, 'count': counts[f'price_{i}']}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        'new_properties_per_day': [
+            {
+                'date': day.isoformat(),
+                'count': per_day[day]['count'] if day in per_day else 0,
+                'active': per_day[day]['active'] if day in per_day else 0,
+            }
+            for day in (since + timedelta(days=offset) for offset in range(SERIES_DAYS))
+        ],
+    }
+
+
+def take_snapshot():
+    return StatsSnapshot.objects.create(data=compute_stats())
+
+
+def current_snapshot(max_age=None):
+    """The latest snapshot, or a new one if there is none younger than `max_age` seconds."""
+    if max_age is None:
+        max_age = settings.STATS_SNAPSHOT_MAX_AGE
+    snapshot = StatsSnapshot.objects.first()
+    if snapshot is None or snapshot.created_at < timezone.now() - timedelta(seconds=max_age):
+        snapshot = take_snapshot()
+    return snapshot
+
+
+def prune_snapshots(keep_days):
+    return StatsSnapshot.objects.filter(created_at__lt=timezone.now() - timedelta(days=keep_days)).delete()[0]
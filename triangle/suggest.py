@@ -0,0 +1,299 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db import connections
+
+from .search import WORD_RE
+
+# Sorts after every character, closing the range of keys with a prefix
+KEY_END = '\U0010ffff'
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall((text or '').lower().replace('ё', 'е')))
+
+
+def best(items, limit):
+    """The `limit` best distinct (-count, length, phrase, kind) items."""
+    return heapq.nsmallest(limit, set(items))
+
+
+class RankedBucket:
+    """
+    Sorted (key, kind, phrase) entries split into blocks of up to
+    2 * block_size, with a segment tree over the blocks holding the best
+    `top_k` phrases of every run of blocks. A prefix lookup scans at most
+    the two blocks at the ends of its key range and reads O(log blocks)
+    tree nodes for the rest, however many entries the range holds.
+    """
+    block_size = 256
+
+    def __init__(self, entries, counts, top_k):
+        self.counts = counts
+        self.top_k = top_k
+        self.blocks = [entries[i:i + self.block_size] for i in range(0, len(entries), self.block_size)] or [[]]
+        self.block_tops = [self.rank_block(block) for block in self.blocks]
+        self.rebuild()
+
+    def rank(self, entries):
+        # Phrases already dropped from the counts are skipped until their
+        # remaining entries are removed
+        counts = self.counts
+        return [(-counts[kind, phrase], len(phrase), phrase, kind)
+                for _, kind, phrase in entries if (kind, phrase) in counts]
+
+    def rank_block(self, block):
+        return best(self.rank(block), self.top_k)
+
+    def rebuild(self):
+        """Recompute the block index and the tree after blocks were added or removed."""
+        self.firsts = [block[0] if block else () for block in self.blocks]
+        self.size = 1
+        while self.size < len(self.blocks):
+            self.size *= 2
+        self.tree = [[] for _ in range(self.size)] + self.block_tops + [[] for _ in range(self.size - len(self.blocks))]
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = best(self.tree[2 * node] + self.tree[2 * node + 1], self.top_k)
+
+    def item(self, entry, count=None):
+        _, kind, phrase = entry
+        return -(self.counts.get((kind, phrase), 0) if count is None else count), len(phrase), phrase, kind
+
+    def propagate(self, block_index, old=None, new=None):
+        """
+        Fix the tops from the block up after item `old` left it and/or `new`
+        joined it, stopping at the first node that doesn't change. Only a top
+        that loses an item is recomputed from below.
+        """
+        node = self.size + block_index
+        while node:
+            top = self.tree[node]
+            if old is not None and old in top:
+                if node >= self.size:
+                    updated = self.rank_block(self.blocks[block_index])
+                else:
+                    updated = best(self.tree[2 * node] + self.tree[2 * node + 1], self.top_k)
+            elif new is not None:
+                updated = best(top + [new], self.top_k)
+            else:
+                return
+            if updated == top:
+                return
+            self.tree[node] = updated
+            if node >= self.size:
+                self.block_tops[block_index] = updated
+            node //= 2
+
+    def locate(self, entry):
+        """(block index, offset) where `entry` is or would be inserted."""
+        block_index = max(bisect_right(self.firsts, entry) - 1, 0)
+        return block_index, bisect_left(self.blocks[block_index], entry)
+
+    def insert(self, entry):
+        block_index, offset = self.locate(entry)
+        block = self.blocks[block_index]
+        block.insert(offset, entry)
+        self.firsts[block_index] = block[0]
+        if len(block) > 2 * self.block_size:
+            half = len(block) // 2
+            self.blocks[block_index:block_index + 1] = [block[:half], block[half:]]
+            self.block_tops[block_index:block_index + 1] = [self.rank_block(block[:half]),
+                                                            self.rank_block(block[half:])]
+            self.rebuild()
+        else:
+            self.propagate(block_index, new=self.item(entry))
+
+    def remove(self, entry):
+        """Drop `entry`, whose phrase was used once and is already out of the counts."""
+        block_index, offset = self.locate(entry)
+        block = self.blocks[block_index]
+        if offset == len(block) or block[offset] != entry:
+            return
+        del block[offset]
+        if not block and len(self.blocks) > 1:
+            del self.blocks[block_index], self.block_tops[block_index]
+            self.rebuild()
+        else:
+            self.firsts[block_index] = block[0] if block else ()
+            self.propagate(block_index, old=self.item(entry, 1))
+
+    def rerank(self, entry, old_count):
+        """Move `entry` in the tops after its phrase's count changed from `old_count`."""
+        self.propagate(self.locate(entry)[0], old=self.item(entry, old_count), new=self.item(entry))
+
+    def query(self, key, limit):
+        first_block, first_offset = self.locate((key,))
+        last_block, last_offset = self.locate((key + KEY_END,))
+        if first_block == last_block:
+            return best(self.rank(self.blocks[first_block][first_offset:last_offset]), limit)
+        found = self.rank(self.blocks[first_block][first_offset:]) + self.rank(self.blocks[last_block][:last_offset])
+        # Whole blocks in between, from the tree
+        low, high = self.size + first_block + 1, self.size + last_block
+        while low < high:
+            if low & 1:
+                found += self.tree[low]
+                low += 1
+            if high & 1:
+                high -= 1
+                found += self.tree[high]
+            low //= 2
+            high //= 2
+        return best(found, limit)
+
+
+class PrefixIndex:
+    """
+    In-process typeahead index for property titles and addresses.
+
+    Every distinct phrase is stored once per word start as a (key, kind,
+    phrase) tuple, so "Бишкек, ул. Киевская" can be found by "биш", "ул ки"
+    or "киев". Tuples live in a RankedBucket per first character of the key,
+    which answers a prefix with its `top_k` most used phrases in time that
+    doesn't grow with the number of matches. Phrases are reference counted
+    by the properties that use them, which lets single-row updates adjust
+    the buckets in place.
+    """
+    max_word_starts = 6
+    top_k = 20
+
+    def __init__(self):
+        self._buckets = {}
+        self._counts = {}
+        self._by_property = {}
+        self._lock = threading.Lock()
+        self.built_at = None
+
+    @staticmethod
+    def phrases_for(title, address):
+        phrases = set()
+        if normalize(title):
+            phrases.add(('title', title.strip()))
+        if normalize(address):
+            phrases.add(('address', address.strip()))
+        return phrases
+
+    @classmethod
+    def entries_for(cls, kind, phrase):
+        words = normalize(phrase).split(' ')
+        starts = range(min(len(words), cls.max_word_starts))
+        return {(' '.join(words[i:]), kind, phrase) for i in starts}
+
+    def build(self, rows):
+        counts = {}
+        by_property = {}
+        for pk, title, address in rows:
+            phrases = self.phrases_for(title, address)
+            by_property[pk] = phrases
+            for phrase in phrases:
+                counts[phrase] = counts.get(phrase, 0) + 1
+        entries = {}
+        for kind, phrase in counts:
+            for entry in self.entries_for(kind, phrase):
+                entries.setdefault(entry[0][0], []).append(entry)
+        buckets = {}
+        for char, bucket_entries in entries.items():
+            bucket_entries.sort()
+            buckets[char] = RankedBucket(bucket_entries, counts, self.top_k)
+        with self._lock:
+            self._buckets, self._counts, self._by_property = buckets, counts, by_property
+            self.built_at = time.monotonic()
+
+    def update(self, pk, title, address):
+        with self._lock:
+            self._discard(pk)
+            phrases = self.phrases_for(title, address)
+            self._by_property[pk] = phrases
+            for phrase in phrases:
+                self._counts[phrase] = self._counts.get(phrase, 0) + 1
+                for entry in self.entries_for(*phrase):
+                    bucket = self._buckets.get(entry[0][0])
+                    if bucket is None:
+                        bucket = self._buckets[entry[0][0]] = RankedBucket([], self._counts, self.top_k)
+                    if self._counts[phrase] == 1:
+                        bucket.insert(entry)
+                    else:
+                        bucket.rerank(entry, self._counts[phrase] - 1)
+
+    def remove(self, pk):
+        with self._lock:
+            self._discard(pk)
+
+    def _discard(self, pk):
+        for phrase in self._by_property.pop(pk, ()):
+            self._counts[phrase] -= 1
+            if not self._counts[phrase]:
+                del self._counts[phrase]
+            for entry in self.entries_for(*phrase):
+                bucket = self._buckets.get(entry[0][0])
+                if bucket is None:
+                    continue
+                if phrase in self._counts:
+                    bucket.rerank(entry, self._counts[phrase] + 1)
+                else:
+                    bucket.remove(entry)
+
+    def suggest(self, prefix, limit=10):
+        key = normalize(prefix)
+        if not key:
+            return []
+        with self._lock:
+            bucket = self._buckets.get(key[0])
+            ranked = bucket.query(key, min(limit, self.top_k)) if bucket else []
+        return [{'text': phrase, 'type': kind, 'count': -count} for count, _, phrase, kind in ranked]
+
+
+_index = PrefixIndex()
+_build_lock = threading.Lock()
+
+
+def build_index():
+    from .models import Property
+
+    with _build_lock:
+        rows = Property.objects.filter(is_active=True).values_list('id', 'title', 'address').iterator(chunk_size=5000)
+        _index.build(rows)
+
+
+def _rebuild_in_background():
+    try:
+        build_index()
+    finally:
+        connections.close_all()
+
+
+def get_prefix_index():
+    """
+    Return the process-wide index, building it on first use. Saves handled
+    by other workers are picked up by a periodic rebuild in the background.
+    """
+    if _index.built_at is None:
+        build_index()
+    elif time.monotonic() - _index.built_at > getattr(settings, 'SUGGEST_INDEX_TTL', 600):
+        if not _build_lock.locked():
+            _index.built_at = time.monotonic()
+            threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    return _index
+
+
+def reset_index():
+    """Drop the process-wide index; the next lookup rebuilds it."""
+    global _index
+    with _build_lock:
+        _index = PrefixIndex()
+
+
+def refresh_property(instance):
+    if _index.built_at is None:
+        return
+    if instance.is_active:
+        _index.update(instance.pk, instance.title, instance.address)
+    else:
+        _index.remove(instance.pk)
+
+
+def forget_property(pk):
+    if _index.built_at is not None:
+        _index.remove(pk)
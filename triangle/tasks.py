@@ -0,0 +1,153 @@
+import logging
+import posixpath
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .images import build_variants
+from .models import PropertyImage, UploadJob
+from .signals import properties_bulk_changed
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = 'uploads/pending'
+FAILED_MESSAGE = 'Не удалось обработать загруженные файлы'
+
+# A job still pending or running after this long in thread mode lost the
+# process that queued it
+STALE_PENDING = timedelta(minutes=1)
+STALE_RUNNING = timedelta(minutes=10)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'UPLOAD_QUEUE_THREADS', 2),
+                                       thread_name_prefix='upload-jobs')
+    return _executor
+
+
+def enqueue_upload(property_obj, files, set_main=False):
+    """
+    Stage the raw uploads and queue a job that turns them into
+    PropertyImage rows. How the job runs depends on UPLOAD_QUEUE_MODE:
+    'thread' (default) hands it to an in-process pool once the transaction
+    commits, 'worker' leaves it for `manage.py process_upload_jobs`, and
+    'eager' runs it right after commit in the calling thread.
+    """
+    batch = uuid.uuid4().hex
+    staged = [
+        default_storage.save(posixpath.join(STAGING_DIR, batch, posixpath.basename(f.name)), f)
+        for f in files
+    ]
+    job = UploadJob.objects.create(property=property_obj, files=staged, set_main=set_main)
+
+    mode = getattr(settings, 'UPLOAD_QUEUE_MODE', 'thread')
+    if mode == 'eager':
+        transaction.on_commit(lambda: process_job(job.pk))
+    elif mode == 'thread':
+        if _executor is None:
+            # First job in this process: also pick up what a dead one left
+            transaction.on_commit(resume_stale_jobs)
+        transaction.on_commit(lambda: get_executor().submit(_process_in_thread, job.pk))
+    return job
+
+
+def _process_in_thread(pk):
+    try:
+        process_job(pk)
+    finally:
+        connections.close_all()
+
+
+def claim_job(pk):
+    """Atomically move a pending job to running; False if someone else got it."""
+    return bool(UploadJob.objects.filter(pk=pk, status='pending').update(status='running', started_at=timezone.now()))
+
+
+def claim_next_job():
+    while True:
+        pk = UploadJob.objects.filter(status='pending').order_by('created_at').values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        if claim_job(pk):
+            return pk
+
+
+def requeue_stale_jobs(older_than):
+    """Return jobs left running by a worker that died back to the queue."""
+    cutoff = timezone.now() - older_than
+    return UploadJob.objects.filter(status='running', started_at__lt=cutoff).update(status='pending')
+
+
+def is_stale(job):
+    now = timezone.now()
+    if job.status == 'pending':
+        return job.created_at < now - STALE_PENDING
+    return job.status == 'running' and job.started_at < now - STALE_RUNNING
+
+
+def resume_stale_jobs():
+    """
+    Thread mode has no worker to pick up jobs whose process died before or
+    while running them, so hand them to this process's pool. Claiming is
+    atomic, so a job still queued elsewhere runs only once.
+    """
+    requeue_stale_jobs(STALE_RUNNING)
+    cutoff = timezone.now() - STALE_PENDING
+    pks = list(UploadJob.objects.filter(status='pending', created_at__lt=cutoff).values_list('pk', flat=True))
+    for pk in pks:
+        get_executor().submit(_process_in_thread, pk)
+    return pks
+
+
+def process_job(pk, claimed=False):
+    if not claimed and not claim_job(pk):
+        return
+    job = UploadJob.objects.select_related('property').get(pk=pk)
+    try:
+        images = []
+        for i, path in enumerate(job.files):
+            image = PropertyImage(property=job.property, is_main=job.set_main and i == 0)
+            with default_storage.open(path, 'rb') as staged:
+                image.image.save(posixpath.basename(path), File(staged), save=False)
+            # Variants are rendered up front so the rows go in with a single
+            # INSERT instead of an INSERT plus an UPDATE per image
+            image.variants = build_variants(image.image, 'property')
+            images.append(image)
+        with transaction.atomic():
+            PropertyImage.objects.bulk_create(images)
+            properties_bulk_changed.send(sender=PropertyImage, instances=[job.property])
+        for path in job.files:
+            default_storage.delete(path)
+    except Exception:
+        # The exception names server paths; the job status endpoint is public
+        logger.exception('Upload job %s failed', pk)
+        UploadJob.objects.filter(pk=pk).update(status='failed', error=FAILED_MESSAGE, finished_at=timezone.now())
+        return
+    UploadJob.objects.filter(pk=pk).update(
+        status='done', images=[image.pk for image in images], finished_at=timezone.now()
+    )
+
+
+def run_worker(poll_interval=1.0, once=False, stale_after=timedelta(minutes=10)):
+    requeue_stale_jobs(stale_after)
+    processed = 0
+    while True:
+        pk = claim_next_job()
+        if pk is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        process_job(pk, claimed=True)
+        processed += 1
@@ -1,3 +1,1322 @@
-from django.test import TestCase
+import json
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .models import (
+    Category, Amenity, Property, PropertyCounter, PropertyImage, Banner, Profile, RevokedToken, StatsSnapshot,
+    UploadJob,
+)
+from . import geo, suggest
+from .async_views import (
+    BannerListView, PropertyDetailView, PropertyFeaturedView, PropertyListView, PropertySearchAsyncView
+)
+from .authentication import ClaimsRefreshToken, clear_user_cache
+from .counters import reconcile, segment_of
+from .filters import PropertyFilterSet
+from .importers import import_properties
+from .instrumentation import QueryProbe, metrics
+from .renderers import FastJSONRenderer
+from .revocation import RevocationStore, revocations
+from .search import stem
+from .tasks import claim_job, process_job, run_worker
+
+
+def make_property(**kwargs):
+    data = {
+        'title': 'Квартира в центре',
+        'price': Decimal('85000.00'),
+        'area': Decimal('64.50'),
+        'address': 'Бишкек, ул. Киевская 1',
+        'property_type': 'apartment',
+    }
+    data.update(kwargs)
+    return Property.objects.create(**data)
+
+
+def add_missing_image(test, obj, name):
+    """A main image whose file isn't in storage, for tests that only look at the path."""
+    with test.assertLogs('triangle.images', 'WARNING'):
+        return PropertyImage.objects.create(property=obj, image=name, is_main=True)
+
+
+class PropertyListQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Жилая')
+        self.amenities = [Amenity.objects.create(name=name) for name in ('Парковка', 'Лифт')]
+
+    def add_properties(self, count):
+        for i in range(count):
+            obj = make_property(title=f'Объект {i}', category=self.category, is_featured=True)
+            obj.amenities.set(self.amenities)
+            PropertyImage.objects.bulk_create([
+                PropertyImage(property=obj, image=f'properties/{i}-main.jpg', is_main=True),
+                PropertyImage(property=obj, image=f'properties/{i}-extra.jpg'),
+            ])
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        endpoints = [
+            ('get', '/api/properties/', None),
+            ('get', '/api/properties/featured/', None),
+            ('post', '/api/properties/filter/', {'amenities': [self.amenities[0].id]}),
+            ('get', '/api/properties/search/', {'q': 'Объект'}),
+        ]
+        self.add_properties(1)
+        # Warm the amenity bit lookup, cached once per amenity generation
+        self.client.post('/api/properties/filter/', {'amenities': [self.amenities[0].id]}, format='json')
+        baseline = {url: self.count_queries(method, url, data) for method, url, data in endpoints}
+        self.add_properties(9)
+        for method, url, data in endpoints:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(method, url, data), baseline[url])
+
+    def test_main_image_comes_from_prefetched_images(self):
+        self.add_properties(1)
+        response = self.client.get('/api/properties/')
+        item = response.data['results'][0]
+        self.assertEqual(item['main_image'], '/media/properties/0-main.jpg')
+        self.assertEqual(len(item['images']), 2)
+        self.assertEqual(item['category']['name'], 'Жилая')
+
+
+class PropertyKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.properties = [make_property(title=f'Объект {i}') for i in range(5)]
+        # identical timestamps force the id tiebreaker to do the work
+        Property.objects.update(created_at=self.properties[0].created_at)
+
+    def test_cursor_walks_all_rows_once(self):
+        seen = []
+        url = '/api/properties/search/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, sorted((p.id for p in self.properties), reverse=True))
+
+    def test_filter_view_is_paginated(self):
+        response = self.client.post('/api/properties/filter/?page_size=3', {}, format='json')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/properties/search/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_mode_returns_every_row(self):
+        response = self.client.get('/api/properties/search/', {'stream': '1', 'chunk_size': 2})
+        self.assertEqual(response.status_code, 200)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['id'] for row in rows], sorted((p.id for p in self.properties), reverse=True))
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.flat = make_property(title='Просторная квартира', address='Бишкек, Джал')
+        self.house = make_property(title='Дом с садом', description='Рядом квартиры и парк', address='Ош')
+        self.kg = make_property(title='Үйлөр сатылат', address='Каракол')
+
+    def search_ids(self, query, **params):
+        response = self.client.get('/api/properties/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_stem(self):
+        self.assertEqual(stem('квартиры'), stem('квартирах'))
+        self.assertEqual(stem('үйлөрдүн'), stem('үйлөр'))
+
+    def test_matches_word_forms_and_ranks_title_first(self):
+        self.assertEqual(self.search_ids('квартирах'), [self.flat.id, self.house.id])
+
+    def test_prefix_match(self):
+        self.assertEqual(self.search_ids('просто'), [self.flat.id])
+
+    def test_index_follows_save_and_delete(self):
+        self.flat.title = 'Уютная студия'
+        self.flat.save()
+        self.assertEqual(self.search_ids('студия'), [self.flat.id])
+        self.assertEqual(self.search_ids('просторная'), [])
+        self.flat.delete()
+        self.assertEqual(self.search_ids('студия'), [])
+
+    def test_punctuation_only_query_matches_nothing(self):
+        for query in ('"*()', '!!!'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search_ids(query), [])
+
+    async def test_punctuation_only_query_on_async_view(self):
+        request = AsyncRequestFactory().get('/api/properties/search/', {'q': '!!!'})
+        response = await PropertySearchAsyncView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['results'], [])
+
+    def test_rank_cursor_pagination(self):
+        first = self.client.get('/api/properties/search/', {'q': 'квартира', 'page_size': 1})
+        second = self.client.get(first.data['next'])
+        self.assertEqual([item['id'] for item in first.data['results']], [self.flat.id])
+        self.assertEqual([item['id'] for item in second.data['results']], [self.house.id])
+        self.assertIsNone(second.data['next'])
+
+    def test_viewset_search_param(self):
+        response = self.client.get('/api/properties/', {'search': 'Каракол'})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.kg.id])
+
+
+class PropertySuggestTests(TestCase):
+    def setUp(self):
+        suggest.reset_index()
+        self.client = APIClient()
+        self.flat = make_property(title='Просторная квартира', address='Бишкек, ул. Киевская 1')
+        make_property(title='Просторный дом', address='Бишкек, ул. Киевская 1')
+        make_property(title='Скрытый объект', address='Ош', is_active=False)
+        suggest.build_index()
+
+    def texts(self, query):
+        response = self.client.get('/api/properties/suggest/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['text'] for item in response.data['suggestions']]
+
+    def test_prefix_and_word_start_matches(self):
+        self.assertEqual(self.texts('прост'), ['Просторный дом', 'Просторная квартира'])
+        self.assertEqual(self.texts('киев'), ['Бишкек, ул. Киевская 1'])
+        self.assertEqual(self.texts('скрыт'), [])
+
+    def test_shared_phrase_is_counted_once(self):
+        response = self.client.get('/api/properties/suggest/', {'q': 'биш'})
+        self.assertEqual(response.data['suggestions'], [
+            {'text': 'Бишкек, ул. Киевская 1', 'type': 'address', 'count': 2},
+        ])
+
+    def test_index_is_updated_on_save_and_delete(self):
+        self.flat.title = 'Студия у парка'
+        self.flat.save()
+        self.assertEqual(self.texts('студ'), ['Студия у парка'])
+        self.assertEqual(self.texts('просторная'), [])
+        self.flat.delete()
+        self.assertEqual(self.texts('студ'), [])
+
+    def test_ranking_covers_every_match(self):
+        index = suggest.PrefixIndex()
+        rows = [(pk, f'Дом {pk:04d}', '') for pk in range(1000)]
+        rows += [(pk, 'Дом у озера', '') for pk in range(1000, 1005)]
+        index.build(rows)
+        self.assertEqual(index.suggest('дом', limit=1), [{'text': 'Дом у озера', 'type': 'title', 'count': 5}])
+
+
+class ResponseCacheTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Жилая')
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get('/api/categories/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/categories/')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_query_string_is_normalized(self):
+        self.client.get('/api/categories/?b=2&a=1')
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/?a=1&b=2')
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/api/categories/')['ETag']
+        response = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_save_and_delete_invalidate(self):
+        self.client.get('/api/categories/')
+        self.category.name = 'Коммерческая'
+        self.category.save()
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.data['results'][0]['name'], 'Коммерческая')
+        self.category.delete()
+        self.assertEqual(self.client.get('/api/categories/').data['results'], [])
+
+    def test_featured_is_invalidated_by_image_upload(self):
+        obj = make_property(is_featured=True)
+        self.assertIsNone(self.client.get('/api/properties/featured/').data[0]['main_image'])
+        add_missing_image(self, obj, 'properties/main.jpg')
+        self.assertEqual(self.client.get('/api/properties/featured/').data[0]['main_image'],
+                         '/media/properties/main.jpg')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LocMemResponseCacheTests(ResponseCacheTestMixin, TestCase):
+    pass
+
+
+class FileBasedResponseCacheTests(ResponseCacheTestMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name,
+        }})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        super().setUp()
+
+
+class PropertyConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.obj = make_property()
+
+    def test_detail_304_without_serializing(self):
+        response = self.client.get(f'/api/properties/{self.obj.id}/')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(f'/api/properties/{self.obj.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_detail_malformed_pk_is_404(self):
+        self.assertEqual(self.client.get('/api/properties/abc/').status_code, 404)
+
+    def test_detail_if_modified_since(self):
+        last_modified = self.client.get(f'/api/properties/{self.obj.id}/')['Last-Modified']
+        response = self.client.get(f'/api/properties/{self.obj.id}/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_validator_changes_on_update_delete_and_images(self):
+        etag = self.client.get('/api/properties/')['ETag']
+        self.assertEqual(self.client.get('/api/properties/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        add_missing_image(self, self.obj, 'properties/new.jpg')
+        response = self.client.get('/api/properties/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['main_image'], '/media/properties/new.jpg')
+
+        etag = response['ETag']
+        make_property(title='Второй').delete()
+        self.assertEqual(self.client.get('/api/properties/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_validator_depends_on_query(self):
+        etag = self.client.get('/api/properties/')['ETag']
+        response = self.client.get('/api/properties/?rooms=3', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class PropertyFacetsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Жилая')
+        self.parking = Amenity.objects.create(name='Парковка')
+        flat = make_property(price=Decimal('40000'), rooms=2, category=self.category)
+        flat.amenities.add(self.parking)
+        make_property(price=Decimal('120000'), rooms=3, property_type='house')
+        make_property(price=Decimal('120000'), rooms=3, is_active=False)
+
+    def test_counts_in_fixed_number_of_queries(self):
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/properties/facets/', {}, format='json')
+        data = response.data
+        self.assertEqual(data['total'], 2)
+        types = {item['value']: item['count'] for item in data['property_type']}
+        self.assertEqual((types['apartment'], types['house'], types['villa']), (1, 1, 0))
+        self.assertEqual(data['rooms'], [{'value': 2, 'count': 1}, {'value': 3, 'count': 1}])
+        self.assertEqual([item['count'] for item in data['price']], [1, 0, 1, 0, 0])
+        self.assertEqual(data['category'], [{'value': self.category.id, 'label': 'Жилая', 'count': 1}])
+        self.assertEqual(data['amenities'], [{'value': self.parking.id, 'label': 'Парковка', 'count': 1}])
+
+    def test_respects_filters_and_caches(self):
+        body = {'amenities': [self.parking.id]}
+        self.assertEqual(self.client.post('/api/properties/facets/', body, format='json').data['total'], 1)
+        with self.assertNumQueries(0):
+            self.client.post('/api/properties/facets/', body, format='json')
+        make_property(price=Decimal('10000')).amenities.add(self.parking)
+        self.assertEqual(self.client.post('/api/properties/facets/', body, format='json').data['total'], 2)
+
+
+def make_image(name='photo.png', size=(2000, 1000), mode='RGB'):
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageVariantsTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+
+    def test_property_image_variants_and_srcset(self):
+        image = PropertyImage.objects.create(property=make_property(), image=make_image(), is_main=True)
+        image.refresh_from_db()
+        sizes = image.variants['sizes']
+        self.assertEqual(sorted(sizes), ['large', 'medium', 'thumb'])
+        self.assertEqual((sizes['thumb']['width'], sizes['thumb']['height']), (320, 160))
+        self.assertTrue(default_storage.exists(sizes['thumb']['webp']))
+
+        data = self.client.get(f'/api/properties/{image.property_id}/').data
+        self.assertIn('320w', data['images'][0]['srcset']['webp'])
+        self.assertEqual(data['main_image_srcset'], data['images'][0]['srcset'])
+
+    def test_small_source_is_not_upscaled(self):
+        banner = Banner.objects.create(title='Баннер', image=make_image(size=(500, 200), mode='RGBA'))
+        banner.refresh_from_db()
+        self.assertEqual(list(banner.variants['sizes']), ['medium'])
+        self.assertEqual(banner.variants['sizes']['medium']['width'], 500)
+
+    def test_missing_source_is_marked_failed_and_not_retried(self):
+        with self.assertLogs('triangle.images', 'WARNING'):
+            image = PropertyImage.objects.create(property=make_property(), image='properties/gone.jpg')
+        image.refresh_from_db()
+        self.assertEqual(image.variants, {'source': 'properties/gone.jpg', 'failed': True, 'sizes': {}})
+        self.assertEqual(self.client.get(f'/api/properties/{image.property_id}/').data['images'][0]['srcset'], {})
+
+        with self.assertNoLogs('triangle.images', 'WARNING'):
+            image.save()
+            call_command('build_image_variants', stdout=StringIO())
+
+        default_storage.save('properties/gone.jpg', make_image())
+        call_command('build_image_variants', '--retry-failed', stdout=StringIO())
+        image.refresh_from_db()
+        self.assertEqual(sorted(image.variants['sizes']), ['large', 'medium', 'thumb'])
+
+    def test_variants_are_removed_with_the_row(self):
+        image = PropertyImage.objects.create(property=make_property(), image=make_image())
+        thumb = PropertyImage.objects.get(pk=image.pk).variants['sizes']['thumb']['jpeg']
+        PropertyImage.objects.get(pk=image.pk).delete()
+        self.assertFalse(default_storage.exists(thumb))
+
+
+@override_settings(UPLOAD_QUEUE_MODE='worker')
+class UploadJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.obj = make_property()
+
+    def upload(self, count=2):
+        files = [make_image(f'photo{i}.png', size=(400, 300)) for i in range(count)]
+        return self.client.post(f'/api/properties/{self.obj.id}/upload_images/', {'images': files},
+                                format='multipart')
+
+    def test_upload_returns_202_and_worker_creates_images(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(PropertyImage.objects.count(), 0)
+
+        status_url = f'/api/upload-jobs/{response.data["job_id"]}/'
+        self.assertEqual(self.client.get(status_url).data['status'], 'pending')
+
+        self.assertEqual(run_worker(once=True), 1)
+        job = self.client.get(status_url).data
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(sorted(job['images']), sorted(self.obj.images.values_list('id', flat=True)))
+        self.assertTrue(all(image.variants for image in self.obj.images.all()))
+        self.assertEqual(default_storage.listdir('uploads/pending')[1], [])
+
+    def test_job_is_claimed_once(self):
+        job_id = self.upload(1).data['job_id']
+        self.assertTrue(claim_job(job_id))
+        self.assertFalse(claim_job(job_id))
+
+    def test_missing_staged_file_fails_job(self):
+        job_id = self.upload(1).data['job_id']
+        default_storage.delete(UploadJob.objects.get(pk=job_id).files[0])
+        with self.assertLogs('triangle.tasks', 'ERROR') as logs:
+            run_worker(once=True)
+        self.assertIn('FileNotFoundError', logs.output[0])
+        job = self.client.get(f'/api/upload-jobs/{job_id}/').data
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['error'], 'Не удалось обработать загруженные файлы')
+
+    def test_thread_mode_resumes_jobs_left_by_a_dead_process(self):
+        pending, running = self.upload(1).data['job_id'], self.upload(1).data['job_id']
+        UploadJob.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        UploadJob.objects.filter(pk=running).update(status='running', started_at=timezone.now() - timedelta(hours=1))
+        submitted = []
+        with override_settings(UPLOAD_QUEUE_MODE='thread'), mock.patch('triangle.tasks.get_executor') as executor:
+            executor.return_value.submit.side_effect = lambda fn, pk: submitted.append(pk)
+            self.client.get(f'/api/upload-jobs/{pending}/')
+        self.assertCountEqual(submitted, [pending, running])
+
+        for pk in submitted:
+            process_job(pk)
+        self.assertEqual(set(UploadJob.objects.values_list('status', flat=True)), {'done'})
+
+    @override_settings(UPLOAD_QUEUE_MODE='eager')
+    def test_create_with_images_queues_job_with_main_photo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/properties/', {
+                'title': 'Новый объект', 'price': '1000', 'area': '10', 'address': 'Ош',
+                'property_type': 'house', 'images': [make_image('a.png', (50, 50)), make_image('b.png', (50, 50))],
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        job = UploadJob.objects.get(pk=response.data['upload_job'])
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(PropertyImage.objects.filter(property=job.property, is_main=True).count(), 1)
+
+
+class PropertyBulkImportTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Квартиры')
+        self.wifi = Amenity.objects.create(name='Wi-Fi')
+        self.parking = Amenity.objects.create(name='Парковка')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def csv_file(self, rows):
+        header = 'title,price,area,address,property_type,category,amenities\n'
+        return SimpleUploadedFile('import.csv', (header + ''.join(rows)).encode(), content_type='text/csv')
+
+    def test_csv_import_in_batches(self):
+        rows = [f'Квартира {i},1000,50,Бишкек,apartment,{self.category.id},"{self.wifi.id};{self.parking.id}"\n'
+                for i in range(5)]
+        rows.append('Без цены,,50,Бишкек,apartment,,\n')
+        response = self.client.post('/api/properties/import/', {'file': self.csv_file(rows), 'batch_size': 2},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual([batch['rows'] for batch in response.data['batches']], [2, 2, 2])
+        self.assertEqual(response.data['errors'][0]['row'], 6)
+        self.assertEqual(Property.amenities.through.objects.count(), 10)
+        self.assertEqual(len(self.client.get('/api/properties/search/', {'q': 'квартира'}).data['results']), 5)
+
+    def test_json_import_rejects_unknown_amenity(self):
+        rows = [
+            {'title': 'Дом', 'price': '5000', 'area': '120', 'address': 'Ош', 'property_type': 'house'},
+            {'title': 'Офис', 'price': '5000', 'area': '120', 'address': 'Ош', 'property_type': 'office',
+             'amenities': [9999]},
+        ]
+        upload = SimpleUploadedFile('import.json', json.dumps(rows).encode(), content_type='application/json')
+        response = self.client.post('/api/properties/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(list(Property.objects.values_list('title', flat=True)), ['Дом'])
+
+    def test_import_requires_admin(self):
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/properties/import/', {'file': self.csv_file([])}, format='multipart')
+        self.assertEqual(response.status_code, 401)
+
+    def test_create_and_update_replace_amenities(self):
+        response = self.client.post('/api/properties/', {
+            'title': 'Дом', 'price': '1000', 'area': '10', 'address': 'Ош', 'property_type': 'house',
+            'amenities': [self.wifi.id, self.parking.id],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        obj = Property.objects.get(pk=response.data['id'])
+        self.assertEqual(set(obj.amenities.values_list('id', flat=True)), {self.wifi.id, self.parking.id})
+
+        response = self.client.patch(f'/api/properties/{obj.id}/', {'amenities': [self.wifi.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(obj.amenities.values_list('id', flat=True)), [self.wifi.id])
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.category = Category.objects.create(name='Квартиры')
+        for i in range(3):
+            make_property(title=f'Квартира {i}', category=self.category, is_featured=i == 0)
+
+    async def call(self, view, path, method='get', **kwargs):
+        request = getattr(self.factory, method)(path, **kwargs.pop('request_kwargs', {}))
+        return await view.as_view()(request, **kwargs)
+
+    async def test_list_matches_drf_view(self):
+        response = await self.call(PropertyListView, '/api/properties/?property_type=apartment')
+        self.assertEqual(response.status_code, 200)
+        expected = await sync_to_async(APIClient().get)('/api/properties/?property_type=apartment')
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+    async def test_detail_conditional_get_and_404(self):
+        obj = await Property.objects.afirst()
+        response = await self.call(PropertyDetailView, f'/api/properties/{obj.pk}/', pk=obj.pk)
+        self.assertEqual(json.loads(response.content)['title'], obj.title)
+
+        response = await self.call(PropertyDetailView, f'/api/properties/{obj.pk}/', pk=obj.pk,
+                                   request_kwargs={'headers': {'If-None-Match': response['ETag']}})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.call(PropertyDetailView, '/api/properties/999/', pk=999)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_featured_search_and_banners(self):
+        response = await self.call(PropertyFeaturedView, '/api/properties/featured/')
+        self.assertEqual([item['title'] for item in json.loads(response.content)], ['Квартира 0'])
+
+        response = await self.call(PropertySearchAsyncView, '/api/properties/search/?q=квартира&page_size=2')
+        data = json.loads(response.content)
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNotNone(data['next'])
+
+        response = await self.call(BannerListView, '/api/banners/')
+        self.assertEqual(json.loads(response.content)['count'], 0)
+
+    async def test_writes_fall_back_to_drf_view(self):
+        response = await self.call(PropertyListView, '/api/properties/', method='post', request_kwargs={
+            'data': {'title': 'Дом', 'price': '1000', 'area': '10', 'address': 'Ош', 'property_type': 'house'},
+            'content_type': 'application/json',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await Property.objects.acount(), 4)
+
+
+class PropertyCardTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Жилая')
+        self.obj = make_property(title='Квартира у парка', category=self.category, rooms=3)
+        add_missing_image(self, self.obj, 'properties/main.jpg')
+
+    def test_card_view_on_list_search_and_filter(self):
+        expected = {
+            'id': self.obj.id, 'title': 'Квартира у парка', 'price': '85000.00', 'area': '64.50',
+            'price_per_m2': '1317.83', 'address': 'Бишкек, ул. Киевская 1', 'property_type': 'apartment', 'rooms': 3,
+            'category': 'Жилая', 'latitude': None, 'longitude': None, 'main_image': '/media/properties/main.jpg',
+        }
+        responses = [
+            self.client.get('/api/properties/', {'view': 'card'}),
+            self.client.get('/api/properties/search/', {'q': 'квартира', 'view': 'card'}),
+            self.client.post('/api/properties/filter/?view=card', {'rooms': 3}, format='json'),
+        ]
+        for response in responses:
+            with self.subTest(url=response.request['PATH_INFO']):
+                self.assertEqual(response.data['results'], [expected])
+
+    def test_card_page_is_a_single_table_read(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/properties/search/', {'view': 'card'})
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('JOIN', ctx.captured_queries[0]['sql'])
+
+    def test_card_follows_property_image_and_category_changes(self):
+        self.obj.title = 'Новое название'
+        self.obj.save()
+        self.category.name = 'Вторичка'
+        self.category.save()
+        PropertyImage.objects.filter(property=self.obj).delete()
+        add_missing_image(self, self.obj, 'properties/other.jpg')
+
+        card = Property.objects.get(pk=self.obj.pk).card_data
+        self.assertEqual(card['title'], 'Новое название')
+        self.assertEqual(card['category'], 'Вторичка')
+        self.assertEqual(card['main_image'], 'properties/other.jpg')
+
+        self.category.delete()
+        self.assertIsNone(Property.objects.get(pk=self.obj.pk).card_data['category'])
+
+    def test_new_property_card_has_its_id(self):
+        obj = make_property(title='Без фото')
+        self.assertEqual(Property.objects.get(pk=obj.pk).card_data['id'], obj.pk)
+
+    def test_card_data_is_not_exposed(self):
+        response = self.client.get(f'/api/properties/{self.obj.pk}/')
+        self.assertNotIn('card_data', response.data)
+
+
+class PropertySparseFieldsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Жилая')
+        self.amenity = Amenity.objects.create(name='Лифт')
+        self.obj = make_property(category=self.category, description='Очень длинное описание')
+        self.obj.amenities.add(self.amenity)
+        add_missing_image(self, self.obj, 'properties/main.jpg')
+
+    def test_fields_trim_output_and_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/properties/search/', {'fields': 'id,title,price'})
+        self.assertEqual(response.data['results'], [{'id': self.obj.id, 'title': self.obj.title, 'price': '85000.00'}])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertNotIn('description', sql)
+        self.assertNotIn('JOIN', sql)
+
+    def test_relations_are_ids_unless_expanded(self):
+        response = self.client.get('/api/properties/', {'fields': 'id,category,amenities,images'})
+        item = response.data['results'][0]
+        self.assertEqual(item['category'], self.category.id)
+        self.assertEqual(item['amenities'], [self.amenity.id])
+        self.assertEqual(len(item['images']), 1)
+
+        response = self.client.get(f'/api/properties/{self.obj.id}/', {'fields': 'id,category', 'expand': 'category'})
+        self.assertEqual(response.data, {'id': self.obj.id, 'category': {'id': self.category.id, 'name': 'Жилая',
+                                                                          'parent': None}})
+
+    def test_main_image_without_images(self):
+        response = self.client.post('/api/properties/filter/?fields=id,main_image', {}, format='json')
+        self.assertEqual(response.data['results'], [{'id': self.obj.id, 'main_image': '/media/properties/main.jpg'}])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/properties/', {'fields': 'id,secret', 'expand': 'owner'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'fields', 'expand'})
+
+    def test_default_representation_is_unchanged(self):
+        item = self.client.get('/api/properties/').data['results'][0]
+        self.assertEqual(item['category']['name'], 'Жилая')
+        self.assertNotIn('card_data', item)
+
+
+class GeoSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # Ala-Too square, ~1.1 km east of it, and Osh
+        self.center = make_property(title='Центр', latitude=42.8765, longitude=74.6036)
+        self.east = make_property(title='Восток', latitude=42.8765, longitude=74.6172)
+        self.osh = make_property(title='Ош', latitude=40.5283, longitude=72.7985)
+        self.nowhere = make_property(title='Без координат')
+
+    def test_geohash_is_kept_in_sync(self):
+        self.assertEqual(self.center.geohash, geo.encode(42.8765, 74.6036))
+        self.assertTrue(self.center.geohash.startswith('txt'))
+        self.assertEqual(self.nowhere.geohash, '')
+        self.center.latitude, self.center.longitude = 40.5283, 72.7985
+        self.center.save(update_fields=['latitude', 'longitude'])
+        self.center.refresh_from_db()
+        self.assertEqual(self.center.geohash, self.osh.geohash)
+        self.assertEqual(self.center.card_data['latitude'], 40.5283)
+
+    def test_cover_contains_every_point_in_box(self):
+        box = geo.box_around(42.8765, 74.6036, 3)
+        prefixes = geo.cover(*box)
+        self.assertLessEqual(len(prefixes), 24)
+        for lat in (box[0], 42.8765, box[2]):
+            for lng in (box[1], 74.6036, box[3]):
+                self.assertTrue(any(geo.encode(lat, lng).startswith(prefix) for prefix in prefixes))
+
+    def test_prefix_ranges_only_for_small_boxes(self):
+        small = str(Property.objects.filter(geo.geohash_filter(*geo.box_around(42.8765, 74.6036, 1))).query)
+        large = str(Property.objects.filter(geo.geohash_filter(*geo.box_around(42.8765, 74.6036, 50))).query)
+        self.assertIn('"geohash" >=', small)
+        self.assertNotIn('"geohash"', large.split('WHERE')[1])
+        self.assertIn('"latitude" BETWEEN', large)
+
+    def test_nearby_is_ordered_by_distance(self):
+        response = self.client.get('/api/properties/nearby/', {'lat': 42.8765, 'lng': 74.6060, 'radius': 3})
+        results = response.data['results']
+        self.assertEqual([item['id'] for item in results], [self.center.id, self.east.id])
+        self.assertAlmostEqual(results[0]['distance'], 0.197, places=2)
+        self.assertAlmostEqual(results[1]['distance'], 0.915, places=2)
+
+        response = self.client.get('/api/properties/nearby/', {'lat': 42.8765, 'lng': 74.6036, 'radius': 0.5})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.center.id])
+
+    def test_nearby_paginates_and_renders_cards(self):
+        response = self.client.get('/api/properties/nearby/', {'lat': 42.8765, 'lng': 74.6036, 'page_size': 1,
+                                                               'view': 'card'})
+        self.assertEqual(response.data['results'][0]['id'], self.center.id)
+        self.assertEqual(response.data['results'][0]['distance'], 0.0)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [self.east.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_in_bounds(self):
+        response = self.client.get('/api/properties/in-bounds/',
+                                   {'south': 40, 'west': 72, 'north': 43, 'east': 75, 'fields': 'id,title'})
+        # Newest first rather than by distance from the center
+        self.assertEqual([item['id'] for item in response.data['results']], [self.osh.id, self.east.id, self.center.id])
+        self.assertNotIn('distance', response.data['results'][0])
+
+        # Antimeridian-crossing box
+        response = self.client.get('/api/properties/in-bounds/', {'south': 40, 'west': 170, 'north': 43, 'east': -170})
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/properties/nearby/', {'lat': 'север', 'radius': 100})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'lat', 'lng', 'radius'})
+        response = self.client.get('/api/properties/in-bounds/', {'south': 43, 'west': 72, 'north': 40, 'east': 75})
+        self.assertEqual(response.status_code, 400)
+
+
+class PropertyClustersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        make_property(price=Decimal('40000'), latitude=42.87, longitude=74.59)
+        make_property(price=Decimal('90000'), latitude=42.89, longitude=74.61, property_type='house')
+        make_property(price=Decimal('60000'), latitude=42.88, longitude=74.60, is_active=False)
+        self.osh = make_property(price=Decimal('30000'), latitude=40.53, longitude=72.80)
+        make_property(price=Decimal('10000'))
+        self.country = {'south': 39, 'west': 69, 'north': 43.5, 'east': 81}
+
+    def test_clusters_per_cell(self):
+        response = self.client.get('/api/properties/clusters/', {'zoom': 6, **self.country})
+        data = response.data
+        self.assertEqual((data['precision'], data['total']), (3, 3))
+        clusters = {cell['count']: cell for cell in data['clusters']}
+        bishkek, osh = clusters[2], clusters[1]
+        self.assertEqual(bishkek['geohash'], 'txt')
+        self.assertEqual((bishkek['min_price'], bishkek['max_price']), (Decimal('40000'), Decimal('90000')))
+        self.assertEqual((bishkek['latitude'], bishkek['longitude']), (42.88, 74.6))
+        self.assertIsNone(bishkek['id'])
+        self.assertEqual(osh['id'], self.osh.id)
+
+    def test_zooming_in_splits_clusters(self):
+        response = self.client.get('/api/properties/clusters/', {
+            'zoom': 16, 'south': 42.86, 'west': 74.58, 'north': 42.90, 'east': 74.62,
+        })
+        self.assertEqual([cell['count'] for cell in response.data['clusters']], [1, 1])
+
+    def test_filters_and_tile_cache(self):
+        params = {'zoom': 6, 'property_type': 'apartment', **self.country}
+        self.assertEqual(self.client.get('/api/properties/clusters/', params).data['total'], 2)
+        with self.assertNumQueries(0):
+            self.client.get('/api/properties/clusters/', params)
+        make_property(latitude=42.875, longitude=74.595)
+        self.assertEqual(self.client.get('/api/properties/clusters/', params).data['total'], 3)
+
+    def test_invalid_requests(self):
+        response = self.client.get('/api/properties/clusters/', {'zoom': 30, 'south': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'zoom', 'south', 'west', 'north', 'east'})
+        response = self.client.get('/api/properties/clusters/', {'zoom': 18, **self.country})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_filter_values_are_rejected(self):
+        for name, value in (('min_price', 'x'), ('max_area', 'NaN'), ('rooms', '2.5'), ('bedrooms', 'два')):
+            with self.subTest(name=name):
+                response = self.client.get('/api/properties/clusters/', {'zoom': 6, name: value, **self.country})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(set(response.data), {name})
+        response = self.client.get('/api/properties/clusters/', {'zoom': 6, 'min_price': '0', **self.country})
+        self.assertEqual(response.data['total'], 3)
+
+
+class AdminStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', password='x', is_staff=True))
+        make_property(price=Decimal('40000'))
+        make_property(price=Decimal('120000'), property_type='house', is_featured=True)
+        make_property(price=Decimal('600000'), is_active=False)
+
+    def test_fresh_stats_in_fixed_number_of_queries(self):
+        # Counters, histogram with the table counts, per-day series, snapshot INSERT
+        with self.assertNumQueries(4):
+            data = self.client.get('/api/admin/stats/', {'fresh': 1}).data
+        self.assertEqual((data['total_properties'], data['active_properties'], data['featured_properties']),
+                         (3, 2, 1))
+        self.assertEqual((data['total_users'], data['total_banners'], data['total_activities']), (1, 0, 0))
+        self.assertEqual(data['total_value'], 760000.0)
+        self.assertEqual(data['properties_by_type'], [{'property_type': 'apartment', 'count': 2},
+                                                      {'property_type': 'house', 'count': 1}])
+        self.assertEqual([bucket['count'] for bucket in data['price_histogram']], [1, 0, 1, 0, 1])
+        self.assertEqual(len(data['new_properties_per_day']), 90)
+        self.assertEqual(data['new_properties_per_day'][-1], {'date': timezone.localdate().isoformat(),
+                                                              'count': 3, 'active': 2})
+
+    def test_reads_snapshot_until_stale(self):
+        first = self.client.get('/api/admin/stats/').data
+        make_property()
+        # Latest snapshot and the counters
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/admin/stats/').data
+        self.assertEqual(data['generated_at'], first['generated_at'])
+        self.assertEqual(data['total_properties'], 4)
+        self.assertEqual(data['new_properties_per_day'][-1]['count'], 3)
+        self.assertEqual(self.client.get('/api/admin/stats/', {'fresh': 1}).data['new_properties_per_day'][-1]['count'], 4)
+
+        StatsSnapshot.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        make_property()
+        self.assertEqual(self.client.get('/api/admin/stats/').data['new_properties_per_day'][-1]['count'], 5)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/admin/stats/').status_code, 401)
+
+
+class PropertyCounterTests(TestCase):
+    def totals(self):
+        return {segment_of(counter): (counter.count, counter.total_price) for counter in PropertyCounter.objects.all()
+                if counter.count}
+
+    def test_counters_follow_writes(self):
+        flat = make_property(price=Decimal('40000'))
+        make_property(price=Decimal('60000'))
+        self.assertEqual(self.totals(), {('apartment', True, False): (2, Decimal('100000'))})
+
+        flat.is_featured, flat.price = True, Decimal('45000')
+        flat.save()
+        flat.title = 'Без изменения счётчиков'
+        with CaptureQueriesContext(connection) as ctx:
+            flat.save(update_fields=['title'])
+        self.assertFalse([query for query in ctx.captured_queries if 'propertycounter' in query['sql']])
+        self.assertEqual(self.totals(), {('apartment', True, False): (1, Decimal('60000')),
+                                         ('apartment', True, True): (1, Decimal('45000'))})
+
+        Property.objects.filter(pk=flat.pk).delete()
+        self.assertEqual(self.totals(), {('apartment', True, False): (1, Decimal('60000'))})
+
+    def test_bulk_import_is_counted(self):
+        import_properties([{'title': f'Дом {i}', 'price': '1000', 'area': '50', 'address': 'Ош',
+                            'property_type': 'house'} for i in range(3)])
+        self.assertEqual(self.totals(), {('house', True, False): (3, Decimal('3000'))})
+
+    def test_reconcile_fixes_drift(self):
+        make_property(price=Decimal('40000'))
+        PropertyCounter.objects.update(count=7)
+        PropertyCounter.objects.create(property_type='land', is_active=False, is_featured=False, count=2)
+        out = StringIO()
+        call_command('reconcile_property_counters', stdout=out)
+        self.assertIn('Fixed 2 counters', out.getvalue())
+        self.assertEqual(self.totals(), {('apartment', True, False): (1, Decimal('40000'))})
+        self.assertEqual(reconcile(), [])
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_SAMPLE_RATE=1.0, METRICS_TOKEN='secret')
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.client = APIClient()
+        make_property()
+
+    def scrape(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/api/properties/')
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries, \d+ duplicate", render;dur=[\d.]+$')
+
+        body = self.scrape()
+        labels = 'route="api/properties/",method="GET",status="200"'
+        self.assertIn(f'http_requests_total{{{labels}}} 1', body)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1', body)
+        self.assertIn(f'http_response_bytes_total{{{labels}}} {len(response.content)}', body)
+        self.assertIn('# TYPE http_request_queries_total counter', body)
+
+    async def test_async_stack(self):
+        response = await self.async_client.get('/api/properties/')
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries')
+
+    def test_duplicate_queries_are_counted(self):
+        probe = QueryProbe()
+        probe.attach()
+        try:
+            for pk in (1, 2, 3):
+                list(Property.objects.filter(pk=pk))
+            Property.objects.count()
+        finally:
+            probe.detach()
+        self.assertEqual((probe.count, probe.duplicates), (4, 2))
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_only_counted(self):
+        response = self.client.get('/api/properties/')
+        self.assertNotIn('Server-Timing', response)
+        body = self.scrape()
+        self.assertIn('http_requests_total{route="api/properties/",method="GET",status="200"} 1', body)
+        self.assertNotIn('http_requests_sampled_total{route="api/properties/"', body)
+
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_need_a_token_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/properties/'))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.housing = Category.objects.create(name='Жильё')
+        self.flats = Category.objects.create(name='Квартиры', parent=self.housing)
+        self.studios = Category.objects.create(name='Студии', parent=self.flats)
+        self.land = Category.objects.create(name='Земля')
+        self.in_housing = make_property(category=self.housing)
+        self.in_studios = make_property(category=self.studios)
+        make_property(category=self.land)
+
+    def test_paths_follow_moves(self):
+        self.assertEqual(self.studios.path, f'{self.housing.id}/{self.flats.id}/{self.studios.id}/')
+        self.flats.parent = self.land
+        self.flats.save()
+        self.studios.refresh_from_db()
+        self.assertEqual(self.studios.path, f'{self.land.id}/{self.flats.id}/{self.studios.id}/')
+        self.assertEqual(list(Category.objects.subtree(self.housing.id)), [self.housing])
+
+    def test_include_descendants_is_one_query(self):
+        filterset = PropertyFilterSet({'category': self.housing.id, 'include_descendants': '1'},
+                                      queryset=Property.objects.order_by('id'))
+        with self.assertNumQueries(1):
+            self.assertEqual(list(filterset.qs), [self.in_housing, self.in_studios])
+
+        response = self.client.get('/api/properties/', {'category': self.housing.id})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.in_housing.id])
+        response = self.client.post('/api/properties/filter/', {'category': self.flats.id, 'include_descendants': True},
+                                    format='json')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.in_studios.id])
+
+    def test_invalid_category_is_rejected(self):
+        for url in ('/api/properties/filter/', '/api/properties/facets/'):
+            with self.subTest(url=url):
+                for body in ({'category': 'abc'}, {'category': 'abc', 'include_descendants': True}):
+                    response = self.client.post(url, body, format='json')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('category', response.data)
+
+    def test_tree_is_nested_and_cached(self):
+        response = self.client.get('/api/categories/tree/')
+        self.assertEqual(response.data, [
+            {'id': self.housing.id, 'name': 'Жильё', 'children': [
+                {'id': self.flats.id, 'name': 'Квартиры', 'children': [
+                    {'id': self.studios.id, 'name': 'Студии', 'children': []},
+                ]},
+            ]},
+            {'id': self.land.id, 'name': 'Земля', 'children': []},
+        ])
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/tree/')
+
+    def test_cannot_move_under_own_subtree(self):
+        response = self.client.patch(f'/api/categories/{self.housing.id}/', {'parent': self.studios.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AmenityMaskTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.parking, self.lift, self.pool = [Amenity.objects.create(name=name) for name in ('Парковка', 'Лифт', 'Бассейн')]
+        self.both = make_property()
+        self.both.amenities.set([self.parking, self.lift])
+        self.parking_only = make_property()
+        self.parking_only.amenities.add(self.parking)
+        self.none = make_property()
+
+    def mask_of(self, obj):
+        return Property.objects.values_list('amenity_mask', flat=True).get(pk=obj.pk)
+
+    def filtered(self, body):
+        response = self.client.post('/api/properties/filter/', body, format='json')
+        return sorted(item['id'] for item in response.data['results'])
+
+    def test_masks_follow_m2m_changes(self):
+        self.assertEqual((self.parking.bit, self.lift.bit, self.pool.bit), (0, 1, 2))
+        self.assertEqual(self.mask_of(self.both), 0b11)
+        self.pool.property_set.add(self.both, self.none)
+        self.assertEqual((self.mask_of(self.both), self.mask_of(self.none)), (0b111, 0b100))
+        self.parking.property_set.clear()
+        self.assertEqual((self.mask_of(self.both), self.mask_of(self.parking_only)), (0b110, 0))
+        self.lift.delete()
+        self.assertEqual(self.mask_of(self.both), 0b100)
+        self.assertEqual(Amenity.objects.create(name='Сауна').bit, 1)
+
+    def test_all_and_any_match_without_join(self):
+        ids = [self.parking.id, self.lift.id]
+        self.assertEqual(self.filtered({'amenities': ids}), [self.both.id])
+        self.assertEqual(self.filtered({'amenities': ids, 'amenities_match': 'any'}),
+                         sorted([self.both.id, self.parking_only.id]))
+        self.assertEqual(self.client.post('/api/properties/filter/', {'amenities_match': 'some'},
+                                          format='json').status_code, 400)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post('/api/properties/filter/', {'amenities': ids}, format='json')
+        filtering = [query['sql'] for query in ctx.captured_queries if '"amenity_mask" &' in query['sql']]
+        self.assertTrue(filtering)
+        self.assertFalse(any('triangle_property_amenities' in sql for sql in filtering))
+
+    def test_amenity_ids_are_coerced_or_rejected(self):
+        self.assertEqual(self.filtered({'amenities': [str(self.parking.id), self.lift.id]}), [self.both.id])
+        for url in ('/api/properties/filter/', '/api/properties/facets/'):
+            for amenities in (str(self.parking.id), self.parking.id, {'id': 1}, ['x'], [None], [True], [1.5]):
+                with self.subTest(url=url, amenities=amenities):
+                    response = self.client.post(url, {'amenities': amenities}, format='json')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(set(response.data), {'amenities'})
+
+    def test_writes_through_api_and_import_set_masks(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(admin)
+        response = self.client.patch(f'/api/properties/{self.none.id}/', {'amenities': [self.pool.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.mask_of(self.none), 0b100)
+
+        import_properties([{'title': 'Импорт', 'price': '1000', 'area': '50', 'address': 'Бишкек',
+                            'property_type': 'house', 'amenities': [self.lift.id, self.pool.id]}])
+        self.assertEqual(Property.objects.get(title='Импорт').amenity_mask, 0b110)
+
+    def test_amenities_past_the_mask_fall_back_to_the_join(self):
+        Amenity.objects.bulk_create([Amenity(name=f'Удобство {i}', bit=i) for i in range(3, 64)])
+        extra = Amenity.objects.create(name='Лишнее')
+        self.assertIsNone(extra.bit)
+        self.both.amenities.add(extra)
+        self.assertEqual(self.filtered({'amenities': [self.parking.id, extra.id]}), [self.both.id])
+        self.assertEqual(self.filtered({'amenities': [self.lift.id, extra.id], 'amenities_match': 'any'}),
+                         [self.both.id])
+
+
+class PricePerSquareMeterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.cheap = make_property(price=Decimal('50000'), area=Decimal('100'))
+        self.dear = make_property(price=Decimal('90000'), area=Decimal('45'))
+        self.middle = make_property(price=Decimal('100000'), area=Decimal('80'))
+
+    def test_kept_in_sync_on_save(self):
+        self.assertEqual(self.dear.price_per_m2, Decimal('2000.00'))
+        self.cheap.price = Decimal('60000')
+        self.cheap.save(update_fields=['price'])
+        self.cheap.refresh_from_db()
+        self.assertEqual(self.cheap.price_per_m2, Decimal('600.00'))
+        self.assertEqual(self.cheap.card_data['price_per_m2'], '600.00')
+
+    def test_ordering_and_range_filters(self):
+        response = self.client.get('/api/properties/', {'ordering': '-price_per_m2'})
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [self.dear.id, self.middle.id, self.cheap.id])
+
+        body = {'min_price_per_m2': 1000, 'max_price_per_m2': 1500}
+        response = self.client.post('/api/properties/filter/', body, format='json')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.middle.id])
+        response = self.client.get('/api/properties/search/', {'min_price_per_m2': 1250})
+        self.assertEqual(sorted(item['id'] for item in response.data['results']), [self.dear.id, self.middle.id])
+
+    def test_invalid_price_per_m2_is_rejected(self):
+        for name in ('min_price_per_m2', 'max_price_per_m2'):
+            with self.subTest(name=name):
+                response = self.client.post('/api/properties/filter/', {name: 'abc'}, format='json')
+                self.assertEqual((response.status_code, set(response.data)), (400, {name}))
+                response = self.client.get('/api/properties/search/', {name: 'abc'})
+                self.assertEqual((response.status_code, set(response.data)), (400, {name}))
+
+    async def test_invalid_price_per_m2_on_async_search(self):
+        request = AsyncRequestFactory().get('/api/properties/search/', {'max_price_per_m2': 'abc'})
+        response = await PropertySearchAsyncView.as_view()(request)
+        self.assertEqual((response.status_code, set(json.loads(response.content))), (400, {'max_price_per_m2'}))
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        clear_user_cache()
+        self.client = APIClient()
+        self.user = User.objects.create_user('asel', 'asel@example.com', 'password123')
+        Profile.objects.create(user=self.user, phone='+996555000000')
+        response = self.client.post('/api/auth/login/', {'login': 'asel', 'password': 'password123'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    def test_reads_after_the_first_run_no_queries(self):
+        self.assertEqual(self.client.get('/api/user/me/').data['email'], 'asel@example.com')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/user/me/').data['username'], 'asel')
+            data = self.client.get('/api/user/profile/').data
+        self.assertEqual((data['phone'], data['user']['email']), ('+996555000000', 'asel@example.com'))
+
+    def test_saves_invalidate_the_cached_user(self):
+        self.client.get('/api/user/profile/')
+        self.client.patch('/api/user/profile/', {'phone': '+996700111222'}, format='json')
+        self.assertEqual(self.client.get('/api/user/profile/').data['phone'], '+996700111222')
+        User.objects.filter(pk=self.user.pk).update(email='stale@example.com')
+        self.user.email = 'new@example.com'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/user/me/').data['email'], 'new@example.com')
+
+    def test_token_claims_and_old_tokens(self):
+        response = self.client.post('/api/auth/token/', {'username': 'asel', 'password': 'password123'},
+                                    format='json')
+        token = AccessToken(response.data['access'])
+        self.assertEqual(token['username'], 'asel')
+        self.assertNotIn('is_staff', token)
+        self.assertEqual(self.client.get('/api/admin/stats/').status_code, 403)
+
+        # Issued before the claims existed: authenticated from the database
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/user/me/').data['username'], 'asel')
+
+    def test_staff_rights_follow_the_user(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get('/api/admin/stats/').status_code, 200)
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/admin/stats/').status_code, 403)
+
+    def test_inactive_user_is_rejected_and_cannot_refresh(self):
+        client = APIClient()
+        tokens = client.post('/api/auth/token/', {'username': 'asel', 'password': 'password123'}, format='json').data
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 401)
+        response = client.post('/api/auth/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_rereads_the_claims(self):
+        client = APIClient()
+        tokens = client.post('/api/auth/token/', {'username': 'asel', 'password': 'password123'}, format='json').data
+        self.user.username = 'asel_k'
+        self.user.save()
+        response = client.post('/api/auth/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(AccessToken(response.data['access'])['username'], 'asel_k')
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_user_cache()
+        revocations.reset()
+        self.client = APIClient()
+        self.user = User.objects.create_user('asel', 'asel@example.com', 'password123')
+        response = self.client.post('/api/auth/login/', {'login': 'asel', 'password': 'password123'}, format='json')
+        self.refresh, self.access = response.data['refresh'], response.data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def test_logout_revokes_refresh_and_its_access_tokens(self):
+        other_access = self.client.post('/api/auth/token/refresh/', {'refresh': self.refresh},
+                                        format='json').data['access']
+        response = self.client.post('/api/auth/logout/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 205)
+
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {other_access}')
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 401)
+        self.client.credentials()
+        self.assertEqual(self.client.post('/api/auth/token/refresh/', {'refresh': self.refresh},
+                                          format='json').status_code, 401)
+        self.assertEqual(self.client.post('/api/auth/token/verify/', {'token': other_access},
+                                          format='json').status_code, 401)
+
+    def test_logout_rejects_bad_tokens(self):
+        self.assertEqual(self.client.post('/api/auth/logout/', {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/auth/logout/', {'refresh': 'nonsense'}, format='json').status_code, 400)
+        stranger = User.objects.create_user('bakyt', password='password123')
+        response = self.client.post('/api/auth/logout/', {'refresh': str(ClaimsRefreshToken.for_user(stranger))},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unrevoked_check_runs_no_query(self):
+        self.client.get('/api/user/me/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/user/me/').status_code, 200)
+
+    def test_revocations_from_other_workers_and_pruning(self):
+        self.client.get('/api/user/me/')
+        token = AccessToken(self.access)
+        RevokedToken.objects.create(jti=token['jti'], user=self.user, expires_at=timezone.now() + timedelta(hours=1))
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(seconds=1))
+        revocations.synced_at = 0.0
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 401)
+
+        call_command('prune_revoked_tokens', stdout=StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), [token['jti']])
+
+    def test_rows_committed_out_of_id_order_are_loaded(self):
+        expires_at = timezone.now() + timedelta(hours=1)
+        RevokedToken.objects.create(pk=1000, jti='newer', expires_at=expires_at)
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 200)
+        self.assertEqual(revocations.last_id, 1000)
+
+        # A transaction that got its id earlier but commits only now
+        RevokedToken.objects.create(pk=500, jti=AccessToken(self.access)['jti'], expires_at=expires_at)
+        revocations.synced_at = 0.0
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 401)
+
+        # Rows inside the window are only added to the filter once
+        count = revocations.bloom.count
+        revocations.synced_at = 0.0
+        revocations.sync()
+        self.assertEqual(revocations.bloom.count, count)
+
+    def test_revoke_all_tokens_of_a_user(self):
+        other_access = self.client.post('/api/auth/token/refresh/', {'refresh': self.refresh},
+                                        format='json').data['access']
+        revocations.revoke_user(self.user.pk)
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {other_access}')
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 401)
+        self.client.credentials()
+        self.assertEqual(self.client.post('/api/auth/token/refresh/', {'refresh': self.refresh},
+                                          format='json').status_code, 401)
+
+        # Tokens issued after the cutoff still work
+        RevokedToken.objects.filter(user=self.user).update(created_at=timezone.now() - timedelta(seconds=5))
+        revocations.reset()
+        later = ClaimsRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {later}')
+        self.assertEqual(self.client.get('/api/user/me/').status_code, 200)
+
+    def test_admin_action_revokes_for_every_worker(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        self.client.force_login(admin_user)
+        self.client.post('/admin/auth/user/', {'action': 'revoke_tokens', '_selected_action': [self.user.pk]})
+        # A worker that has never seen the revocation, loading it from the database
+        self.assertTrue(RevocationStore().is_revoked(AccessToken(self.access)))
+        self.assertFalse(RevocationStore().is_revoked(ClaimsRefreshToken.for_user(admin_user).access_token))
+
+
+class FastJSONRendererTests(TestCase):
+    payload = {
+        'price': Decimal('85000.50'),
+        'created_at': datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone.utc),
+        'updated_at': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'token': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'title': 'Квартира',
+    }
+
+    def render(self, backend):
+        with override_settings(FAST_JSON_BACKEND=backend):
+            return FastJSONRenderer().render(self.payload)
+
+    def test_backends_agree_with_drf_renderer(self):
+        expected = json.loads(JSONRenderer().render(self.payload))
+        for backend in ('orjson', 'stdlib'):
+            with self.subTest(backend=backend):
+                self.assertEqual(json.loads(self.render(backend)), expected)
+        self.assertIn('Квартира'.encode(), self.render('orjson'))
+
+    def test_api_uses_fast_renderer_and_parser(self):
+        client = APIClient()
+        body = json.dumps({'title': 'Дом', 'price': '10', 'area': '5', 'address': 'Ош', 'property_type': 'house'})
+        response = client.post('/api/properties/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.content)['price'], '10.00')
+
+        response = client.post('/api/properties/', b'{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
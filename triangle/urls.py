@@ -1,12 +1,18 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
 
+from .async_views import (
+    PropertyListView, PropertyDetailView, PropertyFeaturedView, PropertySearchAsyncView, BannerListView
+)
 from .views import (
     UserViewSet, ProfileViewSet, CategoryViewSet, AmenityViewSet,
     PropertyViewSet, ActivityViewSet, BannerViewSet,
     RegisterView, LoginView, LogoutView, ForgotPasswordView, ResetPasswordView, ChangePasswordView,
-    CurrentUserView, CurrentProfileView, AdminStatsView, PropertyFilterView, PropertySearchView
+    CurrentUserView, CurrentProfileView, AdminStatsView, PropertyFilterView, PropertySearchView,
+    PropertySuggestView, PropertyFacetsView, PropertyImportView, PropertyNearbyView, PropertyInBoundsView,
+    PropertyClustersView, UploadJobView
 )
 
 router = DefaultRouter()
@@ -33,5 +39,24 @@ urlpatterns = [
     path('admin/stats/', AdminStatsView.as_view(), name='admin_stats'),
     path('properties/filter/', PropertyFilterView.as_view(), name='property_filter'),
     path('properties/search/', PropertySearchView.as_view(), name='property_search'),
+    path('properties/facets/', PropertyFacetsView.as_view(), name='property_facets'),
+    path('properties/import/', PropertyImportView.as_view(), name='property_import'),
+    path('properties/suggest/', PropertySuggestView.as_view(), name='property_suggest'),
+    path('properties/nearby/', PropertyNearbyView.as_view(), name='property_nearby'),
+    path('properties/in-bounds/', PropertyInBoundsView.as_view(), name='property_in_bounds'),
+    path('properties/clusters/', PropertyClustersView.as_view(), name='property_clusters'),
+    path('upload-jobs/<int:pk>/', UploadJobView.as_view(), name='upload_job'),
     path('', include(router.urls)),
-]
\ No newline at end of file
+]
+
+# Async versions of the hot public reads, same URLs as the routes they shadow
+async_urlpatterns = [
+    path('properties/', PropertyListView.as_view()),
+    path('properties/featured/', PropertyFeaturedView.as_view()),
+    path('properties/search/', PropertySearchAsyncView.as_view()),
+    path('properties/<int:pk>/', PropertyDetailView.as_view()),
+    path('banners/', BannerListView.as_view()),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
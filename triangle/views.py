@@ -1,6 +1,7 @@
 from rest_framework import viewsets, filters, status, generics, permissions
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
@@ -8,19 +9,42 @@ from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
-
-from .models import Category, Amenity, Property, PropertyImage, Activity, Banner, Profile
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .amenity_masks import AMENITY_MATCH_MODES, amenity_filter
+from .authentication import ClaimsRefreshToken
+from .cache import CachedResponseMixin, get_generations, normalized_query, set_validators, validators_for
+from .clusters import MAX_ZOOM, cached_clusters
+from .facets import cached_facets
+from .geo import in_bounds, nearby
+from .filters import PropertyFilterSet
+from .importers import detect_format, import_properties, read_rows
+from .pagination import KeysetPagination, stream_json
+from .revocation import revocations
+from .search import PropertySearchFilter, get_search_backend
+from .stats import counter_stats, current_snapshot, take_snapshot
+from .suggest import get_prefix_index
+from .tasks import enqueue_upload, is_stale, resume_stale_jobs
+from .models import PATH_END, Category, Amenity, Property, Activity, Banner, Profile, UploadJob
 from .serializers import (
     UserSerializer, ProfileSerializer, CategorySerializer, AmenitySerializer,
-    PropertySerializer, PropertyCreateSerializer, PropertyImageSerializer,
+    PropertySerializer, PropertyCardSerializer, PropertyCreateSerializer,
     ActivitySerializer, BannerSerializer, RegisterSerializer, LoginSerializer,
-    ForgotPasswordSerializer, ResetPasswordSerializer
+    ForgotPasswordSerializer, ResetPasswordSerializer, UploadJobSerializer
 )
 
 import secrets
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from django.conf import settings
 from django.core.mail import send_mail
 from django.core.cache import cache
-from django.db.models import Q, Count, Sum
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.db.models import Q, Count, Max
 
 
 @extend_schema(tags=['Users'])
@@ -48,8 +72,7 @@ class RegisterView(APIView):
             user = serializer.save()
             Profile.objects.create(user=user)
 
-            from rest_framework_simplejwt.tokens import RefreshToken
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
 
             return Response({
                 'message': 'Пользователь успешно зарегистрирован',
@@ -71,8 +94,7 @@ class LoginView(APIView):
         if serializer.is_valid():
             user = serializer.validated_data['user']
 
-            from rest_framework_simplejwt.tokens import RefreshToken
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
 
             return Response({
                 'message': 'Вход выполнен успешно',
@@ -98,13 +120,19 @@ class LogoutView(APIView):
     )
     def post(self, request):
         try:
-            refresh_token = request.data["refresh"]
-            from rest_framework_simplejwt.tokens import RefreshToken
-            token = RefreshToken(refresh_token)
-            token.blacklist()
-            return Response(status=status.HTTP_205_RESET_CONTENT)
-        except:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+            token = ClaimsRefreshToken(request.data['refresh'])
+        except (KeyError, TypeError):
+            return Response({'error': 'Не передан refresh-токен'}, status=status.HTTP_400_BAD_REQUEST)
+        except TokenError:
+            return Response({'error': 'Недействительный токен'}, status=status.HTTP_400_BAD_REQUEST)
+        if token.get(jwt_settings.USER_ID_CLAIM) != request.user.pk:
+            return Response({'error': 'Токен принадлежит другому пользователю'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The access token of this request goes too, along with every other
+        # access token issued from the refresh token
+        tokens = [token] if request.auth is None else [token, request.auth]
+        revocations.revoke(*tokens, user_id=request.user.pk)
+        return Response(status=status.HTTP_205_RESET_CONTENT)
 
 
 @extend_schema(tags=['Authentication'])
@@ -192,7 +220,9 @@ class ChangePasswordView(APIView):
         new_password = request.data.get('new_password')
         confirm_password = request.data.get('confirm_password')
 
-        if not request.user.check_password(old_password):
+        # Written back in full, so start from the row rather than a cached copy
+        user = User.objects.get(pk=request.user.pk)
+        if not user.check_password(old_password):
             return Response({'error': 'Старый пароль неверен'}, status=status.HTTP_400_BAD_REQUEST)
 
         if new_password != confirm_password:
@@ -201,8 +231,8 @@ class ChangePasswordView(APIView):
         if len(new_password) < 8:
             return Response({'error': 'Пароль должен содержать минимум 8 символов'}, status=status.HTTP_400_BAD_REQUEST)
 
-        request.user.set_password(new_password)
-        request.user.save()
+        user.set_password(new_password)
+        user.save()
         return Response({'message': 'Пароль успешно изменен'})
 
 
@@ -222,10 +252,11 @@ class CurrentProfileView(APIView):
 
     @extend_schema(responses={200: ProfileSerializer})
     def get(self, request):
+        # Served from the cached user with its profile and no query
         try:
             profile = request.user.profile
         except Profile.DoesNotExist:
-            profile = Profile.objects.create(user=request.user)
+            profile = Profile.objects.create(user_id=request.user.pk)
 
         serializer = ProfileSerializer(profile)
         return Response(serializer.data)
@@ -233,9 +264,9 @@ class CurrentProfileView(APIView):
     @extend_schema(request=ProfileSerializer, responses={200: ProfileSerializer})
     def patch(self, request):
         try:
-            profile = request.user.profile
+            profile = Profile.objects.select_related('user').get(user_id=request.user.pk)
         except Profile.DoesNotExist:
-            profile = Profile.objects.create(user=request.user)
+            profile = Profile.objects.create(user_id=request.user.pk)
 
         serializer = ProfileSerializer(profile, data=request.data, partial=True)
         if serializer.is_valid():
@@ -252,10 +283,27 @@ class CurrentProfileView(APIView):
     partial_update=extend_schema(tags=['Categories']),
     destroy=extend_schema(tags=['Categories'])
 )
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
+    cache_generations = ('category',)
+
+    @extend_schema(tags=['Categories'], responses={200: OpenApiTypes.OBJECT})
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """The whole hierarchy nested under `children`, built from one query."""
+        def build():
+            nodes, roots = {}, []
+            categories = list(Category.objects.order_by('name', 'id').values('id', 'name', 'parent_id'))
+            for category in categories:
+                nodes[category['id']] = {'id': category['id'], 'name': category['name'], 'children': []}
+            for category in categories:
+                siblings = nodes[category['parent_id']]['children'] if category['parent_id'] else roots
+                siblings.append(nodes[category['id']])
+            return Response(roots)
+
+        return self.cached_response(request, build)
 
 
 @extend_schema_view(
@@ -266,35 +314,153 @@ class CategoryViewSet(viewsets.ModelViewSet):
     partial_update=extend_schema(tags=['Amenities']),
     destroy=extend_schema(tags=['Amenities'])
 )
-class AmenityViewSet(viewsets.ModelViewSet):
+class AmenityViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Amenity.objects.all()
     serializer_class = AmenitySerializer
     permission_classes = [permissions.AllowAny]
+    cache_generations = ('amenity',)
+
+
+CARD_VIEW_PARAMETER = OpenApiParameter(
+    name='view', description="'card' returns slim cards read from the denormalized card_data", type=str,
+    enum=['card'],
+)
+
+REPRESENTATION_PARAMETERS = [
+    OpenApiParameter(name='fields', description='Comma-separated fields to return, e.g. id,title,price', type=str),
+    OpenApiParameter(name='expand', description='Relations to nest (images, amenities, category); '
+                                                'with fields/expand set the others come back as ids', type=str),
+]
+
+
+class PropertyRepresentationMixin:
+    """
+    Shapes property responses from the query string: `?view=card` switches
+    to PropertyCardSerializer over card_data alone, `?fields=`/`?expand=`
+    trim PropertySerializer and the columns, joins and prefetches behind it.
+    """
+
+    def is_card_view(self):
+        request = getattr(self, 'request', None)
+        return request is not None and request.query_params.get('view') == 'card'
+
+    def get_representation(self):
+        """Parsed (fields, expand) sets, or None for the full representation."""
+        request = getattr(self, 'request', None)
+        if request is None:
+            return None
+        params = request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+
+        def parse(name):
+            if name not in params:
+                return None
+            return {part.strip() for part in params[name].split(',') if part.strip()}
+
+        fields, expand = parse('fields'), parse('expand') or set()
+        errors = {}
+        if fields is not None and fields - PropertySerializer.available_fields():
+            errors['fields'] = f'Неизвестные поля: {", ".join(sorted(fields - PropertySerializer.available_fields()))}'
+        if expand - set(PropertySerializer.EXPANDABLE):
+            errors['expand'] = f'Нельзя раскрыть: {", ".join(sorted(expand - set(PropertySerializer.EXPANDABLE)))}'
+        if errors:
+            raise ValidationError(errors)
+        return fields, expand
+
+    def get_representation_kwargs(self):
+        representation = self.get_representation()
+        if representation is None or self.get_serializer_class() is not PropertySerializer:
+            return {}
+        fields, expand = representation
+        return {'fields': fields, 'expand': expand}
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(self.get_representation_kwargs())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_listing_queryset(self):
+        # Cards are a single-table read: no category join, no image/amenity prefetches
+        if self.is_card_view():
+            return Property.objects.for_cards()
+        return Property.objects.for_listing(**self.get_representation_kwargs())
 
 
 @extend_schema_view(
-    list=extend_schema(tags=['Properties']),
+    list=extend_schema(tags=['Properties'], parameters=[CARD_VIEW_PARAMETER, *REPRESENTATION_PARAMETERS]),
     create=extend_schema(tags=['Properties']),
-    retrieve=extend_schema(tags=['Properties']),
+    retrieve=extend_schema(tags=['Properties'], parameters=REPRESENTATION_PARAMETERS),
     update=extend_schema(tags=['Properties']),
     partial_update=extend_schema(tags=['Properties']),
     destroy=extend_schema(tags=['Properties'])
 )
-class PropertyViewSet(viewsets.ModelViewSet):
-    queryset = Property.objects.filter(is_active=True)
+class PropertyViewSet(PropertyRepresentationMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = Property.objects.for_listing().filter(is_active=True)
     serializer_class = PropertySerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['property_type', 'rooms', 'bedrooms', 'garage', 'category', 'is_featured']
+    filter_backends = [DjangoFilterBackend, PropertySearchFilter, filters.OrderingFilter]
+    filterset_class = PropertyFilterSet
     search_fields = ['title', 'address', 'description']
-    ordering_fields = ['price', 'area', 'created_at']
+    ordering_fields = ['price', 'area', 'price_per_m2', 'created_at']
     ordering = ['-created_at']
     permission_classes = [permissions.AllowAny]
+    cache_generations = ('property', 'category', 'amenity')
+    cache_actions = ('featured',)
+
+    def is_card_view(self):
+        return self.action == 'list' and super().is_card_view()
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve', 'featured'):
+            return self.get_listing_queryset().filter(is_active=True)
+        return super().get_queryset()
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return PropertyCreateSerializer
+        if self.is_card_view():
+            return PropertyCardSerializer
         return PropertySerializer
 
+    def get_validators(self, updated_at, *parts, generations=('category', 'amenity')):
+        # Nested category/amenity data changes without touching Property.updated_at,
+        # so their cache generations take part in the validators too
+        return self.build_validators(updated_at, parts, get_generations(generations))
+
+    def build_validators(self, updated_at, parts, generations):
+        timestamps = [value / 1_000_000_000 for value in generations]
+        if updated_at is not None:
+            timestamps.append(updated_at.timestamp())
+        return validators_for((updated_at, *parts, *generations), max(timestamps))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        state = queryset.order_by().aggregate(last_updated=Max('updated_at'), count=Count('id'))
+        # A deletion doesn't move max(updated_at) but does bump the property generation
+        etag, last_modified = self.get_validators(
+            state['last_updated'], state['count'], request.build_absolute_uri(request.path),
+            normalized_query(request), generations=('property', 'category', 'amenity'),
+        )
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(super().list(request, *args, **kwargs), etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            updated_at = self.get_queryset().filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError, DjangoValidationError):
+            # A malformed pk is a 404, as in get_object_or_404()
+            raise Http404
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag, last_modified = self.get_validators(
+            updated_at, request.build_absolute_uri(request.path), normalized_query(request)
+        )
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
+
     @extend_schema(
         tags=['Properties'],
         request={
@@ -304,24 +470,33 @@ class PropertyViewSet(viewsets.ModelViewSet):
                     'images': {'type': 'array', 'items': {'type': 'string', 'format': 'binary'}}
                 }
             }
-        }
+        },
+        responses={202: OpenApiTypes.OBJECT}
     )
     @action(detail=True, methods=['post'], parser_classes=[MultiPartParser])
     def upload_images(self, request, pk=None):
         property_obj = self.get_object()
         images = request.FILES.getlist('images')
-
-        for image in images:
-            PropertyImage.objects.create(property=property_obj, image=image)
-
-        return Response({'status': 'Images uploaded'}, status=status.HTTP_201_CREATED)
-
-    @extend_schema(tags=['Properties'], responses={200: PropertySerializer(many=True)})
+        if not images:
+            return Response({'error': 'Не выбраны файлы'}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = enqueue_upload(property_obj, images)
+        return Response({
+            'job_id': job.pk,
+            'status': job.status,
+            'status_url': request.build_absolute_uri(reverse('upload_job', args=[job.pk])),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(tags=['Properties'], parameters=REPRESENTATION_PARAMETERS,
+                   responses={200: PropertySerializer(many=True)})
     @action(detail=False, methods=['get'])
     def featured(self, request):
-        featured_properties = Property.objects.filter(is_featured=True, is_active=True)
-        serializer = self.get_serializer(featured_properties, many=True)
-        return Response(serializer.data)
+        def build():
+            featured_properties = self.get_queryset().filter(is_featured=True)
+            serializer = self.get_serializer(featured_properties, many=True)
+            return Response(serializer.data)
+
+        return self.cached_response(request, build)
 
 
 @extend_schema_view(
@@ -332,11 +507,12 @@ class PropertyViewSet(viewsets.ModelViewSet):
     partial_update=extend_schema(tags=['Activities']),
     destroy=extend_schema(tags=['Activities'])
 )
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
     permission_classes = [permissions.AllowAny]
     ordering = ['-created_at']
+    cache_generations = ('activity',)
 
 
 @extend_schema_view(
@@ -347,99 +523,268 @@ class ActivityViewSet(viewsets.ModelViewSet):
     partial_update=extend_schema(tags=['Banners']),
     destroy=extend_schema(tags=['Banners'])
 )
-class BannerViewSet(viewsets.ModelViewSet):
+class BannerViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Banner.objects.filter(is_active=True)
     serializer_class = BannerSerializer
     permission_classes = [permissions.AllowAny]
+    cache_generations = ('banner',)
+
+
+@extend_schema(tags=['Properties'])
+class UploadJobView(generics.RetrieveAPIView):
+    queryset = UploadJob.objects.all()
+    serializer_class = UploadJobSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_object(self):
+        job = super().get_object()
+        if getattr(settings, 'UPLOAD_QUEUE_MODE', 'thread') == 'thread' and is_stale(job):
+            resume_stale_jobs()
+        return job
 
 
 @extend_schema(tags=['Admin'])
 class AdminStatsView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
-    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    @extend_schema(
+        parameters=[OpenApiParameter(name='fresh', description='Recompute instead of reading the snapshot',
+                                     type=bool)],
+        responses={200: OpenApiTypes.OBJECT}
+    )
     def get(self, request):
-        stats = {
-            'total_properties': Property.objects.count(),
-            'active_properties': Property.objects.filter(is_active=True).count(),
-            'featured_properties': Property.objects.filter(is_featured=True).count(),
-            'total_activities': Activity.objects.count(),
-            'total_banners': Banner.objects.count(),
-            'total_users': User.objects.count(),
-            'properties_by_type': list(Property.objects.values('property_type').annotate(count=Count('id'))),
-            'total_value': Property.objects.aggregate(total=Sum('price'))['total'] or 0,
+        if request.query_params.get('fresh') in ('1', 'true'):
+            snapshot = take_snapshot()
+            return Response({**snapshot.data, 'generated_at': snapshot.created_at})
+        snapshot = current_snapshot()
+        # Property totals are always live: the counters make them O(1)
+        return Response({**snapshot.data, **counter_stats(), 'generated_at': snapshot.created_at})
+
+
+LISTING_PARAMETERS = [
+    OpenApiParameter(name='cursor', description='Keyset pagination cursor', type=str),
+    OpenApiParameter(name='page_size', description='Page size (max 100)', type=int),
+    OpenApiParameter(name='stream', description='Stream the whole result as a JSON array', type=bool),
+    OpenApiParameter(name='chunk_size', description='Rows per chunk in stream mode', type=int),
+    CARD_VIEW_PARAMETER,
+    *REPRESENTATION_PARAMETERS,
+]
+
+
+class PropertyListingMixin(PropertyRepresentationMixin):
+    pagination_class = KeysetPagination
+    serializer_class = PropertySerializer
+    stream_chunk_size = 500
+    max_stream_chunk_size = 2000
+
+    def get_serializer_class(self):
+        if self.is_card_view():
+            return PropertyCardSerializer
+        return self.serializer_class
+
+    def wants_stream(self):
+        return self.request.query_params.get('stream') in ('1', 'true')
+
+    def listing_response(self, queryset):
+        if self.wants_stream():
+            try:
+                chunk_size = int(self.request.query_params.get('chunk_size', self.stream_chunk_size))
+            except ValueError:
+                chunk_size = self.stream_chunk_size
+            chunk_size = max(1, min(chunk_size, self.max_stream_chunk_size))
+            queryset = queryset.order_by(*self.paginator.get_ordering(self))
+            serializer_class = partial(self.get_serializer_class(), **self.get_representation_kwargs())
+            return stream_json(queryset, serializer_class, self.get_serializer_context(), chunk_size)
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+PROPERTY_FILTER_REQUEST = {
+    'application/json': {
+        'type': 'object',
+        'properties': {
+            'property_type': {'type': 'string',
+                              'enum': ['apartment', 'house', 'villa', 'commercial', 'land', 'office']},
+            'category': {'type': 'integer'},
+            'include_descendants': {'type': 'boolean'},
+            'min_price': {'type': 'number'},
+            'max_price': {'type': 'number'},
+            'min_area': {'type': 'number'},
+            'max_area': {'type': 'number'},
+            'min_price_per_m2': {'type': 'number'},
+            'max_price_per_m2': {'type': 'number'},
+            'rooms': {'type': 'integer'},
+            'bathrooms': {'type': 'integer'},
+            'bedrooms': {'type': 'integer'},
+            'amenities': {'type': 'array', 'items': {'type': 'integer'}},
+            'amenities_match': {'type': 'string', 'enum': list(AMENITY_MATCH_MODES), 'default': 'all',
+                                'description': 'Listings with all of the amenities, or with any of them'},
         }
-        return Response(stats)
+    }
+}
+
+
+def number_param(data, name, parse=Decimal):
+    """`data[name]` parsed with `parse`, or None when it's missing or empty."""
+    value = data.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = parse(str(value))
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValidationError({name: 'Ожидалось число'})
+    if isinstance(number, Decimal) and not number.is_finite():
+        raise ValidationError({name: 'Ожидалось число'})
+    return number
+
+
+def amenity_ids_param(data):
+    """The 'amenities' ids as ints; a scalar or anything but ids is rejected."""
+    values = data.getlist('amenities') if hasattr(data, 'getlist') else data.get('amenities')
+    if values in (None, ''):
+        return []
+    if not isinstance(values, (list, tuple)):
+        raise ValidationError({'amenities': 'Ожидался список id удобств'})
+    ids = []
+    for value in values:
+        try:
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                raise ValueError(value)
+            ids.append(int(value))
+        except ValueError:
+            raise ValidationError({'amenities': 'Ожидались id удобств'})
+    return ids
+
+
+def property_filters(data):
+    filters = Q(is_active=True)
+
+    property_type = data.get('property_type')
+    if property_type:
+        filters &= Q(property_type=property_type)
+
+    category = data.get('category')
+    if category:
+        try:
+            category = int(category)
+        except (TypeError, ValueError):
+            raise ValidationError({'category': 'Ожидался id категории'})
+        if data.get('include_descendants') in (True, '1', 'true'):
+            # Resolved to a literal path range: a plain range scan on the path index
+            path = Category.objects.filter(pk=category).values_list('path', flat=True).first()
+            filters &= Q(category__path__gte=path, category__path__lt=path + PATH_END) if path else Q(pk__in=[])
+        else:
+            filters &= Q(category_id=category)
+
+    min_price = number_param(data, 'min_price')
+    max_price = number_param(data, 'max_price')
+    if min_price is not None:
+        filters &= Q(price__gte=min_price)
+    if max_price is not None:
+        filters &= Q(price__lte=max_price)
+
+    min_area = number_param(data, 'min_area')
+    max_area = number_param(data, 'max_area')
+    if min_area is not None:
+        filters &= Q(area__gte=min_area)
+    if max_area is not None:
+        filters &= Q(area__lte=max_area)
+
+    min_price_per_m2 = number_param(data, 'min_price_per_m2')
+    max_price_per_m2 = number_param(data, 'max_price_per_m2')
+    if min_price_per_m2 is not None:
+        filters &= Q(price_per_m2__gte=min_price_per_m2)
+    if max_price_per_m2 is not None:
+        filters &= Q(price_per_m2__lte=max_price_per_m2)
+
+    rooms = number_param(data, 'rooms', int)
+    if rooms is not None:
+        filters &= Q(rooms=rooms)
+
+    bathrooms = number_param(data, 'bathrooms', int)
+    if bathrooms is not None:
+        filters &= Q(bathrooms=bathrooms)
+
+    bedrooms = number_param(data, 'bedrooms', int)
+    if bedrooms is not None:
+        filters &= Q(bedrooms=bedrooms)
+
+    amenities = amenity_ids_param(data)
+    match = data.get('amenities_match') or 'all'
+    if match not in AMENITY_MATCH_MODES:
+        raise ValidationError({'amenities_match': 'Ожидалось all или any'})
+    if amenities:
+        filters &= amenity_filter(amenities, match)
+
+    return filters
 
 
 @extend_schema(tags=['Properties'])
-class PropertyFilterView(APIView):
+class PropertyFilterView(PropertyListingMixin, generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
 
     @extend_schema(
-        request={
-            'application/json': {
-                'type': 'object',
-                'properties': {
-                    'property_type': {'type': 'string',
-                                      'enum': ['apartment', 'house', 'villa', 'commercial', 'land', 'office']},
-                    'min_price': {'type': 'number'},
-                    'max_price': {'type': 'number'},
-                    'min_area': {'type': 'number'},
-                    'max_area': {'type': 'number'},
-                    'rooms': {'type': 'integer'},
-                    'bathrooms': {'type': 'integer'},
-                    'bedrooms': {'type': 'integer'},
-                    'amenities': {'type': 'array', 'items': {'type': 'integer'}}
-                }
-            }
-        },
+        request=PROPERTY_FILTER_REQUEST,
+        parameters=LISTING_PARAMETERS,
         responses={200: PropertySerializer(many=True)}
     )
     def post(self, request):
-        filters = Q(is_active=True)
+        properties = self.get_listing_queryset().filter(property_filters(request.data))
+        return self.listing_response(properties)
 
-        property_type = request.data.get('property_type')
-        if property_type:
-            filters &= Q(property_type=property_type)
 
-        min_price = request.data.get('min_price')
-        max_price = request.data.get('max_price')
-        if min_price:
-            filters &= Q(price__gte=min_price)
-        if max_price:
-            filters &= Q(price__lte=max_price)
+@extend_schema(tags=['Properties'])
+class PropertyFacetsView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    @extend_schema(request=PROPERTY_FILTER_REQUEST, responses={200: OpenApiTypes.OBJECT})
+    def post(self, request):
+        return Response(cached_facets(property_filters(request.data)))
 
-        min_area = request.data.get('min_area')
-        max_area = request.data.get('max_area')
-        if min_area:
-            filters &= Q(area__gte=min_area)
-        if max_area:
-            filters &= Q(area__lte=max_area)
 
-        rooms = request.data.get('rooms')
-        if rooms:
-            filters &= Q(rooms=rooms)
+@extend_schema(tags=['Properties'])
+class PropertyImportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+    default_batch_size = 1000
+    max_batch_size = 5000
 
-        bathrooms = request.data.get('bathrooms')
-        if bathrooms:
-            filters &= Q(bathrooms=bathrooms)
+    @extend_schema(
+        request={
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {
+                    'file': {'type': 'string', 'format': 'binary'},
+                    'format': {'type': 'string', 'enum': ['csv', 'json']},
+                    'batch_size': {'type': 'integer'},
+                }
+            }
+        },
+        responses={200: OpenApiTypes.OBJECT}
+    )
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'Не выбран файл'}, status=status.HTTP_400_BAD_REQUEST)
 
-        bedrooms = request.data.get('bedrooms')
-        if bedrooms:
-            filters &= Q(bedrooms=bedrooms)
+        fmt = request.data.get('format') or detect_format(upload.name)
+        try:
+            batch_size = max(1, min(int(request.data.get('batch_size', self.default_batch_size)), self.max_batch_size))
+        except ValueError:
+            batch_size = self.default_batch_size
 
-        amenities = request.data.get('amenities', [])
-        if amenities:
-            filters &= Q(amenities__id__in=amenities)
+        try:
+            rows = read_rows(upload, fmt)
+        except (ValueError, UnicodeDecodeError) as exc:
+            return Response({'error': f'Не удалось прочитать файл: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        properties = Property.objects.filter(filters).distinct()
-        serializer = PropertySerializer(properties, many=True)
-        return Response(serializer.data)
+        return Response(import_properties(rows, batch_size=batch_size))
 
 
 @extend_schema(tags=['Properties'])
-class PropertySearchView(APIView):
+class PropertySearchView(PropertyListingMixin, generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
 
     @extend_schema(
@@ -448,26 +793,198 @@ class PropertySearchView(APIView):
             OpenApiParameter(name='property_type', description='Type filter', type=str),
             OpenApiParameter(name='min_price', description='Min price', type=int),
             OpenApiParameter(name='max_price', description='Max price', type=int),
+            OpenApiParameter(name='min_price_per_m2', description='Min price per m²', type=float),
+            OpenApiParameter(name='max_price_per_m2', description='Max price per m²', type=float),
+            *LISTING_PARAMETERS,
         ]
     )
     def get(self, request):
-        filters = Q(is_active=True)
+        return self.listing_response(self.search_queryset(request))
 
-        query = request.GET.get('q', '')
-        if query:
-            filters &= Q(title__icontains=query) | Q(description__icontains=query) | Q(address__icontains=query)
+    def search_queryset(self, request):
+        filters = Q(is_active=True)
 
         property_type = request.GET.get('property_type')
         if property_type:
             filters &= Q(property_type=property_type)
 
-        min_price = request.GET.get('min_price')
-        max_price = request.GET.get('max_price')
-        if min_price:
+        min_price = number_param(request.GET, 'min_price')
+        max_price = number_param(request.GET, 'max_price')
+        if min_price is not None:
             filters &= Q(price__gte=min_price)
-        if max_price:
+        if max_price is not None:
             filters &= Q(price__lte=max_price)
 
-        properties = Property.objects.filter(filters).distinct()
-        serializer = PropertySerializer(properties, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        min_price_per_m2 = number_param(request.GET, 'min_price_per_m2')
+        max_price_per_m2 = number_param(request.GET, 'max_price_per_m2')
+        if min_price_per_m2 is not None:
+            filters &= Q(price_per_m2__gte=min_price_per_m2)
+        if max_price_per_m2 is not None:
+            filters &= Q(price_per_m2__lte=max_price_per_m2)
+
+        properties = self.get_listing_queryset().filter(filters)
+
+        query = request.GET.get('q', '').strip()
+        if query:
+            properties = get_search_backend().search(properties, query)
+            self.keyset_ordering = ('-search_rank', '-id')
+        return properties
+
+
+def coordinate_params(request, bounds):
+    """
+    Read float query params, `bounds` mapping each name to (min, max,
+    default); a default of None makes the param required.
+    """
+    values, errors = {}, {}
+    for name, (low, high, default) in bounds.items():
+        raw = request.query_params.get(name)
+        if raw in (None, ''):
+            if default is None:
+                errors[name] = 'Обязательный параметр'
+            values[name] = default
+            continue
+        try:
+            value = float(raw)
+        except ValueError:
+            errors[name] = 'Ожидалось число'
+            continue
+        if not low <= value <= high:
+            errors[name] = f'Допустимы значения от {low} до {high}'
+        values[name] = value
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+class GeoListingMixin(PropertyListingMixin):
+    """Property listings with a `distance` annotation, nearest first by default."""
+    permission_classes = [permissions.AllowAny]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PropertyFilterSet
+    keyset_ordering = ('distance', 'id')
+
+    def get_queryset(self):
+        return self.get_listing_queryset().filter(is_active=True)
+
+    def get(self, request):
+        return self.listing_response(self.filter_queryset(self.geo_queryset(self.get_queryset())))
+
+
+@extend_schema(tags=['Properties'])
+class PropertyNearbyView(GeoListingMixin, generics.GenericAPIView):
+    default_radius = 5.0
+    max_radius = 50.0
+
+    @extend_schema(parameters=[
+        OpenApiParameter(name='lat', description='Latitude', type=float, required=True),
+        OpenApiParameter(name='lng', description='Longitude', type=float, required=True),
+        OpenApiParameter(name='radius', description='Radius in km (default 5, max 50)', type=float),
+        *LISTING_PARAMETERS,
+    ])
+    def get(self, request):
+        return super().get(request)
+
+    def geo_queryset(self, queryset):
+        params = coordinate_params(self.request, {
+            'lat': (-90, 90, None),
+            'lng': (-180, 180, None),
+            'radius': (0, self.max_radius, self.default_radius),
+        })
+        return nearby(queryset, params['lat'], params['lng'], params['radius'])
+
+
+@extend_schema(tags=['Properties'])
+class PropertyInBoundsView(GeoListingMixin, generics.GenericAPIView):
+    # Newest first, as everywhere else: the viewport has no better center to
+    # rank by, and sorting every match in it by distance costs a full sort
+    keyset_ordering = ('-created_at', '-id')
+
+    @extend_schema(parameters=[
+        OpenApiParameter(name='south', description='Southern latitude', type=float, required=True),
+        OpenApiParameter(name='west', description='Western longitude', type=float, required=True),
+        OpenApiParameter(name='north', description='Northern latitude', type=float, required=True),
+        OpenApiParameter(name='east', description='Eastern longitude; less than west crosses the antimeridian',
+                         type=float, required=True),
+        *LISTING_PARAMETERS,
+    ])
+    def get(self, request):
+        return super().get(request)
+
+    def geo_queryset(self, queryset):
+        params = coordinate_params(self.request, {
+            'south': (-90, 90, None),
+            'west': (-180, 180, None),
+            'north': (-90, 90, None),
+            'east': (-180, 180, None),
+        })
+        if params['south'] > params['north']:
+            raise ValidationError({'south': 'Южная граница должна быть не больше северной'})
+        return in_bounds(queryset, params['south'], params['west'], params['north'], params['east'])
+
+
+@extend_schema(tags=['Properties'])
+class PropertyClustersView(APIView):
+    permission_classes = [permissions.AllowAny]
+    filter_params = ('property_type', 'category', 'include_descendants', 'min_price', 'max_price', 'min_area',
+                     'max_area', 'min_price_per_m2', 'max_price_per_m2', 'rooms', 'bathrooms', 'bedrooms',
+                     'amenities_match')
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='zoom', description=f'Map zoom level (0-{MAX_ZOOM})', type=int, required=True),
+            OpenApiParameter(name='south', description='Southern latitude', type=float, required=True),
+            OpenApiParameter(name='west', description='Western longitude', type=float, required=True),
+            OpenApiParameter(name='north', description='Northern latitude', type=float, required=True),
+            OpenApiParameter(name='east', description='Eastern longitude', type=float, required=True),
+            *[OpenApiParameter(name=name, type=str) for name in filter_params],
+            OpenApiParameter(name='amenities', description='Amenity id, repeatable', type=int, many=True),
+        ],
+        responses={200: OpenApiTypes.OBJECT}
+    )
+    def get(self, request):
+        params = coordinate_params(request, {
+            'zoom': (0, MAX_ZOOM, None),
+            'south': (-90, 90, None),
+            'west': (-180, 180, None),
+            'north': (-90, 90, None),
+            'east': (-180, 180, None),
+        })
+        if params['south'] > params['north']:
+            raise ValidationError({'south': 'Южная граница должна быть не больше северной'})
+
+        data = {name: request.query_params.get(name) for name in self.filter_params}
+        data['amenities'] = amenity_ids_param(request.query_params)
+
+        try:
+            clusters = cached_clusters(property_filters(data), int(params['zoom']), params['south'],
+                                       params['west'], params['north'], params['east'])
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(clusters)
+
+
+@extend_schema(tags=['Properties'])
+class PropertySuggestView(APIView):
+    permission_classes = [permissions.AllowAny]
+    default_limit = 10
+    max_limit = 20
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='q', description='Typed prefix', type=str),
+            OpenApiParameter(name='limit', description='Max suggestions (max 20)', type=int),
+        ],
+        responses={200: OpenApiTypes.OBJECT}
+    )
+    def get(self, request):
+        query = request.GET.get('q', '')
+        try:
+            limit = max(1, min(int(request.GET.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            limit = self.default_limit
+
+        return Response({
+            'query': query,
+            'suggestions': get_prefix_index().suggest(query, limit),
+        })